@@ -1,148 +1,211 @@
 # Define constants
-from compile_python_to_jsbsim import Functions, compile_xml, print_xml, Wing_Panel, Fuselage, ROLL
+import sys
+from compile_python_to_jsbsim import Aircraft, Functions, Wing_Panel, Wing, Fuselage, m2ft
 
-functions = Functions()
-# croot = 0.52
-# ctip = 0.2
-# root centroid = y: 0.75, x: -0.26 (M)
-# tip centroid = y: 1.426, x: -0.19 (M)
-# divide x-values by 2 to get the quarter chord location
-# working to an AERORP at the CG to get the rotation arms correct
-# CG located at 0.36 * 0.4287
-cg_loc = -0.36 * 0.4287 # from LE
-lw0 = Wing_Panel(name = "lw0", 
-                unit = "M",
-                x = -0.13 - cg_loc,
-                y = -0.75,
-                z = 0,
-                u_z = 0, v_z = 0, w_z = 1,
-                u_x = 1, v_x = 0, w_x = 0,
-                a = 5.163,
-                clmax = 1.1,
-                k = 0.0464,
-                cd0 = 0.0118,
-                S = 0.52 * 0.75,
-                f_name = None,
-                tau_f = 0.0,
-                propwash=None,
-                downwash=None)
-rw0 = Wing_Panel(name = "rw0",
-                unit = "M",
-                x = -0.13 - cg_loc,
-                y = 0.75,
-                z = 0,
-                u_z = 0, v_z = 0, w_z = 1,
-                u_x = 1, v_x = 0, w_x = 0,
-                a = 5.163,
-                clmax = 1.1,
-                k = 0.0464,
-                cd0 = 0.0118,
-                S = 0.52 * 0.75,
-                f_name = None,
-                tau_f = 0.0,
-                propwash = None,
-                downwash = None)
-lw1 = Wing_Panel(name = "lw1", 
-                unit = "M",
-                x = -0.19/2 - cg_loc,
-                y = -1.426,
-                z = 0,
-                u_z = 0, v_z = 0, w_z = 1,
-                u_x = 1, v_x = 0, w_x = 0,
-                a = 5.163,
-                clmax = 1.1,
-                k = 0.0464,
-                cd0 = 0.0118,
-                S = 0.5 * (0.2 + 0.52),
-                f_name = "left-aileron",
-                tau_f = 0.7,
-                propwash=None,
-                downwash=None)
-rw1 = Wing_Panel(name = "rw1",
-                unit = "M",
-                x = -0.13 - cg_loc,
-                y = 1.426,
-                z = 0,
-                u_z = 0, v_z = 0, w_z = 1,
-                u_x = 1, v_x = 0, w_x = 0,
-                a = 5.163,
-                clmax = 1.1,
-                k = 0.0464,
-                cd0 = 0.0118,
-                S = 0.5 * (0.2 + 0.52),
-                f_name = "right-aileron",
-                tau_f = 0.7,
-                propwash = None,
-                downwash = None)
+MAC = 0.4287 # M
 
-# ht at 3.1 mac from LE
-ht = Wing_Panel(name = "ht",
-                unit = "M",
-                x = -3.1 * 0.4287 - cg_loc,
-                y = 0.0,
-                z = 0.0,
-                u_z = 0, v_z = 0, w_z = 1,
-                u_x = 1, v_x = 0, w_x = 0,
-                a = 4.88,
-                clmax = 1.0,
-                k = 0.0513,
-                cd0 = 0.0136,
-                S = 0.26,
-                f_name = "elevator",
-                tau_f = 0.5,
-                propwash = 0.0,
-                downwash = 0.8)
-# revised rudder dimensions
-vt = Wing_Panel(name = "vt",
-                unit = "M",
-                x = -3.1 * 0.4287 - cg_loc,
-                y = 0.0, 
-                z = -102e-3,
-                u_z = 0, v_z = 1, w_z = 0,
-                u_x = 1, v_x = 0, w_x = 0,
-                a = 4.88,
-                clmax = 1.0,
-                k = 0.0885,
-                cd0 = 0.0136,
-                S = 95068e-6,
-                f_name = "rudder",
-                tau_f = 0.7,
-                propwash = 0.0,
-                downwash = None)
+def build(cg_loc: float = -0.36 * MAC, tail_volume: float | None = None,
+          strips: int = 0, **overrides: dict) -> Aircraft:
+    """The EvenFlow aerodynamic model.
 
-fus = Fuselage(
-    unit = "FT",
-    x = 0.0, y = 0.0, z = 0.0,
-    X_uu = 0.575, Y_vv = 2, Z_ww = 2,
-    propwash = 0.0,
-)
+    cg_loc: CG position from the wing LE (M).
+    tail_volume: horizontal tail volume coefficient; sizes the tail area.
+    strips: if nonzero, the main wing is built from its planform as Wing
+    elements (lwi, lwo, rwi, rwo) of this many strips each, instead of the
+    four panels.
+    overrides: constructor arguments by element name, e.g. ht={"S": 0.3},
+    fus={"propwash": 0.5}. They take precedence over tail_volume."""
+    def panel(**kwargs) -> Wing_Panel:
+        kwargs.update(overrides.get(kwargs["name"], {}))
+        return Wing_Panel(**kwargs)
 
-# induced velocity of the wing at the wing
-# used for downwash calculations
-# stevens 8.5-15
-functions["aero/velocities/wing-zi-fps"] = f"""
-(* (max 0 velocities/u-aero-fps)
-   0.5
-   (+ aero/coefficients/CL_lw0
-      aero/coefficients/CL_rw0
-      aero/coefficients/CL_lw1
-      aero/coefficients/CL_rw1)
-   0.0464)
-"""
+    def wing(**kwargs) -> Wing:
+        kwargs.update(overrides.get(kwargs["name"], {}))
+        return Wing(**kwargs)
 
-# Effect of sideslip on roll moment
+    functions = Functions()
+    # croot = 0.52
+    # ctip = 0.2
+    # root centroid = y: 0.75, x: -0.26 (M)
+    # tip centroid = y: 1.426, x: -0.19 (M)
+    # divide x-values by 2 to get the quarter chord location
+    # working to an AERORP at the CG to get the rotation arms correct
+    # CG located at 0.36 * 0.4287
+    lw0 = panel(name = "lw0", 
+                    unit = "M",
+                    x = -0.13 - cg_loc,
+                    y = -0.75,
+                    z = 0,
+                    u_z = 0, v_z = 0, w_z = 1,
+                    u_x = 1, v_x = 0, w_x = 0,
+                    a = 5.163,
+                    clmax = 1.1,
+                    k = 0.0464,
+                    cd0 = 0.0118,
+                    S = 0.52 * 0.75,
+                    f_name = None,
+                    tau_f = 0.0,
+                    propwash=None,
+                    downwash=None)
+    rw0 = panel(name = "rw0",
+                    unit = "M",
+                    x = -0.13 - cg_loc,
+                    y = 0.75,
+                    z = 0,
+                    u_z = 0, v_z = 0, w_z = 1,
+                    u_x = 1, v_x = 0, w_x = 0,
+                    a = 5.163,
+                    clmax = 1.1,
+                    k = 0.0464,
+                    cd0 = 0.0118,
+                    S = 0.52 * 0.75,
+                    f_name = None,
+                    tau_f = 0.0,
+                    propwash = None,
+                    downwash = None)
+    lw1 = panel(name = "lw1", 
+                    unit = "M",
+                    x = -0.19/2 - cg_loc,
+                    y = -1.426,
+                    z = 0,
+                    u_z = 0, v_z = 0, w_z = 1,
+                    u_x = 1, v_x = 0, w_x = 0,
+                    a = 5.163,
+                    clmax = 1.1,
+                    k = 0.0464,
+                    cd0 = 0.0118,
+                    S = 0.5 * (0.2 + 0.52),
+                    f_name = "left-aileron",
+                    tau_f = 0.7,
+                    propwash=None,
+                    downwash=None)
+    rw1 = panel(name = "rw1",
+                    unit = "M",
+                    x = -0.19/2 - cg_loc,
+                    y = 1.426,
+                    z = 0,
+                    u_z = 0, v_z = 0, w_z = 1,
+                    u_x = 1, v_x = 0, w_x = 0,
+                    a = 5.163,
+                    clmax = 1.1,
+                    k = 0.0464,
+                    cd0 = 0.0118,
+                    S = 0.5 * (0.2 + 0.52),
+                    f_name = "right-aileron",
+                    tau_f = 0.7,
+                    propwash = None,
+                    downwash = None)
 
-# ROLL["aero/moments/L_beta-lbft"] = f"""
+    wings = [lw0, rw0, lw1, rw1]
+    main = [lw0, lw1, rw0, rw1]
+    if strips:
+        # planform: 0.52 M chord to 0.75 M out, tapering to 0.2 M at the 1.75 M tip,
+        # straight leading edge; ailerons over the outer section
+        sections = []
+        for side in ("left", "right"):
+            l = side[0]
+            sections.append(wing(name = f"{l}wi", unit = "M", side = side, strips = strips,
+                                 x = -cg_loc, y = 0.0, z = 0.0,
+                                 root_chord = 0.52, tip_chord = 0.52, span = 0.75,
+                                 a = 5.163, clmax = 1.1, k = 0.0464, cd0 = 0.0118))
+            sections.append(wing(name = f"{l}wo", unit = "M", side = side, strips = strips,
+                                 x = -cg_loc, y = (0.75 if side == "right" else -0.75), z = 0.0,
+                                 root_chord = 0.52, tip_chord = 0.2, span = 1.0,
+                                 a = 5.163, clmax = 1.1, k = 0.0464, cd0 = 0.0118,
+                                 controls = {f"{side}-aileron": (0.0, 1.0, 0.7)}))
+        wings = main = sections
 
-# """
+    # ht at 3.1 mac from LE
+    ht_x = -3.1 * MAC - cg_loc
+    ht_S = 0.26
+    if tail_volume is not None:
+        S_w = sum(w.S for w in wings)
+        x_w = sum(w.S * w.x for w in wings) / S_w
+        arm = x_w - overrides.get("ht", {}).get("x", ht_x) * m2ft
+        ht_S = tail_volume * S_w * MAC * m2ft / arm / m2ft**2
+    ht = panel(name = "ht",
+                    unit = "M",
+                    x = ht_x,
+                    y = 0.0,
+                    z = 0.0,
+                    u_z = 0, v_z = 0, w_z = 1,
+                    u_x = 1, v_x = 0, w_x = 0,
+                    a = 4.88,
+                    clmax = 1.0,
+                    k = 0.0513,
+                    cd0 = 0.0136,
+                    S = ht_S,
+                    f_name = "elevator",
+                    tau_f = 0.5,
+                    propwash = 0.0,
+                    downwash = 0.8)
+    # revised rudder dimensions
+    vt = panel(name = "vt",
+                    unit = "M",
+                    x = -3.1 * MAC - cg_loc,
+                    y = 0.0, 
+                    z = -102e-3,
+                    u_z = 0, v_z = 1, w_z = 0,
+                    u_x = 1, v_x = 0, w_x = 0,
+                    a = 4.88,
+                    clmax = 1.0,
+                    k = 0.0885,
+                    cd0 = 0.0136,
+                    S = 95068e-6,
+                    f_name = "rudder",
+                    tau_f = 0.7,
+                    propwash = 0.0,
+                    downwash = None)
+
+    fus = Fuselage(**{
+        "unit": "FT",
+        "x": 0.0, "y": 0.0, "z": 0.0,
+        "X_uu": 0.575, "Y_vv": 2, "Z_ww": 2,
+        "propwash": 0.0,
+        **overrides.get("fus", {}),
+    })
+
+    # induced velocity of the wing at the wing
+    # used for downwash calculations
+    # stevens 8.5-15
+    CL = "\n          ".join(f"aero/coefficients/CL_{w.name}" for w in wings)
+    functions["aero/velocities/wing-zi-fps"] = f"""
+    (* (max 0 velocities/u-aero-fps)
+       0.5
+       (+ {CL})
+       0.0464)
+    """
+
+    # Effect of sideslip on roll moment
+
+    # aircraft["ROLL"]["aero/moments/L_beta-lbft"] = f"""
+
+    # """
+
+    return Aircraft(functions,
+                    *main,
+                    ht,
+                    vt,
+                    fus)
 
 if __name__ == "__main__":
-    elements = [functions, 
-                lw0, lw1, 
-                rw0, rw1,
-                ht, 
-                vt, 
-                fus,
-                ]
-    xml = compile_xml(elements)
-    print(print_xml(xml))
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Write the EvenFlow aerodynamics XML to stdout.")
+    parser.add_argument("--fold", action="store_true",
+                        help="fold constants and drop unused functions")
+    parser.add_argument("--cse", action="store_true",
+                        help="share repeated subexpressions between functions")
+    parser.add_argument("--derivatives", "--derivative", action="store_true",
+                        help="add analytic stability and control derivatives")
+    parser.add_argument("--strips", type=int, default=0, metavar="N",
+                        help="build the main wing from N strips per section")
+    parser.add_argument("--compact", action="store_true",
+                        help="write the XML without indentation")
+    args = parser.parse_args()
+    if args.strips < 0:
+        parser.error("--strips must not be negative")
+    build(strips=args.strips).write(sys.stdout,
+                                    pretty=not args.compact,
+                                    cse=args.cse,
+                                    fold=args.fold,
+                                    derivatives=["all"] if args.derivatives else ())
@@ -29,6 +29,7 @@ import math
 import pandas as pd
 import seaborn as sns
 import numpy as np
+from trim_cache import TrimCache
 
 # Global variables that must be modified to match your particular need
 # The aircraft name
@@ -88,9 +89,9 @@ fdm.run_ic()
 print("throttle", fdm["fcs/throttle-cmd-norm"])
 
 jsbsim.FGJSBBase().debug_lvl = 1
-# Trim
+# Trim, reusing the stored solution if this model and IC have been trimmed before
 try:
-    fdm.do_trim(1)
+    TrimCache().do_trim(fdm, 1)
 
 except jsbsim.TrimFailureError:
     print("Trim failed, continuing rudder kick in an untrimmed state.")
@@ -119,37 +120,27 @@ plt.show()
 # #     fdm.run()
 # #     fdm.hold()
 # #     time.sleep(0.1)
-# # Recorded data
-# results = dict(
-#     times=[],
-#     betas=[],
-#     bankAngle=[],
-#     ailerons=[],
-#     rudder=[],
-#     alphas=[],
-#     hsl=[],
-#     thrust=[],
-#     x=[],
-#     y=[],
-#     vc=[],
+# # Recorded data, column name to property
+# from recorder import Recorder
+
+# recorder = Recorder(
+#     fdm,
+#     dict(
+#         betas="aero/beta-deg",
+#         bankAngle="attitude/phi-deg",
+#         ailerons="fcs/aileron-cmd-norm",
+#         rudder="fcs/rudder-cmd-norm",
+#         alphas="aero/alpha-deg",
+#         hsl="position/h-sl-ft",
+#         thrust="propulsion/engine[0]/thrust-lbs",
+#         x="position/distance-from-start-lat-mt",
+#         y="position/distance-from-start-lon-mt",
+#         vc="velocities/vc-kts",
+#     ),
+#     capacity=int(run_period / dt),
 # )
 
-# for i in range(int(run_period / dt)):
-#     fdm.run()
-
-#     results["times"].append(fdm.get_sim_time())
-
-#     results["betas"].append(fdm["aero/beta-deg"])
-#     results["bankAngle"].append(fdm["attitude/phi-deg"])
-#     results["ailerons"].append(fdm["fcs/aileron-cmd-norm"])
-#     results["rudder"].append(fdm["fcs/rudder-cmd-norm"])
-#     results["alphas"].append(fdm["aero/alpha-deg"])
-#     results["hsl"].append(fdm["position/h-sl-ft"])
-#     results["thrust"].append(fdm["propulsion/engine[0]/thrust-lbs"])
-#     results["x"].append(fdm["position/distance-from-start-lat-mt"])
-#     results["y"].append(fdm["position/distance-from-start-lon-mt"])
-#     results["vc"].append(fdm["velocities/vc-kts"])
-
+# def ramp(fdm, i):
 #     aileronCmd = fdm["fcs/aileron-cmd-norm"]
 #     rudderCmd = fdm["fcs/rudder-cmd-norm"]
 
@@ -161,8 +152,10 @@ plt.show()
 #         rudderCmd += diRudder
 #         fdm["fcs/rudder-cmd-norm"] = rudderCmd
 
+# recorder.run(int(run_period / dt), ramp)
+
 # # Plot results
-# df = pd.DataFrame(results)
+# df = recorder.frame()
 
 # ax1 = plt.subplot(211)
 # ax1.set_xlabel("Time (s)")
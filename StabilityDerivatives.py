@@ -24,61 +24,34 @@
 import jsbsim
 import numpy as np
 from tabulate import tabulate
-
-# Load the aircraft model
-AIRCRAFT_NAME = "EvenFlow"
-PATH_TO_JSBSIM_FILES = "."
-# Avoid flooding the console with log messages
-jsbsim.FGJSBBase().debug_lvl = 0
-fdm = jsbsim.FGFDMExec(PATH_TO_JSBSIM_FILES)
-fdm.load_model(AIRCRAFT_NAME)
-
-# trim condition
-# steady level flight
-
-# Initial conditions
-u0 = 30
-fdm["ic/h-sl-ft"] = 1000
-fdm["ic/vc-kts"] = u0
-fdm["ic/gamma-deg"] = 0
-fdm["ic/beta-deg"] = 0
-
-# Initialize the aircraft with initial conditions
-fdm["propulsion/engine/set-running"] = 1
-fdm.run_ic()
-
-# Full trim
-jsbsim.FGJSBBase().debug_lvl = 0
-fdm.do_trim(1)
-
-qbar_psf = fdm['aero/qbar-psf']
-Sw_sqft = fdm['metrics/Sw-sqft']
-cbar = fdm['metrics/cbarw-ft']
-a0 = fdm['aero/alpha-rad']
-b0 = fdm['aero/beta-rad']
-p0 = fdm['velocities/p-aero-rad_sec']
-q0 = fdm['velocities/q-aero-rad_sec']
-r0 = fdm['velocities/r-aero-rad_sec']
-
-aux = fdm.get_auxiliary()
-body2stab = np.array(
-    [
-        [np.cos(a0),  0, np.sin(a0)],
-        [0,          1, 0        ],
-        [-np.sin(a0), 0, np.cos(a0)]
-    ]
-)
-stab2wind = np.array(
-    [
-        [np.cos(b0),  np.sin(b0), 0],
-        [-np.sin(b0), np.cos(b0), 0],
-        [0,          0,         1]
-    ]
-)
-assert np.all(aux.get_Tb2w() == stab2wind @ body2stab)
-
-def get_coefficients() -> np.ndarray:
+from fdm_utils import load_fdm, trim
+from trim_cache import TrimCache
+from snapshot import Snapshot
+
+TITLES = ["CD", "CY", "CL", "Cl", "Cm", "Cn"]
+DERIVS = ["alpha", "beta", "u", "p", "q", "r"]
+
+def body2wind(alpha: float, beta: float) -> np.ndarray:
+    body2stab = np.array(
+        [
+            [np.cos(alpha),  0, np.sin(alpha)],
+            [0,          1, 0        ],
+            [-np.sin(alpha), 0, np.cos(alpha)]
+        ]
+    )
+    stab2wind = np.array(
+        [
+            [np.cos(beta),  np.sin(beta), 0],
+            [-np.sin(beta), np.cos(beta), 0],
+            [0,          0,         1]
+        ]
+    )
+    return stab2wind @ body2stab
+
+def get_coefficients(fdm: jsbsim.FGFDMExec, qbar_psf: float, Sw_sqft: float, cbar: float) -> np.ndarray:
+    "Wind axis force and moment coefficients at the current initial conditions."
     fdm.run_ic()
+    aux = fdm.get_auxiliary()
     X = fdm['forces/fbx-aero-lbs']
     Y = fdm['forces/fby-aero-lbs']
     Z = fdm['forces/fbz-aero-lbs']
@@ -99,12 +72,6 @@ def get_coefficients() -> np.ndarray:
     Cn = n / qbar_psf / Sw_sqft / cbar
     return np.array([CD, CY, CL, Cl, Cm, Cn])
 
-titles = ["CD", "CY", "CL", "Cl", "Cm", "Cn"]
-trim_coeffs = zip(
-    titles,
-    get_coefficients()
-)
-
 def centered_diff_fourth_order(f, x, dx):
     num = -f(x + 2*dx) + 8 * f(x + dx) - 8 * f(x - dx) + f(x - 2*dx)
     return num/(12*dx)
@@ -113,42 +80,55 @@ assert np.isclose(centered_diff_fourth_order(lambda x: x**2, 1, 1e-4), 2)
 th_test = np.linspace(0, 2*np.pi, 100)
 assert np.allclose(centered_diff_fourth_order(lambda x: np.sin(x), th_test, 1e-1 * np.ones(100)), np.cos(th_test))
 
-def coefficients_alpha(alpha_rad):
-    fdm["ic/alpha-rad"] = alpha_rad
-    return get_coefficients()
-
-def coefficients_beta(beta):
-    fdm["ic/beta-rad"] = beta
-    return get_coefficients()
-
-def coefficients_u(u):
-    fdm["ic/vc-kts"] = u
-    return get_coefficients()
-
-def coefficients_p(p):
-    fdm["ic/p-rad-sec"] = p
-    return get_coefficients() 
-
-def coefficients_q(q):
-    fdm["ic/q-rad-sec"] = q
-    return get_coefficients()
-
-def coefficients_r(r):
-    fdm["ic/r-rad-sec"] = r
-    return get_coefficients()
-
-da = np.radians(1e-3)
-du = 1e-3
-C_alpha = centered_diff_fourth_order(coefficients_alpha, a0, da)
-C_beta = centered_diff_fourth_order(coefficients_beta, b0, da)
-C_u = centered_diff_fourth_order(coefficients_u, u0, 1) * u0
-C_p = centered_diff_fourth_order(coefficients_p, p0, da) * 2 * u0 / cbar
-C_q = centered_diff_fourth_order(coefficients_p, q0, da) * 2 * u0 / cbar
-C_r = centered_diff_fourth_order(coefficients_p, r0, da) * 2 * u0 / cbar
-
-derivs = ["alpha", "beta", "u", "p", "q", "r"]
-Cs = np.array([titles, C_alpha, C_beta, C_u, C_p, C_q, C_r]).T
-
-print(tabulate(trim_coeffs))
-print("="*10)
-print(tabulate(Cs, headers = ["title"] + derivs, floatfmt=".3e"))
\ No newline at end of file
+def stability_derivatives(fdm: jsbsim.FGFDMExec, u0: float) -> tuple[np.ndarray, np.ndarray]:
+    """Coefficients at the trimmed state of fdm and their derivatives.
+
+    Returns the TITLES coefficients and a (len(TITLES), len(DERIVS)) array of
+    derivatives; rate derivatives are made nondimensional with 2 * u0 / cbar."""
+    qbar_psf = fdm['aero/qbar-psf']
+    Sw_sqft = fdm['metrics/Sw-sqft']
+    cbar = fdm['metrics/cbarw-ft']
+    a0 = fdm['aero/alpha-rad']
+    b0 = fdm['aero/beta-rad']
+    p0 = fdm['velocities/p-aero-rad_sec']
+    q0 = fdm['velocities/q-aero-rad_sec']
+    r0 = fdm['velocities/r-aero-rad_sec']
+
+    assert np.allclose(fdm.get_auxiliary().get_Tb2w(), body2wind(a0, b0))
+
+    # every derivative is taken about the trimmed state
+    restore = Snapshot.capture(fdm).restorer(fdm)
+
+    def coefficients(prop):
+        def f(x):
+            restore(initialize=False)
+            fdm[prop] = x
+            return get_coefficients(fdm, qbar_psf, Sw_sqft, cbar)
+        return f
+
+    restore(initialize=False)
+    trim_coeffs = get_coefficients(fdm, qbar_psf, Sw_sqft, cbar)
+
+    da = np.radians(1e-3)
+    C_alpha = centered_diff_fourth_order(coefficients("ic/alpha-rad"), a0, da)
+    C_beta = centered_diff_fourth_order(coefficients("ic/beta-rad"), b0, da)
+    C_u = centered_diff_fourth_order(coefficients("ic/vc-kts"), u0, 1) * u0
+    C_p = centered_diff_fourth_order(coefficients("ic/p-rad_sec"), p0, da) * 2 * u0 / cbar
+    C_q = centered_diff_fourth_order(coefficients("ic/q-rad_sec"), q0, da) * 2 * u0 / cbar
+    C_r = centered_diff_fourth_order(coefficients("ic/r-rad_sec"), r0, da) * 2 * u0 / cbar
+    # leave fdm trimmed, for whatever runs from it next
+    restore()
+    return trim_coeffs, np.array([C_alpha, C_beta, C_u, C_p, C_q, C_r]).T
+
+if __name__ == "__main__":
+    # trim condition
+    # steady level flight
+    u0 = 30
+    fdm = load_fdm()
+    trim(fdm, vc_kts=u0, h_ft=1000, cache=TrimCache())
+    trim_coeffs, derivatives = stability_derivatives(fdm, u0)
+
+    Cs = np.column_stack([TITLES, derivatives])
+    print(tabulate(zip(TITLES, trim_coeffs)))
+    print("="*10)
+    print(tabulate(Cs, headers = ["title"] + DERIVS, floatfmt=".3e"))
@@ -0,0 +1,171 @@
+# Runtime cost profile of an aerodynamics model in JSBSim
+# Ranks the functions of a compiled aerodynamics file by what they cost per
+# frame, loaded into the EvenFlow aircraft as the other scripts do (fdm_utils):
+#
+# - statically, from the nodes of each function weighted by operation type
+#   (optimize_xml.OP_COST: a property, value or arithmetic node 1,
+#   trigonometry 4, pow 6, a table lookup 8); their sum is the ops per frame,
+#   since JSBSim evaluates every function once per frame.
+# - by measurement, loading variants of the model with functions ablated (their
+#   bodies replaced by their value at trim) and comparing frame times with the
+#   full model. Ablating every function measures the aerodynamics as a whole,
+#   which converts the static ops to microseconds. A single function costs
+#   well under a microsecond, about the timing noise, so functions are ablated
+#   in groups (property directories) and only the top few on their own.
+#
+# Every variant flies the same trimmed snapshot. The timings are short and
+# paired: each round times the full model, then every variant, and a variant's
+# saving is the median over the rounds of its difference from the model, so
+# that drift and spikes in the machine's speed cancel out. Savings within
+# twice their standard error are marked as noise.
+
+import copy
+import math
+import os
+import shutil
+import statistics
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List
+
+import typer
+
+from fdm_utils import AERO_FILE, MODEL_DIR, load_fdm, stage_aircraft, trim
+from optimize_xml import OP_COST
+from snapshot import Snapshot
+
+def static_cost(element: ET.Element) -> int:
+    "Weighted node count of an expression: the ops JSBSim evaluates for it per frame."
+    if element.tag == "table":
+        return OP_COST["table"]
+    cost = OP_COST.get(element.tag, 1)
+    for child in element:
+        if isinstance(child.tag, str) and child.tag != "description":
+            cost += static_cost(child)
+    return cost
+
+def function_costs(root: ET.Element) -> Dict[str, int]:
+    "Static cost of every function of an <aerodynamics> element, top-level and in axes."
+    return {f.get("name"): sum(static_cost(c) for c in f if isinstance(c.tag, str) and c.tag != "description")
+            for f in root.iter("function")}
+
+def ablate(root: ET.Element, values: Dict[str, float]) -> ET.Element:
+    "A copy of root with the functions in values reduced to those constants."
+    root = copy.deepcopy(root)
+    for function in root.iter("function"):
+        name = function.get("name")
+        if name in values:
+            for child in [c for c in function if c.tag != "description"]:
+                function.remove(child)
+            value = ET.SubElement(function, "value")
+            value.text = f" {values[name]!r} "
+    return root
+
+def _load(aero: str):
+    root = stage_aircraft(aero=aero)
+    try:
+        return load_fdm(root)
+    finally:
+        # the model is read on load
+        shutil.rmtree(root, ignore_errors=True)
+
+def frame_time(fdm, steps: int) -> float:
+    "Seconds per frame over steps frames."
+    run = fdm.run
+    start = time.perf_counter()
+    for _ in range(steps):
+        run()
+    return (time.perf_counter() - start) / steps
+
+def _median_and_error(samples: List[float]) -> tuple[float, float]:
+    "Median of samples and its standard error, estimated robustly from the median absolute deviation."
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples)
+    return median, 1.4826 * mad * math.sqrt(math.pi / 2 / len(samples))
+
+def profile(aero: str, steps: int = 250, repeat: int = 30, individual: int = 10,
+            vc_kts: float = 30, h_ft: float = 1000) -> dict:
+    """Static costs and ablation timings of the aerodynamics XML text aero.
+
+    individual: the functions with the highest static cost to also ablate
+    one by one. Returns the costs, the median frame time (s) of each
+    variant, and the time each ablation saves per frame with its standard
+    error (s)."""
+    root = ET.fromstring(aero)
+    costs = function_costs(root)
+    model = _load(aero)
+    trim(model, vc_kts, h_ft)
+    snapshot = Snapshot.capture(model)
+    values = {name: model[name] for name in costs}
+
+    groups: Dict[str, List[str]] = {}
+    for name in costs:
+        groups.setdefault(os.path.dirname(name) + "/*", []).append(name)
+    hot = sorted(costs, key=costs.get, reverse=True)
+    ablations = {"all functions": list(costs), **groups, **{name: [name] for name in hot[:individual]}}
+
+    fdms = {"model": model}
+    for label, names in ablations.items():
+        fdms[label] = _load(ET.tostring(ablate(root, {n: values[n] for n in names}), encoding="unicode"))
+    restorers = {label: snapshot.restorer(fdm) for label, fdm in fdms.items()}
+    times = {label: [] for label in fdms}
+    for _ in range(repeat):
+        for label, fdm in fdms.items():
+            restorers[label]()
+            times[label].append(frame_time(fdm, steps))
+    savings = {label: _median_and_error([m - t for m, t in zip(times["model"], times[label])])
+               for label in ablations}
+    return {
+        "costs": costs,
+        "ablations": ablations,
+        "frame_time": {label: statistics.median(t) for label, t in times.items()},
+        "saving": {label: saving for label, (saving, _) in savings.items()},
+        "error": {label: error for label, (_, error) in savings.items()},
+    }
+
+def report(result: dict, top: int = 20) -> str:
+    from tabulate import tabulate
+    costs = result["costs"]
+    frame = result["frame_time"]
+    total_ops = sum(costs.values())
+    base = frame["model"]
+    aero_time = result["saving"]["all functions"]
+    per_op = aero_time / total_ops if total_ops else 0.0
+
+    def measured(label: str) -> str:
+        saving, error = result["saving"][label], result["error"][label]
+        text = f"{saving * 1e6:.2f} +- {error * 1e6:.2f}"
+        return text if abs(saving) > 2 * error else text + " (noise)"
+
+    lines = [
+        f"{len(costs)} functions, {total_ops} ops per frame",
+        f"model: {1 / base:.0f} steps/s ({base * 1e6:.1f} us/step)",
+        f"functions ablated to constants: {1 / frame['all functions']:.0f} steps/s; "
+        f"aerodynamics {aero_time * 1e6:.1f} us/step ({100 * aero_time / base:.0f}%), {per_op * 1e9:.1f} ns/op",
+        "",
+    ]
+    group_rows = [(label, len(names), sum(costs[n] for n in names),
+                   f"{sum(costs[n] for n in names) * per_op * 1e6:.2f}", measured(label))
+                  for label, names in result["ablations"].items() if label.endswith("/*")]
+    group_rows.sort(key=lambda row: row[2], reverse=True)
+    lines.append(tabulate(group_rows, headers=["group", "functions", "ops", "est us", "measured us"]))
+    lines.append("")
+    rows = []
+    for rank, name in enumerate(sorted(costs, key=costs.get, reverse=True)[:top], 1):
+        rows.append((rank, name, costs[name], f"{100 * costs[name] / total_ops:.1f}",
+                     f"{costs[name] * per_op * 1e6:.3f}", measured(name) if name in result["saving"] else ""))
+    lines.append(tabulate(rows, headers=["", "function", "ops", "%", "est us", "measured us"]))
+    return "\n".join(lines)
+
+def main(aero: str = typer.Option(os.path.join(MODEL_DIR, AERO_FILE), help="aerodynamics XML file to profile"),
+         steps: int = typer.Option(250, help="frames per timing"),
+         repeat: int = typer.Option(30, help="rounds of timings"),
+         individual: int = typer.Option(10, help="top static functions to also ablate one by one"),
+         top: int = typer.Option(20, help="length of the hot list"),
+         vc_kts: float = 30, h_ft: float = 1000):
+    with open(aero) as f:
+        text = f.read()
+    typer.echo(report(profile(text, steps, repeat, individual, vc_kts, h_ft), top))
+
+if __name__ == "__main__":
+    typer.run(main)
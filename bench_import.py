@@ -0,0 +1,69 @@
+# Startup benchmark for the compiler entry points
+# Build scripts run the compiler hundreds of times, so its startup matters as
+# much as its speed. Each entry point is run in a fresh interpreter; the time
+# reported is the best of `repeat` runs less that of a bare interpreter, and the
+# modules it loads are read from python -X importtime.
+#
+# Exits with status 1 if an entry point loads a heavy module it does not need
+# or exceeds its time budget, so startup regressions are caught.
+#
+#   python3 bench_import.py [--repeat 5]
+
+import os
+import subprocess
+import sys
+import time
+
+import typer
+from tabulate import tabulate
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# modules slow to import, which the entry points should only load when used
+HEAVY = ["pint", "numpy", "pandas", "pyparsing", "sexpr_grammar", "typer", "tabulate", "jsbsim"]
+
+# name: (interpreter arguments, heavy modules allowed, budget in ms over a bare interpreter)
+ENTRY_POINTS = {
+    "import compile_python_to_jsbsim": (["-c", "import compile_python_to_jsbsim"], [], 150),
+    "import compile_sexpr": (["-c", "import compile_sexpr"], [], 150),
+    "import EvenFlow": (["-c", "import EvenFlow"], [], 150),
+    "EvenFlow.py": (["EvenFlow.py"], [], 150),
+    "compile_sexpr.py compile --parser fast": (
+        ["compile_sexpr.py", "compile", "EvenFlow/EvenFlow.sexpr", "--parser", "fast"], ["typer"], 400),
+}
+
+def run_time(args: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=DIRECTORY, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def imported_modules(args: list) -> set:
+    "Top-level packages args imports, from the -X importtime report."
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=DIRECTORY, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+def main(repeat: int = 5):
+    baseline = run_time(["-c", "pass"], repeat)
+    rows = []
+    failed = False
+    for name, (args, allowed, budget) in ENTRY_POINTS.items():
+        overhead = (run_time(args, repeat) - baseline) * 1000
+        heavy = sorted(m for m in imported_modules(args) & set(HEAVY) if m not in allowed)
+        ok = overhead <= budget and not heavy
+        failed |= not ok
+        rows.append([name, f"{overhead:.0f}", budget, ", ".join(heavy) or "-", "ok" if ok else "FAIL"])
+    print(f"bare interpreter: {baseline * 1000:.0f} ms")
+    print(tabulate(rows, headers=["entry point", "ms", "budget", "heavy modules", ""]))
+    if failed:
+        raise typer.Exit(1)
+
+if __name__ == "__main__":
+    typer.run(main)
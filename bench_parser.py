@@ -0,0 +1,66 @@
+# Benchmark the pyparsing and hand-written sexpr parser backends
+# Reports tokens/second on EvenFlow.sexpr and on synthetic models made of
+# renamed copies of it, and checks that both backends produce the same XML.
+#
+#   python3 bench_parser.py [file] [--copies 1,10,50]
+
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import typer
+from tabulate import tabulate
+
+import compile_sexpr
+import sexpr_parser
+
+DEFINITION = re.compile(r'\((?:def|table)\s+(?:"[^"]*"\s+)?([A-Za-z0-9/\[\]\-_]+)')
+
+def synthetic_model(text: str, copies: int) -> str:
+    "Concatenate copies of a model, suffixing every defined property per copy."
+    names = sorted(set(DEFINITION.findall(text)) - {"row", "column"}, key=len, reverse=True)
+    pattern = re.compile(r"(?<![A-Za-z0-9/\[\]\-_])(" + "|".join(map(re.escape, names)) + r")(?![A-Za-z0-9/\[\]\-_])")
+    parts = [text]
+    for k in range(1, copies):
+        # axes can only be given once per model
+        body = text[:text.find("(axis")] if "(axis" in text else text
+        parts.append(pattern.sub(lambda m: f"{m.group(1)}_{k}", body))
+    return "\n".join(parts)
+
+def count_tokens(text: str) -> int:
+    parser = sexpr_parser.Parser(text)
+    parser.parse()
+    return parser.tokens
+
+def time_backend(parse, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def pyparsing_parse(text: str) -> list:
+    with compile_sexpr.compiling():
+        return list(compile_sexpr.spec.parse_string(text, parse_all=True))
+
+def fast_parse(text: str) -> list:
+    return sexpr_parser.parse_string(text)
+
+def main(file: str = "EvenFlow/EvenFlow.sexpr", copies: str = "1,10,50", repeat: int = 3):
+    with open(file) as f:
+        source = f.read()
+    rows = []
+    for n in [int(c) for c in copies.split(",")]:
+        text = synthetic_model(source, n)
+        tokens = count_tokens(text)
+        expected = [ET.tostring(e) for e in pyparsing_parse(text)]
+        assert [ET.tostring(e) for e in fast_parse(text)] == expected, "backends disagree"
+        slow = time_backend(pyparsing_parse, text, repeat)
+        fast = time_backend(fast_parse, text, repeat)
+        rows.append([n, text.count("\n") + 1, tokens,
+                     f"{tokens / slow:,.0f}", f"{tokens / fast:,.0f}", f"{slow / fast:.1f}x"])
+    print(tabulate(rows, headers=["copies", "lines", "tokens", "pyparsing tok/s", "fast tok/s", "speedup"]))
+
+if __name__ == "__main__":
+    typer.run(main)
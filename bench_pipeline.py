@@ -0,0 +1,310 @@
+# End-to-end performance benchmarks of the model pipeline, with a history
+# Times each stage from source to flying model: parsing EvenFlow.sexpr with
+# both backends and compiling it, building EvenFlow.py, loading the model into
+# a new FGFDMExec, run_ic, trimming, FGLinearization and free-running
+# fdm.run() in steps per second.
+#
+# Each run is appended to bench_history.jsonl, one JSON object per line with
+# the commit, host and results. A result is a regression when it is worse than
+# the median of the last HISTORY runs on the same host by more than its
+# tolerance; the run then exits with an error, so it can gate a change.
+#
+# The speed of a shared machine drifts by tens of percent from one minute to
+# the next, and slow spells of a few seconds come and go, for every program
+# alike. Each benchmark's timings alternate with those of a fixed calibration
+# workload, and the benchmark is compared by its best time relative to the
+# calibration's best over the same samples, so both see the same machine. A
+# result that still looks like a regression is measured again (CONFIRM times
+# at most) and the better result kept, as a spell passes and a regression
+# stays.
+#
+# Only clean runs make the baseline: runs of a commit with uncommitted
+# changes (-dirty) or that found a regression are recorded but not compared
+# with, so a regression never becomes the norm. Records of another
+# HISTORY_VERSION are skipped.
+#
+#   python3 bench_pipeline.py [--only trim,fdm.run] [--repeat 5] [--no-record]
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict
+
+import typer
+from tabulate import tabulate
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(DIRECTORY, "bench_history.jsonl")
+SEXPR_FILE = os.path.join(DIRECTORY, "EvenFlow", "EvenFlow.sexpr")
+
+# runs of the same host a result is compared with, and the fewest that make a
+# baseline: one run alone is as noisy as the result compared with it
+HISTORY = 5
+MIN_HISTORY = 3
+# format of the history records
+HISTORY_VERSION = 2
+# measurements again of a result that looks like a regression
+CONFIRM = 2
+
+# name: (unit, whether higher is better, relative change counted as a regression)
+BENCHMARKS = {
+    "sexpr parse (fast)": ("ms", False, 0.25),
+    "sexpr parse (pyparsing)": ("ms", False, 0.25),
+    "sexpr compile": ("ms", False, 0.25),
+    "EvenFlow.py build": ("ms", False, 0.25),
+    "load_model": ("ms", False, 0.25),
+    "run_ic": ("us", False, 0.25),
+    "trim": ("ms", False, 0.25),
+    "linearization": ("ms", False, 0.25),
+    "fdm.run": ("steps/s", True, 0.25),
+}
+
+SCALE = {"ms": 1e3, "us": 1e6}
+
+# frames per timing of fdm.run, and run_ic calls per timing
+STEPS = 500
+RUN_ICS = 100
+
+# seconds spent timing each benchmark at least: short ones are timed more
+# than repeat times, as their best time converges slowly on a busy machine
+MIN_TIME = 0.5
+
+def calibration_workload():
+    """A fixed few milliseconds of interpreter work, the unit results are compared in.
+
+    Like the pipeline it builds strings, dicts and lists of small objects
+    that do not fit in the fastest caches, as a busy machine slows such work
+    more than arithmetic."""
+    names = [f"aero/coefficients/C{i % 7}_{i}-rad" for i in range(5000)]
+    table = {name: [len(name), i * 0.5] for i, name in enumerate(names)}
+    return sorted(" ".join(names).split(), key=lambda name: table[name][0])
+
+def best_time(function: Callable, repeat: int, setup: Callable | None = None,
+              calls: int = 1) -> tuple[float, float]:
+    """Best time in seconds of one call of function, after setup() before each
+    timing, and best time in ms of the calibration workload, timed after each
+    for about as long, so that both meet the same interference.
+
+    Times are of this process's CPU, so other processes taking turns on the
+    same CPU do not count. Timed repeat times, and more until MIN_TIME has
+    passed."""
+    begin = time.process_time()
+    calibration_workload()
+    calibration = time.process_time() - begin
+    best = float("inf")
+    count = 0
+    start = time.perf_counter()
+    while count < repeat or time.perf_counter() - start < MIN_TIME:
+        if setup is not None:
+            setup()
+        begin = time.process_time()
+        for _ in range(calls):
+            function()
+        elapsed = time.process_time() - begin
+        best = min(best, elapsed / calls)
+        runs = max(1, round(elapsed / calibration))
+        begin = time.process_time()
+        for _ in range(runs):
+            calibration_workload()
+        calibration = min(calibration, (time.process_time() - begin) / runs)
+        count += 1
+    return best, calibration * 1e3
+
+def normalized(name: str, value: float, calibration: float) -> float:
+    "A result in units of the calibration time, so that machine speed cancels."
+    higher_is_better = BENCHMARKS[name][1]
+    return value * calibration if higher_is_better else value / calibration
+
+def measure(names: list[str], repeat: int) -> Dict[str, tuple[float, float]]:
+    "The benchmarks in names, in their units, each with its calibration time (ms)."
+    import jsbsim
+    import compile_sexpr
+    import sexpr_parser
+    from bench_parser import pyparsing_parse
+    from fdm_utils import load_fdm, staged_aircraft, trim
+    from snapshot import Snapshot
+
+    with open(SEXPR_FILE) as f:
+        text = f.read()
+    fdm = None
+
+    def trimmed() -> "jsbsim.FGFDMExec":
+        nonlocal fdm
+        if fdm is None:
+            fdm = load_fdm(root)
+            trim(fdm)
+        return fdm
+
+    def build():
+        import EvenFlow
+        from compile_python_to_jsbsim import print_xml
+        return print_xml(EvenFlow.build().compile())
+
+    def run_ic():
+        model = trimmed()
+        return best_time(model.run_ic, repeat, calls=RUN_ICS)
+
+    def trim_time():
+        # a new executive each time, so no trim starts from the last one's
+        # controls; only the one being timed is kept
+        model = None
+
+        def load():
+            nonlocal model
+            model = None
+            model = load_fdm(root)
+        return best_time(lambda: trim(model), repeat, setup=load)
+
+    def linearization():
+        model = trimmed()
+        restore = Snapshot.capture(model).restorer(model)
+        return best_time(lambda: jsbsim.FGLinearization(model), repeat, setup=restore)
+
+    def steps():
+        model = trimmed()
+        restore = Snapshot.capture(model).restorer(model)
+        run = model.run
+
+        def frames():
+            for _ in range(STEPS):
+                run()
+        seconds, calibration = best_time(frames, repeat, setup=restore)
+        return STEPS / seconds, calibration
+
+    timings = {
+        "sexpr parse (fast)": lambda: best_time(lambda: sexpr_parser.parse_string(text), repeat),
+        "sexpr parse (pyparsing)": lambda: best_time(lambda: pyparsing_parse(text), repeat),
+        "sexpr compile": lambda: best_time(lambda: compile_sexpr.to_string(
+            compile_sexpr.compile_file(SEXPR_FILE, parser=compile_sexpr.Parser.fast)), repeat),
+        "EvenFlow.py build": lambda: best_time(build, repeat),
+        "load_model": lambda: best_time(lambda: load_fdm(root), repeat),
+        "run_ic": run_ic,
+        "trim": trim_time,
+        "linearization": linearization,
+        "fdm.run": steps,
+    }
+    results = {}
+    with staged_aircraft() as root:
+        for name in names:
+            value, calibration = timings[name]()
+            results[name] = (value * SCALE.get(BENCHMARKS[name][0], 1), calibration)
+    return results
+
+def read_history(path: str) -> list[dict]:
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a run interrupted while writing
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+def comparable(record: dict, host: str) -> bool:
+    "Whether a history record is a clean run on host in this format, one to compare with."
+    commit = record.get("commit") or ""
+    return (record.get("version") == HISTORY_VERSION and record.get("host") == host
+            and not record.get("regressions") and not commit.endswith("-dirty"))
+
+def baselines(records: list[dict], host: str) -> Dict[str, float]:
+    "Median of each normalized result over the last HISTORY comparable runs on host, given MIN_HISTORY."
+    values: Dict[str, list] = {}
+    for record in records:
+        if comparable(record, host):
+            for name, value in record["results"].items():
+                if name in BENCHMARKS and name in record["calibration"]:
+                    values.setdefault(name, []).append(normalized(name, value, record["calibration"][name]))
+    return {name: statistics.median(v[-HISTORY:]) for name, v in values.items() if len(v) >= MIN_HISTORY}
+
+def regression(name: str, value: float, baseline: float) -> bool:
+    "Whether a normalized result is worse than its baseline by more than the tolerance."
+    _, higher_is_better, tolerance = BENCHMARKS[name]
+    if higher_is_better:
+        return value < baseline * (1 - tolerance)
+    return value > baseline * (1 + tolerance)
+
+def better(name: str, a: tuple[float, float], b: tuple[float, float]) -> tuple[float, float]:
+    "The better of two (result, calibration) measurements, compared normalized."
+    if BENCHMARKS[name][1]:
+        return a if normalized(name, *a) >= normalized(name, *b) else b
+    return a if normalized(name, *a) <= normalized(name, *b) else b
+
+def commit() -> str | None:
+    "The checked out commit, marked -dirty when the tree has changes."
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORY, check=True,
+                              capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=DIRECTORY).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + "-dirty" if dirty else head
+
+def main(only: str | None = typer.Option(None, help="comma separated benchmarks to run, all by default"),
+         repeat: int = 5, history: str = HISTORY_FILE,
+         confirm: int = typer.Option(CONFIRM, help="measurements again of a result that looks like a regression"),
+         record: bool = typer.Option(True, help="append this run to the history")):
+    names = list(BENCHMARKS) if only is None else [n.strip() for n in only.split(",")]
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise typer.BadParameter(f"unknown benchmarks {unknown}; known: {list(BENCHMARKS)}")
+    host = platform.node()
+    previous = baselines(read_history(history), host)
+    measured = measure(names, repeat)
+    for _ in range(confirm):
+        suspects = [name for name, (value, calibration) in measured.items() if name in previous
+                    and regression(name, normalized(name, value, calibration), previous[name])]
+        if not suspects:
+            break
+        for name, again in measure(suspects, repeat).items():
+            measured[name] = better(name, measured[name], again)
+    results = {name: value for name, (value, _) in measured.items()}
+    calibrations = {name: calibration for name, (_, calibration) in measured.items()}
+
+    rows = []
+    regressions = []
+    for name, value in results.items():
+        unit = BENCHMARKS[name][0]
+        baseline = previous.get(name)
+        if baseline is None:
+            rows.append([name, f"{value:,.1f}", unit, "-", "-", "new"])
+            continue
+        value_n = normalized(name, value, calibrations[name])
+        failed = regression(name, value_n, baseline)
+        if failed:
+            regressions.append(name)
+        # the baseline at this run's machine speed
+        expected = value * baseline / value_n
+        rows.append([name, f"{value:,.1f}", unit, f"{expected:,.1f}",
+                     f"{100 * (value_n / baseline - 1):+.0f}%", "REGRESSION" if failed else "ok"])
+    print(f"calibration: {statistics.median(calibrations.values()):.2f} ms")
+    print(tabulate(rows, headers=["benchmark", "result", "unit", "baseline", "change", ""]))
+
+    if record:
+        import jsbsim
+        entry = {
+            "version": HISTORY_VERSION,
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit(),
+            "host": host,
+            "python": platform.python_version(),
+            "jsbsim": jsbsim.__version__,
+            "repeat": repeat,
+            "calibration": calibrations,
+            "results": results,
+            "regressions": regressions,
+        }
+        with open(history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    if regressions:
+        raise typer.Exit(1)
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,136 @@
+# Aerodynamic coefficient maps over alpha x beta x airspeed x control grids
+# The grid is flattened and split into chunks that worker processes evaluate,
+# each with its own loaded model: a point is one run_ic at the grid state.
+#
+# Forces are given in wind axes (CL and CD positive for lift and drag), moments
+# in body axes: Cl = l / (qbar S b), Cm = m / (qbar S cbar), Cn = n / (qbar S b).
+# With the propeller stopped, as after run_ic, there is no propwash.
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence
+
+import numpy as np
+import typer
+
+from fdm_utils import parse_values, staged_aircraft, load_fdm
+
+COEFFICIENTS = ["CL", "CD", "CY", "Cl", "Cm", "Cn"]
+
+# grid axes set through the initial condition, in grid order
+STATE_AXES = {"alpha_deg": "ic/alpha-deg", "beta_deg": "ic/beta-deg", "vc_kts": "ic/vc-kts"}
+
+# properties read at every point
+OUTPUTS = [
+    "forces/fbx-aero-lbs",
+    "forces/fby-aero-lbs",
+    "forces/fbz-aero-lbs",
+    "moments/l-aero-lbsft",
+    "moments/m-aero-lbsft",
+    "moments/n-aero-lbsft",
+    "aero/qbar-psf",
+    "aero/alpha-rad",
+    "aero/beta-rad",
+    "metrics/Sw-sqft",
+    "metrics/bw-ft",
+    "metrics/cbarw-ft",
+]
+
+# points evaluated per task
+CHUNK = 4096
+
+_worker = {}
+
+def _init_worker(root: str, inputs: List[str], h_ft: float):
+    fdm = load_fdm(root)
+    fdm["ic/h-sl-ft"] = h_ft
+    fdm["propulsion/engine/set-running"] = 1
+    # nodes are looked up once, not by name at every point
+    pm = fdm.get_property_manager()
+    _worker["fdm"] = fdm
+    _worker["inputs"] = [pm.get_node(p, True) for p in inputs]
+    _worker["outputs"] = [pm.get_node(p) for p in OUTPUTS]
+
+def _evaluate(points: np.ndarray) -> np.ndarray:
+    fdm, inputs, outputs = _worker["fdm"], _worker["inputs"], _worker["outputs"]
+    result = np.empty((len(points), len(outputs)))
+    for i, point in enumerate(points.tolist()):
+        for node, value in zip(inputs, point):
+            node.set_double_value(value)
+        fdm.run_ic()
+        result[i] = [node.get_double_value() for node in outputs]
+    return result
+
+def coefficients(raw: np.ndarray) -> Dict[str, np.ndarray]:
+    "Coefficients from rows of OUTPUTS, vectorized over the rows."
+    X, Y, Z, l, m, n, qbar, alpha, beta, S, b, cbar = raw.T
+    ca, sa, cb, sb = np.cos(alpha), np.sin(alpha), np.cos(beta), np.sin(beta)
+    # body to wind axes, as FGAuxiliary::GetTb2w
+    x_w = ca * cb * X + sb * Y + sa * cb * Z
+    y_w = -ca * sb * X + cb * Y - sa * sb * Z
+    z_w = -sa * X + ca * Z
+    qS = qbar * S
+    return {
+        "CL": -z_w / qS,
+        "CD": -x_w / qS,
+        "CY": y_w / qS,
+        "Cl": l / (qS * b),
+        "Cm": m / (qS * cbar),
+        "Cn": n / (qS * b),
+    }
+
+def coefficient_map(alpha_deg: Sequence[float], beta_deg: Sequence[float] = (0.0,),
+                    vc_kts: Sequence[float] = (30.0,),
+                    controls: Dict[str, Sequence[float]] | None = None,
+                    aero: str | None = None, h_ft: float = 1000,
+                    workers: int | None = None, chunk: int = CHUNK) -> Dict[str, np.ndarray]:
+    """Coefficients over the grid alpha x beta x vc x controls.
+
+    controls: property (e.g. fcs/elevator-cmd-norm) to the values it takes.
+    aero: XML text of an aerodynamics file to use instead of the compiled one.
+    Returns the grid axes and one array per coefficient, shaped like the grid."""
+    axes = {"alpha_deg": alpha_deg, "beta_deg": beta_deg, "vc_kts": vc_kts, **(controls or {})}
+    axes = {name: np.asarray(values, dtype=float) for name, values in axes.items()}
+    inputs = [STATE_AXES.get(name, name) for name in axes]
+    shape = tuple(len(values) for values in axes.values())
+    grid = np.meshgrid(*axes.values(), indexing="ij")
+    points = np.stack([g.reshape(-1) for g in grid], axis=1)
+    chunks = [points[i:i + chunk] for i in range(0, len(points), chunk)]
+    # one root for all workers, removed by this process: workers skip atexit handlers
+    with staged_aircraft(aero) as root, \
+         ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(root, inputs, h_ft)) as executor:
+        raw = np.concatenate(list(executor.map(_evaluate, chunks)))
+    result = dict(axes)
+    result.update({name: c.reshape(shape) for name, c in coefficients(raw).items()})
+    return result
+
+def save_map(path: str, result: Dict[str, np.ndarray]):
+    "Write a map to a compressed .npz; `axes` lists the grid axes in order."
+    names = [name for name in result if name not in COEFFICIENTS]
+    arrays = {name.replace("/", "."): result[name] for name in result}
+    np.savez_compressed(path, axes=np.array([n.replace("/", ".") for n in names]), **arrays)
+
+def main(alpha: str = "-15:15:31",
+         beta: str = "0",
+         vc_kts: str = "30",
+         control: List[str] = typer.Option([], help="property=start:stop:count or property=v1,v2,..."),
+         aero: str | None = typer.Option(None, help="aerodynamics XML file to map instead of the compiled model"),
+         h_ft: float = 1000,
+         output: str = "coefficients.npz",
+         workers: int | None = None):
+    "Map CL, CD, CY, Cl, Cm, Cn over the grid and save it to OUTPUT."
+    controls = {}
+    for spec in control:
+        name, _, values = spec.partition("=")
+        controls[name] = parse_values(values)
+    aero_xml = None
+    if aero is not None:
+        with open(aero) as f:
+            aero_xml = f.read()
+    result = coefficient_map(parse_values(alpha), parse_values(beta), parse_values(vc_kts),
+                             controls, aero_xml, h_ft, workers)
+    save_map(output, result)
+    shape = result["CL"].shape
+    typer.echo(f"{int(np.prod(shape))} points {shape} written to {output}")
+
+if __name__ == "__main__":
+    typer.run(main)
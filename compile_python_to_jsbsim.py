@@ -1,18 +1,30 @@
 # Python library for compiling python documents into JSBSim FDM
 # The goal here is to make defining wings a little bit less painful
 
+import copy
+import re
 from dataclasses import dataclass
 from xml.etree import ElementTree as ET
-from typing import List, Literal
-from compile_sexpr import spec, sexp
-import numpy as np
-import pint; u = pint.UnitRegistry()
+from typing import Callable, List, Literal
+from sexpr_parser import SCI_REAL, compiling, current_context, parse_expression, table_data_element
 
-m2ft = (1*u.m).to(u.ft).magnitude
+# numpy (Wing) and the optimization passes are imported where they are used,
+# so scripts building models start fast
+
+# ft per m (1 ft = 0.3048 m exactly), correctly rounded
+m2ft = 10000 / 3048
+
+AXES = ("X", "Y", "Z", "ROLL", "PITCH", "YAW")
 
 class FDM_Element:
     def __init__(self):
         self._dictionary = {}
+        # functions this element contributes to each axis of its aircraft
+        self.axes = {}
+    def axis(self, name: Literal["X", "Y", "Z", "ROLL", "PITCH", "YAW"]) -> "Axis":
+        if name not in self.axes:
+            self.axes[name] = Axis(name)
+        return self.axes[name]
     def __setitem__(self, key: str, value: str | float):
         self._dictionary[key] = value
     def __getitem__(self, key: str):
@@ -36,16 +48,26 @@ class Constants(FDM_Element):
         return fn_element
 
 class Functions(FDM_Element):
+    "Functions given as sexpr text, or as elements stamped from a Template."
     def xml_item(self, key, value):
         fn_element = ET.Element("function")
         fn_element.set("name", key)
+        if isinstance(value, list):
+            # copied, as the passes rewrite the tree in place
+            context = current_context()
+            for table in (t for element in value for t in element.iter("table")):
+                name = table.get("name")
+                if name is None:
+                    continue
+                if name in context.property_defined:
+                    raise Exception(f"{key}: {name} already defined")
+                context.property_defined.add(name)
+            fn_element.extend(copy.deepcopy(value))
+            return fn_element
         try:
-            children = sexp.parse_string(value)
+            fn_element.append(parse_expression(value, current_context()))
         except:
             raise Exception("could not parse", value)
-        for element in children:
-            if isinstance(element, ET.Element):
-                fn_element.append(element)
         return fn_element
 
 class Axis(Functions):
@@ -59,70 +81,115 @@ class Axis(Functions):
         super().add_to(axis_element)
         root.append(axis_element)
 
-# define the axes directly in the library
-X = Axis("X")
-Y = Axis("Y")
-Z = Axis("Z")
-ROLL = Axis("ROLL")
-PITCH = Axis("PITCH")
-YAW = Axis("YAW")
+# placeholders a Template fills its texts with: names and numbers
+NAME_SLOT = re.compile(r"SLOT(\d+)X")
+NUMBER_SLOT = 7340033.0
 
-class Wing_Panel(FDM_Element):
-    "A generic wing panel. Must be added after the axis elements."
-    def __init__(self, 
-                 name: str,
-                 unit: Literal["FT", "M"],
-                 x: float, y: float, z: float,
-                 u_z: float, v_z: float, w_z: float,
-                 u_x: float, v_x: float, w_x: float,
-                 a: float, clmax: float, k: float, cd0: float,
-                 S: float,
-                 f_name: Literal["right-aileron", "left-aileron", "rudder", "elevator"] | None, 
-                 tau_f: float | None,
-                 propwash: float | None, 
-                 downwash: float | None
-                 ):
-        super().__init__()
-        w = name
-        if unit == "M":
-            x = x * m2ft
-            y = y * m2ft
-            z = z * m2ft
-            S = S * m2ft**2
-        # Normalize normal vectors
-        len_x_norm = (u_x**2 + w_x**2 + v_x**2)**0.5
-        u_x = u_x / len_x_norm; v_x = v_x / len_x_norm; w_x = w_x / len_x_norm
-        len_z_norm = (u_z**2 + w_z**2 + v_z**2)**0.5
-        u_z = u_z / len_z_norm; v_z = v_z / len_z_norm; w_z = w_z / len_z_norm
-        alphamax = clmax / a
-        constants = Constants()
-        functions = Functions()
-        # body positions
-        constants[f"aero/quantity/x_{w}-ft"] = x
-        constants[f"aero/quantity/y_{w}-ft"] = y
-        constants[f"aero/quantity/z_{w}-ft"] = z
-        constants[f"aero/coefficients/CD0_{w}"] = cd0
-        constants[f"aero/coefficients/k_{w}"] = k
-        constants[f"aero/metrics/S_{w}-sqft"] = S
-        if propwash is not None:
-            functions[f"aero/velocities/prop-{w}-ui-fps"] = \
-                f"(* {propwash} propulsion/engine/prop-induced-velocity_fps)"
-        else:
-            functions[f"aero/velocities/prop-{w}-ui-fps"] = "0.0"
-        if downwash is not None:
-            functions[f"aero/velocities/wing-{w}-zi-fps"] = \
-                f"(* -1.0 aero/velocities/wing-zi-fps {downwash})"
-        else:
-            functions[f"aero/velocities/wing-{w}-zi-fps"] = "0.0"
-        if f_name is not None:
-            functions[f"aero/calculated/delta-alpha_{w}_{f_name}-rad"] = \
-                f"(* {tau_f} fcs/{f_name}-pos-rad)"
-        else:
-            functions[f"aero/calculated/delta-alpha_{w}_{f_name}-rad"] = "0.0"
-        # local velocity vector, body frame
-        # v = U + omega x r
-        # account for propwash and downwash
-        functions[f"aero/velocities/U_{w}_bf-fps"] = f"""
+def _number(text: str) -> float | int:
+    "A number as the parsers read its text."
+    return float(text) if SCI_REAL.fullmatch(text) else int(text)
+
+class Template:
+    """Sexpr texts parsed once into element skeletons, then stamped out with
+    different names and numbers substituted into copies of the elements.
+
+    fill(**slots) returns the texts as {target: {function name: sexpr}}. It is
+    called once for each combination of slots left None, with placeholders
+    for the others, so it may only format the slots into the texts (a number
+    may be negated), not compute with them or branch on their values."""
+    def __init__(self, fill: Callable[..., dict], names: List[str], numbers: List[str]):
+        self.fill = fill
+        self.names = names
+        self.numbers = numbers
+        self.skeletons = {}
+        # rows of the skeletons' tables with placeholders, by id of the tableData element
+        self.tables = {}
+
+    def skeleton(self, missing: frozenset) -> dict:
+        if missing in self.skeletons:
+            return self.skeletons[missing]
+        slots = {name: None if name in missing else f"SLOT{i}X"
+                 for i, name in enumerate(self.names)}
+        slots.update({name: None if name in missing else NUMBER_SLOT + i
+                      for i, name in enumerate(self.numbers)})
+        placeholders = {str(NUMBER_SLOT + i) for i in range(len(self.numbers))}
+        placeholders |= {"-" + p for p in placeholders}
+        skeleton = {}
+        # a context of its own: the placeholder tables are not definitions of the model
+        with compiling():
+            for target, texts in self.fill(**slots).items():
+                skeleton[target] = {}
+                for key, text in texts.items():
+                    elements = [parse_expression(text, current_context())]
+                    for data in (d for e in elements for d in e.iter("tableData")):
+                        rows = [line.split() for line in data.text.strip().split("\n")]
+                        if len(rows) > 1 and len(rows[0]) < len(rows[1]):
+                            rows[0].insert(0, '""')
+                        if any(entry in placeholders for row in rows for entry in row):
+                            self.tables[id(data)] = [[entry if entry in placeholders or entry == '""'
+                                                      else _number(entry) for entry in row] for row in rows]
+                    skeleton[target][key] = elements
+        self.skeletons[missing] = skeleton
+        return skeleton
+
+    def stamp(self, **slots) -> dict:
+        "The parsed texts of fill(**slots), as {target: {function name: [element]}}."
+        missing = frozenset(name for name, value in slots.items() if value is None)
+        names = {str(i): str(slots[name]) for i, name in enumerate(self.names)}
+        numbers = {}
+        for i, name in enumerate(self.numbers):
+            if slots[name] is not None:
+                numbers[str(NUMBER_SLOT + i)] = _number(str(slots[name]))
+                numbers[str(-(NUMBER_SLOT + i))] = _number(str(-slots[name]))
+        substitute = lambda m: names[m.group(1)]
+        def copy_element(element: ET.Element) -> ET.Element:
+            result = ET.Element(element.tag, {k: NAME_SLOT.sub(substitute, v) for k, v in element.attrib.items()})
+            text = element.text
+            if element.tag == "value":
+                number = numbers.get(text.strip())
+                if number is not None:
+                    text = f" {number} "
+            elif element.tag == "tableData":
+                rows = self.tables.get(id(element))
+                if rows is not None:
+                    text = table_data_element([[numbers[e] if isinstance(e, str) else e for e in row]
+                                               for row in rows]).text
+            elif text:
+                text = NAME_SLOT.sub(substitute, text)
+            result.text = text
+            result.tail = element.tail
+            result.extend(copy_element(child) for child in element)
+            return result
+        return {target: {NAME_SLOT.sub(substitute, key): [copy_element(e) for e in elements]
+                         for key, elements in texts.items()}
+                for target, texts in self.skeleton(missing).items()}
+
+def wing_panel_sexprs(w: str, f_name: str | None,
+                      u_x: float, v_x: float, w_x: float,
+                      u_z: float, v_z: float, w_z: float,
+                      alphamax: float, clmax: float, tau_f: float | None,
+                      propwash: float | None, downwash: float | None) -> dict:
+    "The sexpr texts of a Wing_Panel, by target: 'functions' or an axis name."
+    functions, X, Y, Z, ROLL, PITCH, YAW = {}, {}, {}, {}, {}, {}, {}
+    if propwash is not None:
+        functions[f"aero/velocities/prop-{w}-ui-fps"] = \
+            f"(* {propwash} propulsion/engine/prop-induced-velocity_fps)"
+    else:
+        functions[f"aero/velocities/prop-{w}-ui-fps"] = "0.0"
+    if downwash is not None:
+        functions[f"aero/velocities/wing-{w}-zi-fps"] = \
+            f"(* -1.0 aero/velocities/wing-zi-fps {downwash})"
+    else:
+        functions[f"aero/velocities/wing-{w}-zi-fps"] = "0.0"
+    if f_name is not None:
+        functions[f"aero/calculated/delta-alpha_{w}_{f_name}-rad"] = \
+            f"(* {tau_f} fcs/{f_name}-pos-rad)"
+    else:
+        functions[f"aero/calculated/delta-alpha_{w}_{f_name}-rad"] = "0.0"
+    # local velocity vector, body frame
+    # v = U + omega x r
+    # account for propwash and downwash
+    functions[f"aero/velocities/U_{w}_bf-fps"] = f"""
 (+ velocities/u-aero-fps
    (* velocities/q-aero-rad_sec
       aero/quantity/z_{w}-ft)
@@ -131,7 +198,7 @@ class Wing_Panel(FDM_Element):
       aero/quantity/y_{w}-ft)
    aero/velocities/prop-{w}-ui-fps)
 """
-        functions[f"aero/velocities/V_{w}_bf-fps"] = f"""
+    functions[f"aero/velocities/V_{w}_bf-fps"] = f"""
 (+ velocities/v-aero-fps
    (* velocities/r-aero-rad_sec
       aero/quantity/x_{w}-ft)
@@ -139,7 +206,7 @@ class Wing_Panel(FDM_Element):
       velocities/p-aero-rad_sec
       aero/quantity/z_{w}-ft))
 """
-        functions[f"aero/velocities/W_{w}_bf-fps"] = f"""
+    functions[f"aero/velocities/W_{w}_bf-fps"] = f"""
 (+ velocities/w-aero-fps
    (* velocities/p-aero-rad_sec
       aero/quantity/y_{w}-ft)
@@ -148,111 +215,166 @@ class Wing_Panel(FDM_Element):
       aero/quantity/x_{w}-ft)
    aero/velocities/wing-{w}-zi-fps)
 """
-        # spanwise velocity U (wing frame)
-        functions[f"aero/velocities/U_{w}_wf-fps"] = f"""
+    # spanwise velocity U (wing frame)
+    functions[f"aero/velocities/U_{w}_wf-fps"] = f"""
 (+ (* {u_x} aero/velocities/U_{w}_bf-fps)
    (* {v_x} aero/velocities/V_{w}_bf-fps)
    (* {w_x} aero/velocities/W_{w}_bf-fps))
         """
-        # normal velocity W (wing frame)
-        functions[f"aero/velocities/W_{w}_wf-fps"] = f"""
+    # normal velocity W (wing frame)
+    functions[f"aero/velocities/W_{w}_wf-fps"] = f"""
 (+ (* {u_z} aero/velocities/U_{w}_bf-fps)
    (* {v_z} aero/velocities/V_{w}_bf-fps)
    (* {w_z} aero/velocities/W_{w}_bf-fps))
 """
-        # effective dynamic
-        functions[f"aero/calculated/qbar_{w}-psf"] = f"""
+    # effective dynamic
+    functions[f"aero/calculated/qbar_{w}-psf"] = f"""
 (* 0.5
    atmosphere/rho-slugs_ft3
    (+ (pow aero/velocities/U_{w}_wf-fps 2)
       (pow aero/velocities/W_{w}_wf-fps 2)))
 """
-        # angle of attack
-        functions[f"aero/calculated/alpha_{w}-rad"] = f"""
+    # angle of attack
+    functions[f"aero/calculated/alpha_{w}-rad"] = f"""
 (+ (atan2 aero/velocities/W_{w}_wf-fps
           aero/velocities/U_{w}_wf-fps)
    aero/calculated/delta-alpha_{w}_{f_name}-rad)
 """
 
-        # lift coefficient
-        functions[f"aero/coefficients/CL_{w}"] = f"""
+    # lift coefficient
+    functions[f"aero/coefficients/CL_{w}"] = f"""
 (table aero/table/CL_{w}_alpha
   (row aero/calculated/alpha_{w}-rad)
   [-1.57 0,
   {-alphamax} {-clmax},
   {alphamax} {clmax},
   1.57 0])"""
-        # separation drag
-        functions[f"aero/coefficients/CD-sep_{w}"] = f"""
+    # separation drag
+    functions[f"aero/coefficients/CD-sep_{w}"] = f"""
 (table aero/table/CD-sep_{w}_alpha
     (row aero/calculated/alpha_{w}-rad)
     [-1.57 1,
     {-alphamax} 0,
     {alphamax} 0,
     1.57 1])"""
-        # drag coefficient
-        functions[f"aero/coefficients/CD_{w}"] = f"""
+    # drag coefficient
+    functions[f"aero/coefficients/CD_{w}"] = f"""
 (+ aero/coefficients/CD0_{w}
    (* aero/coefficients/k_{w}
       (pow aero/coefficients/CL_{w} 2))
    aero/coefficients/CD-sep_{w})
 """
-        # lift force
-        functions[f"aero/forces/L_{w}-lb"] = f"""
+    # lift force
+    functions[f"aero/forces/L_{w}-lb"] = f"""
 (* aero/coefficients/CL_{w}
    aero/metrics/S_{w}-sqft
    aero/calculated/qbar_{w}-psf)
 """
-        # drag force
-        functions[f"aero/forces/D_{w}-lb"] = f"""
+    # drag force
+    functions[f"aero/forces/D_{w}-lb"] = f"""
 (* aero/coefficients/CD_{w}
    aero/metrics/S_{w}-sqft
    aero/calculated/qbar_{w}-psf)
 """
-        # wing frame forces
-        functions[f"aero/forces/X_{w}_wf-lb"] = f"""
+    # wing frame forces
+    functions[f"aero/forces/X_{w}_wf-lb"] = f"""
 (+ (* aero/forces/L_{w}-lb
       (sin aero/calculated/alpha_{w}-rad))
    (* -1.0 aero/forces/D_{w}-lb
       (cos aero/calculated/alpha_{w}-rad)))
 """
-        functions[f"aero/forces/Z_{w}_wf-lb"] = f"""
+    functions[f"aero/forces/Z_{w}_wf-lb"] = f"""
 (+ (* -1.0 aero/forces/L_{w}-lb
       (cos aero/calculated/alpha_{w}-rad))
    (* -1.0 aero/forces/D_{w}-lb
       (sin aero/calculated/alpha_{w}-rad)))
 """
-        
-        X[f"aero/forces/X_{w}-lb"] = f"""
+    
+    X[f"aero/forces/X_{w}-lb"] = f"""
 (+ (* {u_x} aero/forces/X_{w}_wf-lb)
    (* {u_z} aero/forces/Z_{w}_wf-lb))
 """
-        Y[f"aero/forces/Y_{w}-lb"] = f"""
+    Y[f"aero/forces/Y_{w}-lb"] = f"""
 (+ (* {v_x} aero/forces/X_{w}_wf-lb)
    (* {v_z} aero/forces/Z_{w}_wf-lb))
 """
-        Z[f"aero/forces/Z_{w}-lb"] = f"""
+    Z[f"aero/forces/Z_{w}-lb"] = f"""
 (+ (* {w_x} aero/forces/X_{w}_wf-lb)
    (* {w_z} aero/forces/Z_{w}_wf-lb))
 """
-        ROLL[f"aero/moments/L_{w}-ftlb"] = f"""
+    ROLL[f"aero/moments/L_{w}-ftlb"] = f"""
 (+ (* -1.0 aero/quantity/z_{w}-ft
       aero/forces/Y_{w}-lb)
    (* aero/quantity/y_{w}-ft
       aero/forces/Z_{w}-lb))
 """
-        PITCH[f"aero/moments/M_{w}-ftlb"] = f"""
+    PITCH[f"aero/moments/M_{w}-ftlb"] = f"""
 (+ (* -1.0 aero/quantity/x_{w}-ft
       aero/forces/Z_{w}-lb)
    (* aero/quantity/z_{w}-ft
       aero/forces/X_{w}-lb))
 """
-        YAW[f"aero/moments/N_{w}-ftlb"] = f"""
+    YAW[f"aero/moments/N_{w}-ftlb"] = f"""
 (+ (* -1.0 aero/quantity/y_{w}-ft
       aero/forces/X_{w}-lb)
    (* aero/quantity/x_{w}-ft
       aero/forces/Y_{w}-lb))
 """
+    return {"functions": functions, "X": X, "Y": Y, "Z": Z, "ROLL": ROLL, "PITCH": PITCH, "YAW": YAW}
+
+WING_PANEL = Template(wing_panel_sexprs, names=["w", "f_name"],
+                      numbers=["u_x", "v_x", "w_x", "u_z", "v_z", "w_z", "alphamax", "clmax",
+                               "tau_f", "propwash", "downwash"])
+
+class Wing_Panel(FDM_Element):
+    """A generic wing panel.
+
+    Its functions are stamped from WING_PANEL, so building many panels parses
+    the texts once rather than once per panel."""
+    def __init__(self, 
+                 name: str,
+                 unit: Literal["FT", "M"],
+                 x: float, y: float, z: float,
+                 u_z: float, v_z: float, w_z: float,
+                 u_x: float, v_x: float, w_x: float,
+                 a: float, clmax: float, k: float, cd0: float,
+                 S: float,
+                 f_name: Literal["right-aileron", "left-aileron", "rudder", "elevator"] | None, 
+                 tau_f: float | None,
+                 propwash: float | None, 
+                 downwash: float | None
+                 ):
+        super().__init__()
+        self.name = w = name
+        if unit == "M":
+            x = x * m2ft
+            y = y * m2ft
+            z = z * m2ft
+            S = S * m2ft**2
+        # geometry in FT, for sizing other elements
+        self.x, self.y, self.z, self.S = x, y, z, S
+        # Normalize normal vectors
+        len_x_norm = (u_x**2 + w_x**2 + v_x**2)**0.5
+        u_x = u_x / len_x_norm; v_x = v_x / len_x_norm; w_x = w_x / len_x_norm
+        len_z_norm = (u_z**2 + w_z**2 + v_z**2)**0.5
+        u_z = u_z / len_z_norm; v_z = v_z / len_z_norm; w_z = w_z / len_z_norm
+        alphamax = clmax / a
+        constants = Constants()
+        functions = Functions()
+        # body positions
+        constants[f"aero/quantity/x_{w}-ft"] = x
+        constants[f"aero/quantity/y_{w}-ft"] = y
+        constants[f"aero/quantity/z_{w}-ft"] = z
+        constants[f"aero/coefficients/CD0_{w}"] = cd0
+        constants[f"aero/coefficients/k_{w}"] = k
+        constants[f"aero/metrics/S_{w}-sqft"] = S
+        stamped = WING_PANEL.stamp(w=w, f_name=f_name, u_x=u_x, v_x=v_x, w_x=w_x,
+                                   u_z=u_z, v_z=v_z, w_z=w_z, alphamax=alphamax, clmax=clmax,
+                                   tau_f=tau_f, propwash=propwash, downwash=downwash)
+        for target, items in stamped.items():
+            element = functions if target == "functions" else self.axis(target)
+            for key, value in items.items():
+                element[key] = value
         self.constants = constants
         self.functions = functions
 
@@ -262,12 +384,214 @@ class Wing_Panel(FDM_Element):
         self.constants.add_to(root)
         self.functions.add_to(root)
 
+# body velocities and rates the velocity of a strip is a linear combination of,
+# with the propeller induced velocity (body x) and the wing downwash (body z)
+BODY_VELOCITIES = ["velocities/u-aero-fps", "velocities/v-aero-fps", "velocities/w-aero-fps",
+                   "velocities/p-aero-rad_sec", "velocities/q-aero-rad_sec", "velocities/r-aero-rad_sec"]
+
+def wing_strip_sexprs(s: str, wing: str, f_name: str | None,
+                      cu: float, cv: float, cw: float, cp: float, cq: float, cr: float,
+                      nu: float, nv: float, nw: float, np_: float, nq: float, nr: float,
+                      c_prop: float | None, n_prop: float | None,
+                      c_down: float | None, n_down: float | None,
+                      half_S: float, tau_f: float | None, alphamax: float, clmax: float) -> dict:
+    "The sexpr texts of one strip of a Wing."
+    u, v, w, p, q, r = BODY_VELOCITIES
+    prop = "" if c_prop is None else f"\n   (* {c_prop} propulsion/engine/prop-induced-velocity_fps)"
+    down = "" if c_down is None else f"\n   (* {c_down} aero/velocities/wing-zi-fps)"
+    functions = {}
+    # chordwise and normal velocity (strip frame): the local velocity v + omega x r,
+    # projected on the chord and normal directions
+    functions[f"aero/velocities/U_{s}_wf-fps"] = f"""
+(+ (* {cu} {u})
+   (* {cv} {v})
+   (* {cw} {w})
+   (* {cp} {p})
+   (* {cq} {q})
+   (* {cr} {r}){prop}{down})
+"""
+    prop = "" if n_prop is None else f"\n   (* {n_prop} propulsion/engine/prop-induced-velocity_fps)"
+    down = "" if n_down is None else f"\n   (* {n_down} aero/velocities/wing-zi-fps)"
+    functions[f"aero/velocities/W_{s}_wf-fps"] = f"""
+(+ (* {nu} {u})
+   (* {nv} {v})
+   (* {nw} {w})
+   (* {np_} {p})
+   (* {nq} {q})
+   (* {nr} {r}){prop}{down})
+"""
+    flap = "" if f_name is None else f"\n   (* {tau_f} fcs/{f_name}-pos-rad)"
+    functions[f"aero/calculated/alpha_{s}-rad"] = f"""
+(+ (atan2 aero/velocities/W_{s}_wf-fps
+          aero/velocities/U_{s}_wf-fps){flap})
+"""
+    functions[f"aero/coefficients/CL_{s}"] = f"""
+(table aero/table/CL_{s}_alpha
+  (row aero/calculated/alpha_{s}-rad)
+  [-1.57 0,
+  {-alphamax} {-clmax},
+  {alphamax} {clmax},
+  1.57 0])"""
+    functions[f"aero/coefficients/CD-sep_{s}"] = f"""
+(table aero/table/CD-sep_{s}_alpha
+    (row aero/calculated/alpha_{s}-rad)
+    [-1.57 1,
+    {-alphamax} 0,
+    {alphamax} 0,
+    1.57 1])"""
+    functions[f"aero/coefficients/CD_{s}"] = f"""
+(+ aero/coefficients/CD0_{wing}
+   (* aero/coefficients/k_{wing}
+      (pow aero/coefficients/CL_{s} 2))
+   aero/coefficients/CD-sep_{s})
+"""
+    # 0.5 rho S V: lift and drag resolved along the local flow without trigonometry,
+    # as qbar S sin(alpha) = 0.5 rho S V W
+    functions[f"aero/calculated/half-rhoSV_{s}"] = f"""
+(* {half_S}
+   atmosphere/rho-slugs_ft3
+   (pow (+ (pow aero/velocities/U_{s}_wf-fps 2)
+           (pow aero/velocities/W_{s}_wf-fps 2))
+        0.5))
+"""
+    functions[f"aero/forces/X_{s}_wf-lb"] = f"""
+(* aero/calculated/half-rhoSV_{s}
+   (+ (* aero/coefficients/CL_{s}
+         aero/velocities/W_{s}_wf-fps)
+      (* -1.0 aero/coefficients/CD_{s}
+         aero/velocities/U_{s}_wf-fps)))
+"""
+    functions[f"aero/forces/Z_{s}_wf-lb"] = f"""
+(* -1.0 aero/calculated/half-rhoSV_{s}
+   (+ (* aero/coefficients/CL_{s}
+         aero/velocities/U_{s}_wf-fps)
+      (* aero/coefficients/CD_{s}
+         aero/velocities/W_{s}_wf-fps)))
+"""
+    return {"functions": functions}
+
+WING_STRIP = Template(wing_strip_sexprs, names=["s", "wing", "f_name"],
+                      numbers=["cu", "cv", "cw", "cp", "cq", "cr", "nu", "nv", "nw", "np_", "nq", "nr",
+                               "c_prop", "n_prop", "c_down", "n_down", "half_S", "tau_f",
+                               "alphamax", "clmax"])
+
+def linear_sum(terms) -> str:
+    "A sexpr sum of (coefficient, property) terms, leaving out zero coefficients."
+    products = [f"(* {float(c)} {p})" for c, p in terms if c != 0]
+    if not products:
+        return "0.0"
+    return "(+ " + "\n   ".join(products) + ")"
+
+class Wing(FDM_Element):
+    """A trapezoidal wing half, divided into spanwise strips.
+
+    x, y, z: leading edge of the root chord; side: which way the span runs
+    (left is -y). sweep (leading edge), dihedral, incidence (root) and twist
+    (tip relative to root) are in degrees; twist varies linearly along the
+    span. controls: {f_name: (start, end, tau_f)}, the spanwise fractions a
+    control surface covers; a strip whose centre lies within takes it.
+
+    The strip geometry is computed with numpy and folded into the coefficients
+    of each strip's velocity (a linear combination of the body velocities and
+    rates) and of one force and one moment sum per axis, so a strip adds about
+    nine functions and no constants. Compile with fold=True to drop the zero
+    terms of a flat wing.
+
+    Lift and drag are resolved along the local flow (W/V, U/V). Wing_Panel
+    resolves them at its alpha including a control surface's delta-alpha, so
+    a one-strip Wing matches the equivalent panel only with the surface at
+    zero deflection."""
+    def __init__(self,
+                 name: str,
+                 unit: Literal["FT", "M"],
+                 x: float, y: float, z: float,
+                 root_chord: float, tip_chord: float, span: float,
+                 a: float, clmax: float, k: float, cd0: float,
+                 side: Literal["left", "right"] = "right",
+                 strips: int = 8,
+                 sweep: float = 0.0, dihedral: float = 0.0,
+                 incidence: float = 0.0, twist: float = 0.0,
+                 controls: dict | None = None,
+                 propwash: float | None = None,
+                 downwash: float | None = None):
+        import numpy as np
+        super().__init__()
+        self.name = name
+        if unit == "M":
+            x, y, z = x * m2ft, y * m2ft, z * m2ft
+            root_chord, tip_chord, span = root_chord * m2ft, tip_chord * m2ft, span * m2ft
+        sign = 1.0 if side == "right" else -1.0
+        eta = (np.arange(strips) + 0.5) / strips
+        chord = root_chord + (tip_chord - root_chord) * eta
+        dihedral_rad = np.radians(dihedral)
+        S = chord * span / strips / np.cos(dihedral_rad)
+        # quarter chord points
+        position = np.stack([x - eta * span * np.tan(np.radians(sweep)) - chord / 4,
+                             y + sign * eta * span,
+                             z - eta * span * np.tan(dihedral_rad)], axis=1)
+        # chord and normal directions: pitched up by the incidence, then rolled by the dihedral
+        theta = np.radians(incidence + twist * eta)
+        phi = -sign * dihedral_rad
+        chord_dir = np.stack([np.cos(theta), np.sin(theta) * np.sin(phi), -np.sin(theta) * np.cos(phi)], axis=1)
+        normal_dir = np.stack([np.sin(theta), -np.cos(theta) * np.sin(phi), np.cos(theta) * np.cos(phi)], axis=1)
+        # U_wf = c . (v + omega x r) = c . v + (r x c) . omega
+        chord_rates = np.cross(position, chord_dir)
+        normal_rates = np.cross(position, normal_dir)
+        # geometry in FT, for sizing other elements
+        self.S = float(S.sum())
+        self.x, self.y, self.z = (float(v) for v in S @ position / self.S)
+        self.strips = [f"{name}{i}" for i in range(strips)]
+        alphamax = clmax / a
+
+        constants = Constants()
+        constants[f"aero/coefficients/CD0_{name}"] = cd0
+        constants[f"aero/coefficients/k_{name}"] = k
+        functions = Functions()
+        for i, s in enumerate(self.strips):
+            f_name, tau_f = None, None
+            for control, (start, end, tau) in (controls or {}).items():
+                if start <= eta[i] <= end:
+                    f_name, tau_f = control, tau
+                    break
+            c, n = chord_dir[i], normal_dir[i]
+            stamped = WING_STRIP.stamp(
+                s=s, wing=name, f_name=f_name,
+                cu=float(c[0]), cv=float(c[1]), cw=float(c[2]),
+                cp=float(chord_rates[i, 0]), cq=float(chord_rates[i, 1]), cr=float(chord_rates[i, 2]),
+                nu=float(n[0]), nv=float(n[1]), nw=float(n[2]),
+                np_=float(normal_rates[i, 0]), nq=float(normal_rates[i, 1]), nr=float(normal_rates[i, 2]),
+                c_prop=None if propwash is None else float(c[0] * propwash),
+                n_prop=None if propwash is None else float(n[0] * propwash),
+                c_down=None if downwash is None else float(-c[2] * downwash),
+                n_down=None if downwash is None else float(-n[2] * downwash),
+                half_S=float(0.5 * S[i]), tau_f=tau_f, alphamax=alphamax, clmax=clmax)
+            for key, value in stamped["functions"].items():
+                functions[key] = value
+        # area weighted lift coefficient, e.g. for downwash models
+        functions[f"aero/coefficients/CL_{name}"] = linear_sum(
+            (S[i] / self.S, f"aero/coefficients/CL_{s}") for i, s in enumerate(self.strips))
+        X_wf = [f"aero/forces/X_{s}_wf-lb" for s in self.strips]
+        Z_wf = [f"aero/forces/Z_{s}_wf-lb" for s in self.strips]
+        # body forces c X_wf + n Z_wf and moments (r x c) X_wf + (r x n) Z_wf, summed over the strips
+        for j, (force, moment) in enumerate([("X", "ROLL"), ("Y", "PITCH"), ("Z", "YAW")]):
+            self.axis(force)[f"aero/forces/{force}_{name}-lb"] = linear_sum(
+                [*zip(chord_dir[:, j], X_wf), *zip(normal_dir[:, j], Z_wf)])
+            self.axis(moment)[f"aero/moments/{'LMN'[j]}_{name}-ftlb"] = linear_sum(
+                [*zip(chord_rates[:, j], X_wf), *zip(normal_rates[:, j], Z_wf)])
+        self.constants = constants
+        self.functions = functions
+
+    def add_to(self, root):
+        self.constants.add_to(root)
+        self.functions.add_to(root)
+
 class Fuselage(Functions):
     def __init__(self, unit: Literal["FT", "M"],
                  x: float, y: float, z: float, 
                  X_uu: float, Y_vv: float, Z_ww: float,
                  propwash: float = 0.0):
         super().__init__()
+        X, Y, Z, ROLL, PITCH, YAW = (self.axis(a) for a in AXES)
         self["aero/velocities/fus-u-fps"] = f"""
 (+ velocities/u-aero-fps
    (* {propwash} propulsion/engine/prop-induced-velocity_fps))
@@ -313,13 +637,73 @@ class Fuselage(Functions):
 """
         
 
-def compile_xml(elements):
-    root = ET.Element("aerodynamics")
-    for element in elements:
-        element.add_to(root)
-    for axis in [X, Y, Z, ROLL, PITCH, YAW]:
-        axis.add_to(root)
-    return root
+class Aircraft:
+    """An aerodynamic model: its elements and the axes they contribute to.
+
+    Each aircraft owns its axes, so any number of them can be built and
+    compiled in one process."""
+    def __init__(self, *elements: FDM_Element):
+        self.elements = []
+        self.axes = {name: Axis(name) for name in AXES}
+        self.add(*elements)
+
+    def __getitem__(self, name: Literal["X", "Y", "Z", "ROLL", "PITCH", "YAW"]) -> Axis:
+        return self.axes[name]
+
+    def add(self, *elements: FDM_Element):
+        for element in elements:
+            self.elements.append(element)
+            for name, axis in element.axes.items():
+                for key, value in axis._dictionary.items():
+                    self.axes[name][key] = value
+
+    def compile(self, cse: bool = False, fold: bool = False, exported=(),
+                derivatives=()) -> ET.Element:
+        """Build the <aerodynamics> element.
+
+        fold: fold constants and drop functions no axis or `exported` property
+        pattern depends on. derivatives: variables to add analytic derivatives
+        for (see differentiate_xml), e.g. ["alpha", "q"] or ["all"].
+        cse: share repeated subexpressions."""
+        root = ET.Element("aerodynamics")
+        root.extend(self.iter_elements())
+        if fold:
+            from optimize_xml import fold_constants, eliminate_dead_properties
+            fold_constants(root)
+            eliminate_dead_properties(root, exported)
+        if derivatives:
+            from differentiate_xml import differentiate
+            differentiate(root, derivatives)
+        if cse:
+            from optimize_xml import eliminate_common_subexpressions
+            eliminate_common_subexpressions(root)
+        return root
+
+    def iter_elements(self):
+        "Yield the top-level elements of the model as each of its parts is built."
+        # fresh context, so tables named in one build do not clash with the next
+        with compiling():
+            for element in [*self.elements, *(self.axes[name] for name in AXES)]:
+                part = ET.Element("aerodynamics")
+                element.add_to(part)
+                yield from part
+
+    def write(self, out, pretty: bool = True, cse: bool = False, fold: bool = False, exported=(),
+              derivatives=()):
+        """Write the model to the text stream out with xml_writer, part by part.
+
+        The options are those of compile; the passes need the whole tree, so
+        with them the output starts once the model is compiled."""
+        from xml_writer import XMLWriter
+        with XMLWriter(out, pretty) as writer:
+            if cse or fold or derivatives:
+                writer.write_all(self.compile(cse=cse, fold=fold, exported=exported,
+                                              derivatives=derivatives))
+            else:
+                writer.write_all(self.iter_elements())
+
+def compile_xml(elements, cse: bool = False, fold: bool = False, exported=()):
+    return Aircraft(*elements).compile(cse=cse, fold=fold, exported=exported)
 
 def print_xml(root) -> str:
     ET.indent(root, space="  ")
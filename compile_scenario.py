@@ -0,0 +1,374 @@
+# Compile test scenarios to JSBSim scripts
+# A scenario describes a manoeuvre in the sexpr syntax: initial conditions and
+# events whose actions step, ramp or doublet control inputs. It compiles to a
+# <runscript> and the <initialize> file it uses, so JSBSim runs the whole
+# manoeuvre natively instead of Python setting inputs at every step.
+#
+# (scenario "Rudder kick, steady heading sideslip"
+#   (aircraft EvenFlow)
+#   (initialize (altitude 1000) (vc 20) (gamma 0) (running -1))  ; ft, kts, deg
+#   (run (end 20) (dt 0.01))
+#   (event "Trim" (when (at 0)) (trim))
+#   (event "Kick" (when (at 1))
+#     (ramp fcs/rudder-cmd-norm 0.5 4)        ; to 0.5 over 4 s
+#     (step fcs/aileron-cmd-norm (delta 0.1)))  ; relative to the value at the event
+#   (event "Pitch doublet" (when (and (at 10) (> aero/qbar-psf 1)))
+#     (doublet fcs/elevator-cmd-norm 0.2 0.5)))  ; +0.2 for 0.5 s, -0.2 for 0.5 s
+#
+# Conditions compare properties and values with < <= > >= == !=, combined with
+# and/or; (at t) is simulation time >= t. Events take the flags persistent and
+# continuous and a (delay t). A doublet is made of delta steps, so it returns
+# to the value the input had before it; its later legs are delayed copies of
+# the event, written before it.
+
+import copy
+import os
+import re
+import shutil
+import xml.etree.ElementTree as ET
+
+import typer
+
+from sexpr_parser import Parser, SexprError, SCI_REAL, PROPERTY, DOCSTRING
+
+TIME = "simulation/sim-time-sec"
+
+# initialize file elements and their units
+INITIALIZE = {
+    "ubody": "FT/SEC", "vbody": "FT/SEC", "wbody": "FT/SEC",
+    "vc": "KTS", "vt": "FT/SEC", "mach": None, "roc": "FT/SEC",
+    "latitude": "DEG", "longitude": "DEG", "altitude": "FT", "elevation": "FT",
+    "phi": "DEG", "theta": "DEG", "psi": "DEG",
+    "alpha": "DEG", "beta": "DEG", "gamma": "DEG",
+    "winddir": "DEG", "vwind": "FT/SEC", "hwind": "FT/SEC",
+    "running": None,
+}
+
+COMPARISONS = {"<": "lt", "<=": "le", ">": "gt", ">=": "ge", "==": "eq", "!=": "ne"}
+# the same comparison with its operands swapped
+MIRRORED = {"lt": "gt", "le": "ge", "gt": "lt", "ge": "le", "eq": "eq", "ne": "ne"}
+
+COMPARISON = re.compile("<=|>=|==|!=|<|>")
+# unlike in aerodynamics files, integers may be signed: (running -1)
+INTEGER = re.compile(r"[+-]?\d+")
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_\-]*")
+
+# set actions by name: (JSBSim action, takes a time constant)
+SETS = {"set": ("FG_STEP", False), "step": ("FG_STEP", False),
+        "ramp": ("FG_RAMP", True), "exp": ("FG_EXP", True)}
+
+class ScenarioParser(Parser):
+    "Parser for scenario files, on the scanner of the sexpr parser."
+    def scenario(self) -> tuple[ET.Element, ET.Element]:
+        "The <runscript> and <initialize> elements of the scenario."
+        comments = []
+        while self.peek() == ";":
+            comments.append(self.comment())
+        start = self.pos
+        if not self.keyword_after_lpar("scenario"):
+            raise self.error("Expected (scenario ...)")
+        name = self.string() or "scenario"
+        script = ET.Element("runscript", name=name)
+        script.extend(comments)
+        ET.SubElement(script, "description").text = name
+        use = ET.SubElement(script, "use")
+        run = None
+        initialize = ET.Element("initialize", name=name)
+        events = []
+        while self.peek() not in (")", ""):
+            if self.peek() == ";":
+                events.append(self.comment())
+                continue
+            clause_start = self.pos
+            self.expect_lpar()
+            clause = self.expect(WORD, "scenario clause")
+            if clause == "aircraft":
+                use.set("aircraft", self.expect(PROPERTY, "aircraft name"))
+            elif clause == "initialize":
+                self.initialize(initialize)
+            elif clause == "run":
+                run = self.keywords({"start", "end", "dt"})
+            elif clause == "property":
+                prop = self.expect(PROPERTY, "property")
+                events.append(self.element("property", prop, value=_format(self.number())))
+            elif clause == "event":
+                events.extend(self.event())
+                continue
+            else:
+                raise self.error(f"Unknown scenario clause {clause!r}", clause_start)
+            self.expect_rpar()
+        self.expect_rpar()
+        if "aircraft" not in use.attrib:
+            raise self.error("Scenario has no (aircraft ...)", start)
+        if run is None or "end" not in run:
+            raise self.error("Scenario has no (run (end ...))", start)
+        use.set("initialize", initialize.get("name"))
+        run_element = ET.SubElement(script, "run", start=_format(run.get("start", 0)),
+                                    end=_format(run["end"]), dt=_format(run.get("dt", 1 / 120)))
+        run_element.extend(events)
+        return script, initialize
+
+    # Tokens
+
+    def expect_lpar(self):
+        if not self.literal("("):
+            raise self.error("Expected '('")
+
+    def string(self) -> str | None:
+        token = self.match(DOCSTRING)
+        return None if token is None else token[1:-1]
+
+    def number(self) -> float:
+        token = self.match(SCI_REAL) or self.match(INTEGER)
+        if token is None:
+            raise self.error("Expected a number")
+        return float(token)
+
+    def element(self, tag: str, text: str, **attributes) -> ET.Element:
+        e = ET.Element(tag, {k: v for k, v in attributes.items() if v is not None})
+        e.text = f" {text} "
+        return e
+
+    def keywords(self, allowed: set) -> dict:
+        "(key number) pairs up to the closing parenthesis."
+        values = {}
+        while self.peek() == "(":
+            self.expect_lpar()
+            key_start = self.pos
+            key = self.expect(WORD, "keyword")
+            if key not in allowed:
+                raise self.error(f"Unknown keyword {key!r}, expected one of {sorted(allowed)}", key_start)
+            values[key] = self.number()
+            self.expect_rpar()
+        return values
+
+    # Clauses
+
+    def initialize(self, initialize: ET.Element):
+        for key, value in self.keywords(set(INITIALIZE)).items():
+            e = self.element(key, _format(value))
+            if INITIALIZE[key] is not None:
+                e.set("unit", INITIALIZE[key])
+            initialize.append(e)
+
+    def event(self) -> list:
+        "An event, after the delayed copies that carry the later legs of its doublets."
+        event_start = self.pos
+        name = self.string()
+        if name is None:
+            raise self.error("Expected event name")
+        flags = {}
+        while (flag := self.match(re.compile("persistent|continuous"))) is not None:
+            flags[flag] = "true"
+        event = ET.Element("event", name=name, **flags)
+        condition = None
+        delay = 0.0
+        legs = []
+        actions = []
+        while self.peek() not in (")", ""):
+            if self.peek() == ";":
+                actions.append(self.comment())
+                continue
+            action_start = self.pos
+            self.expect_lpar()
+            action = self.expect(WORD, "event clause")
+            if action == "when":
+                condition = self.condition()
+                if condition.tag != "condition":
+                    condition = _wrap(condition)
+            elif action == "delay":
+                delay = self.number()
+            elif action in SETS:
+                actions.append(self.set(action))
+            elif action == "doublet":
+                prop = self.expect(PROPERTY, "property")
+                amplitude, width = self.number(), self.number()
+                actions.append(_delta(prop, amplitude))
+                legs.append((width, _delta(prop, -amplitude)))
+                legs.append((2 * width, _delta(prop, 0)))
+            elif action == "notify":
+                notify = ET.Element("notify")
+                while self.peek() != ")":
+                    notify.append(self.element("property", self.expect(PROPERTY, "property")))
+                actions.append(notify)
+            elif action == "trim":
+                mode = self.number() if self.peek() != ")" else 1
+                actions.append(ET.Element("set", name="simulation/do_simple_trim", value=_format(mode)))
+            else:
+                raise self.error(f"Unknown event clause {action!r}", action_start)
+            self.expect_rpar()
+        self.expect_rpar()
+        if condition is None:
+            raise self.error(f"Event {name!r} has no (when ...)", event_start)
+        event.append(condition)
+        if delay:
+            event.append(self.element("delay", _format(delay)))
+        event.extend(actions)
+        # JSBSim takes a delta from the value when the event triggers, even if
+        # delayed. The legs come first, so they trigger (in the same frame as
+        # the event) before it sets anything, and are all relative to one value.
+        events = []
+        # legs starting at the same time share an event
+        for offset in sorted({offset for offset, _ in legs}):
+            leg = ET.Element("event", name=f"{name} (+{_format(offset)} s)", **flags)
+            leg.append(copy.deepcopy(condition))
+            leg.append(self.element("delay", _format(delay + offset)))
+            leg.extend(action for o, action in legs if o == offset)
+            events.append(leg)
+        events.append(event)
+        return events
+
+    def set(self, action: str) -> ET.Element:
+        kind, timed = SETS[action]
+        prop = self.expect(PROPERTY, "property")
+        attributes = {"name": prop}
+        if self.peek() == "(":
+            self.expect_lpar()
+            self.expect(re.compile("delta"), "delta")
+            attributes["type"] = "FG_DELTA"
+            attributes["value"] = _format(self.number())
+            self.expect_rpar()
+        else:
+            attributes["value"] = _format(self.number())
+        if timed:
+            attributes["action"] = kind
+            attributes["tc"] = _format(self.number())
+        return ET.Element("set", attributes)
+
+    def condition(self) -> ET.Element:
+        "A <condition>, or a bare test line (a <test> placeholder) for comparisons."
+        start = self.pos
+        self.expect_lpar()
+        logic = self.match(re.compile(r"and\b|or\b|at\b"))
+        if logic == "at":
+            t = self.number()
+            self.expect_rpar()
+            return self.element("test", f"{TIME} ge {_format(t)}")
+        if logic is not None:
+            condition = ET.Element("condition", logic=logic.upper())
+            while self.peek() == "(":
+                condition.append(self.condition())
+            self.expect_rpar()
+            if len(condition) == 0:
+                raise self.error(f"Empty ({logic} ...)", start)
+            return _flatten(condition)
+        op = COMPARISONS[self.expect(COMPARISON, "and, or, at or a comparison")]
+        left, left_is_property = self.operand()
+        right, right_is_property = self.operand()
+        self.expect_rpar()
+        if not left_is_property:
+            if not right_is_property:
+                raise self.error("A comparison needs a property", start)
+            # JSBSim reads a property on the left of a test
+            left, right, op = right, left, MIRRORED[op]
+        return self.element("test", f"{left} {op} {right}")
+
+    def operand(self) -> tuple[str, bool]:
+        token = self.match(SCI_REAL) or self.match(INTEGER)
+        if token is not None:
+            return _format(float(token)), False
+        return self.expect(PROPERTY, "property or value"), True
+
+def _format(value: float) -> str:
+    return f"{value:g}" if value == int(value) else repr(float(value))
+
+def _delta(prop: str, value: float) -> ET.Element:
+    return ET.Element("set", name=prop, type="FG_DELTA", value=_format(value))
+
+def _wrap(test: ET.Element) -> ET.Element:
+    condition = ET.Element("condition")
+    condition.text = test.text
+    return condition
+
+def _flatten(condition: ET.Element) -> ET.Element:
+    """JSBSim conditions hold test lines in their text and nested conditions as children.
+
+    Tests become lines of the text; and/or sub-conditions stay nested."""
+    tests = [child.text.strip() for child in condition if child.tag == "test"]
+    nested = [child for child in condition if child.tag == "condition"]
+    for child in list(condition):
+        condition.remove(child)
+    if tests:
+        condition.text = "\n" + "\n".join(tests) + "\n"
+    condition.extend(nested)
+    return condition
+
+def compile_scenario(text: str) -> tuple[ET.Element, ET.Element]:
+    "The <runscript> and <initialize> elements of a scenario's source text."
+    parser = ScenarioParser(text)
+    script, initialize = parser.scenario()
+    if parser.peek() != "":
+        raise parser.error("Unexpected text after the scenario")
+    return script, initialize
+
+def write_scenario(file: str, script_dir: str, aircraft_dir: str) -> tuple[str, str]:
+    """Compile a scenario file, writing the script to script_dir and its
+    initialize file to aircraft_dir, where JSBSim looks for it. Returns both paths."""
+    with open(file) as f:
+        script, initialize = compile_scenario(f.read())
+    base = os.path.splitext(os.path.basename(file))[0]
+    initialize_name = f"{base}-init"
+    script.find("use").set("initialize", initialize_name)
+    paths = (os.path.join(script_dir, f"{base}.xml"), os.path.join(aircraft_dir, f"{initialize_name}.xml"))
+    for element, path in zip((script, initialize), paths):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        ET.indent(element, space="  ")
+        with open(path, "w") as f:
+            f.write('<?xml version="1.0"?>\n' + ET.tostring(element, encoding="unicode") + "\n")
+    return paths
+
+def run_scenario(file: str, root: str | None = None, recorder_channels: dict | None = None):
+    """Run a scenario on the staged EvenFlow model until its end time.
+
+    Returns the executive and, with recorder_channels (column name to
+    property), a recorder.Recorder holding every step, otherwise None. Without
+    a root, one is staged for the run and removed after it."""
+    from fdm_utils import stage_aircraft, AIRCRAFT_NAME
+    import jsbsim
+    staged = root is None
+    root = stage_aircraft(root)
+    try:
+        script, _ = write_scenario(file, os.path.join(root, "scripts"),
+                                   os.path.join(root, "aircraft", AIRCRAFT_NAME))
+        jsbsim.FGJSBBase().debug_lvl = 0
+        fdm = jsbsim.FGFDMExec(root)
+        fdm.load_script(script)
+        fdm.run_ic()
+        recorder = None
+        if recorder_channels is None:
+            while fdm.run():
+                pass
+        else:
+            from recorder import Recorder
+            run = ET.parse(script).find("run")
+            steps = int(round((float(run.get("end")) - float(run.get("start"))) / float(run.get("dt"))))
+            recorder = Recorder(fdm, recorder_channels, steps)
+            while fdm.run():
+                recorder.record()
+    finally:
+        if staged:
+            shutil.rmtree(root, ignore_errors=True)
+    return fdm, recorder
+
+app = typer.Typer()
+
+@app.command()
+def compile(file: str, script_dir: str = "scripts", aircraft_dir: str = "EvenFlow"):
+    "Compile FILE to SCRIPT_DIR/<name>.xml and AIRCRAFT_DIR/<name>-init.xml."
+    try:
+        paths = write_scenario(file, script_dir, aircraft_dir)
+    except SexprError as e:
+        typer.echo(f"{file}: {e}", err=True)
+        raise typer.Exit(1)
+    typer.echo("\n".join(paths))
+
+@app.command()
+def run(file: str):
+    "Run FILE on the EvenFlow model and print the final state."
+    fdm, _ = run_scenario(file)
+    for prop in ["simulation/sim-time-sec", "position/h-sl-ft", "velocities/vc-kts",
+                 "aero/alpha-deg", "aero/beta-deg", "attitude/phi-deg"]:
+        typer.echo(f"{prop}: {fdm[prop]:.4f}")
+
+if __name__ == "__main__":
+    app()
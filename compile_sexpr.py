@@ -1,195 +1,176 @@
-import typer
-from pyparsing import *
+# Compiler for the sexpr language to JSBSim aerodynamics XML
+# Heavy modules are imported where they are used: pyparsing and its grammar
+# for the pyparsing backend only, numpy (differentiate_xml) for derivatives,
+# typer for the command line, so scripts importing the compiler start fast.
+
+import os
+import shutil
+import sys
+import time
+from enum import Enum
 import xml.etree.ElementTree as ET
-from tabulate import tabulate
-
-OPS = {
-    '+': 'sum',
-    '-': 'difference',
-    '*': 'product',
-    '/': 'quotient',
-    'pow': 'pow',
-    'exp': 'exp',
-    'abs': 'abs',
-    'sin': 'sin',
-    'cos': 'cos',
-    'tan': 'tan',
-    'asin': 'asin',
-    'acos': 'acos',
-    'atan': 'atan',
-    'atan2': 'atan2',
-    'min': 'min',
-    'max': 'max',
-    'avg': 'avg',
-    'fraction': 'fraction',
-    'mod': 'mod',
-    'random': 'random',
-    'integer': 'integer'
+import sexpr_parser
+import sexpr_cache
+from sexpr_parser import CompileContext, compiling
+from optimize_xml import eliminate_common_subexpressions, fold_constants, eliminate_dead_properties
+
+# names of the pyparsing grammar, which this module defined before it moved to
+# sexpr_grammar; they are forwarded there, building the grammar on first use
+GRAMMAR_NAMES = {
+    "AXIS_TITLES", "LBRA", "LPAR", "OPS", "RBRA", "RPAR", "axis", "axis_title", "axis_xml",
+    "comment", "comment_xml", "docstring", "first_row", "function", "function_xml",
+    "handle_operation", "op", "property", "property_notag", "property_xml", "sexp", "sexpList",
+    "sexpList_xml", "spec", "string", "table", "table_data", "table_data_xml", "table_entry",
+    "table_index", "table_index_id", "table_index_xml", "table_row", "table_xml", "value",
+    "value_notag", "value_xml",
 }
 
-property_set = set()
-property_defined = set()
-
-LPAR = Literal("(").suppress()
-RPAR = Literal(")").suppress()
-LBRA = Literal("[").suppress()
-RBRA = Literal("]").suppress()
-
-
-comment = Combine(Literal(";") + rest_of_line)
-def comment_xml(toks: ParseResults) -> ET.Element:
-    return ET.Comment(toks[0][1:].strip())  # Remove leading semicolon
-comment.set_parse_action(comment_xml)
-
-property = Word(alphanums + "/[]-_")
-property_notag = Word(alphanums + "/[]-_")
-def property_xml(toks: ParseResults) -> ET.Element:
-    property_set.add(toks[0])
-    property_element = ET.Element("property")
-    property_element.text = f" {toks[0]} "
-    return property_element
-property.set_parse_action(property_xml)
-
-value = common.sci_real | common.integer
-value_notag = common.sci_real | common.integer
-def value_xml(toks: ParseResults) -> ET.Element:
-    value_element = ET.Element("value")
-    value_element.text = f" {toks[0]} "
-    return value_element
-value.set_parse_action(value_xml)
-
-table_entry = value_notag | '""'
-table_row = Forward()
-def define_col_number(toks):
-    nbcol = len(toks[0])
-    table_row << Group(table_entry * nbcol + Optional(Literal(",").suppress()))
-first_row = Group(OneOrMore(table_entry) + Literal(",").suppress()).set_parse_action(define_col_number)
-
-table_data = (LBRA
-                + first_row
-                + ZeroOrMore(table_row)
-                + RBRA)
-
-def table_data_xml(str, loc, toks):
-    table_data_element = ET.Element("tableData")
-    array = toks.as_list()
-    if array[0][0] == '""':
-        array[0][0] = None
-    tabular = tabulate(array, tablefmt="plain", disable_numparse=True )
-    table_data_element.text = f" \n{tabular}\n "
-    return table_data_element
-table_data.set_parse_action(table_data_xml)
-
-table_index_id = one_of("row column")
-table_index = (LPAR
-                + table_index_id("index")
-                + property_notag("property")
-                + RPAR)
-def table_index_xml(toks):
-    index_element = ET.Element("independentVar")
-    index_element.set("lookup", toks.index)
-    property_set.add(toks.property)
-    index_element.text = f" {toks.property} "
-    return index_element
-table_index.set_parse_action(table_index_xml)
-
-table = (LPAR
-            + "table"
-            + Optional(property_notag("name"))
-            + table_index[1,2]("index")
-            + table_data("data")
-            + RPAR)
-def table_xml(str, loc, toks):
-    table_element = ET.Element("table")
-    if getattr(toks, "name"):
-        if toks.name in property_defined:
-            raise ParseFatalException(str, loc, toks.name + " already defined")
-        property_defined.add(toks.name)
-        property_set.add(toks.name)
-        table_element.set("name", toks.name)
-    for index_element in toks.index:
-        table_element.append(index_element)
-    table_element.append(toks.data)
-    return table_element
-table.set_parse_action(table_xml)
-
-
-string = comment | table | value | property
-
-def handle_operation(toks: ParseResults) -> ET.Element:
-    op_name = toks[0]
-    e = ET.Element(op_name)
-    # Add all children to the operation element
-    for child in toks[1:]:
-        if isinstance(child, ET.Element):
-            e.append(child)
-    return e
-
-op = one_of(OPS.keys()).set_parse_action(lambda toks: OPS[toks[0]])
-
-sexp = Forward()
-def sexpList_xml(toks: ParseResults) -> ET.Element:
-    op_element = handle_operation(toks)
-    return op_element
-sexpList = (LPAR + op + sexp[...] + RPAR).set_parse_action(sexpList_xml)
-sexp <<= string | sexpList
-
-docstring = dbl_quoted_string.set_parse_action(removeQuotes)
-
-def function_xml(str, loc, toks: ParseResults) -> ET.Element:
-    fn_element = ET.Element("function")
-    if toks.name in property_defined:
-        raise ParseFatalException(str, loc, toks.name + " already defined")
-    property_defined.add(toks.name)
-    property_set.add(toks.name)
-    fn_element.set('name', toks.name)
-    
-    if getattr(toks, "docstring"):
-        # Add docstring as comment
-        description_element = ET.Element("description")
-        description_element.text = toks.docstring
-        fn_element.append(description_element)
-        
-    for child in toks.body:
-        if isinstance(child, ET.Element):
-            fn_element.append(child)
-    
-    return fn_element
+def __getattr__(name: str):
+    if name == "app":
+        return make_app()
+    if name in GRAMMAR_NAMES:
+        import sexpr_grammar
+        return getattr(sexpr_grammar, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-function = (LPAR 
-           + "def" 
-           + Optional(docstring("docstring")) 
-           + property_notag("name") 
-           + sexp[1,...]("body") 
-           + RPAR).set_parse_action(function_xml)
+def _pyparsing_errors(*names: str) -> tuple:
+    """pyparsing exception classes, for except clauses. Only the pyparsing
+    backend raises them, so there are none until it has been imported."""
+    pyparsing = sys.modules.get("pyparsing")
+    return tuple(getattr(pyparsing, name) for name in names) if pyparsing else ()
 
-axis_title = one_of("X Y Z AXIAL NORMAL SIDE LIFT DRAG ROLL PITCH YAW")
+class Parser(str, Enum):
+    pyparsing = "pyparsing"
+    fast = "fast"
 
-def axis_xml(toks: ParseResults) -> ET.Element:
-    axis_element = ET.Element("axis")
-    axis_element.set('name', toks.name)
-    axis_element.set('frame', "BODY")
-    
-    for child in toks.body:
-        if isinstance(child, ET.Element):
-            axis_element.append(child)
-            
-    return axis_element
-
-axis = (LPAR 
-        + "axis" 
-        + axis_title("name") 
-        + (function | comment)[...]("body") 
-        + RPAR).set_parse_action(axis_xml)
-
-spec = (function | axis | comment)[...]
-
-app = typer.Typer()
-
-@app.command()
-def compile(file: str, parse_all: bool=True):
-    # Parse the file
-    parsed = spec.parse_file(file, parse_all=parse_all)
+def parse_file(file: str, parse_all: bool=True, parser: Parser=Parser.pyparsing,
+               context: CompileContext | None = None) -> list:
+    "Parse with either backend; both produce the same elements."
+    with compiling(context) as context:
+        context.directory = os.path.dirname(file)
+        if parser == Parser.fast:
+            return sexpr_parser.parse_file(file, context, parse_all=parse_all)
+        from sexpr_grammar import spec
+        return list(spec.parse_file(file, parse_all=parse_all))
+
+def _parse_form(form: str, parser: Parser, context: CompileContext) -> list:
+    with compiling(context):
+        if parser == Parser.fast:
+            return sexpr_parser.parse_string(form, context)
+        from sexpr_grammar import spec
+        return list(spec.parse_string(form, parse_all=True))
+
+def _compile_form(text: str, offset: int, form: str, parser: Parser, directory: str = "") -> dict:
+    "A cache entry for one top-level form at `offset` of `text`."
+    context = CompileContext(directory)
+    try:
+        parsed = _parse_form(form, parser, context)
+    except (*_pyparsing_errors("ParseBaseException"), sexpr_parser.SexprError):
+        # again at its place in the file, so the error gives its line and column
+        _parse_form(sexpr_cache.padding(text, offset) + form, parser, CompileContext(directory))
+        raise
+    return {
+        "xml": [sexpr_cache.serialize(e) for e in parsed if isinstance(e, ET.Element)],
+        "defined": sorted(context.property_defined),
+        "read": sorted(context.property_set),
+        "table_files": context.table_files,
+    }
+
+def _table_files_changed(entry: dict) -> bool:
+    "Whether a table file read by a cached form has changed since."
+    for path, signature in entry.get("table_files", {}).items():
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return True
+        if [st.st_mtime_ns, st.st_size] != signature:
+            return True
+    return False
+
+def iter_file_cached(file: str, parse_all: bool=True, parser: Parser=Parser.pyparsing,
+                     context: CompileContext | None = None,
+                     cache_dir: str = sexpr_cache.CACHE_DIR):
+    """Parse like parse_file, reusing the forms cached by the last compile of file.
+
+    Yields the serialized top-level elements (see sexpr_cache) form by form.
+    Properties are recorded in `context` and duplicate definitions raise as
+    in parse_file. The cache is saved once all forms have been yielded."""
+    with open(file) as f:
+        text = f.read()
+    context = context if context is not None else CompileContext()
+    context.directory = os.path.dirname(file)
+    cache = sexpr_cache.FormCache(file, cache_dir)
+    salt = sexpr_cache.compiler_hash(parser.value)
+    for offset, form in sexpr_cache.split_forms(text):
+        key = sexpr_cache.form_key(salt, form)
+        entry = cache.get(key)
+        if entry is None or _table_files_changed(entry):
+            try:
+                entry = _compile_form(text, offset, form, parser, context.directory)
+            except _pyparsing_errors("ParseException"):
+                if parse_all:
+                    raise
+                break
+            except sexpr_parser.SexprError as e:
+                if parse_all or isinstance(e, sexpr_parser.DefinitionError):
+                    raise
+                break
+            cache.put(key, entry)
+        # definitions are checked across forms here, as the parser checks them within one
+        for name in entry["defined"]:
+            if name in context.property_defined:
+                if parser == Parser.fast:
+                    raise sexpr_parser.DefinitionError(name + " already defined", text, offset)
+                from pyparsing import ParseFatalException
+                raise ParseFatalException(text, offset, name + " already defined")
+        context.property_defined.update(entry["defined"])
+        context.property_set.update(entry["read"])
+        context.table_files.update(entry.get("table_files", {}))
+        yield from entry["xml"]
+    cache.save()
+
+def parse_file_cached(file: str, parse_all: bool=True, parser: Parser=Parser.pyparsing,
+                      context: CompileContext | None = None,
+                      cache_dir: str = sexpr_cache.CACHE_DIR) -> list[str]:
+    "The serialized top-level elements of file, as iter_file_cached yields them."
+    return list(iter_file_cached(file, parse_all=parse_all, parser=parser, context=context,
+                                 cache_dir=cache_dir))
+
+def iter_file(file: str, parse_all: bool=True, parser: Parser=Parser.pyparsing,
+              context: CompileContext | None = None):
+    """Yield the top-level elements of file as each is parsed, with either backend.
+
+    Errors locate their form in the file as parse_file's do."""
+    with open(file) as f:
+        text = f.read()
+    context = context if context is not None else CompileContext()
+    context.directory = os.path.dirname(file)
+    if parser == Parser.fast:
+        yield from sexpr_parser.Parser(text, context).iter_forms(parse_all)
+        return
+    from pyparsing import ParseBaseException, ParseException
+    for offset, form in sexpr_cache.split_forms(text):
+        try:
+            parsed = _parse_form(form, parser, context)
+        except ParseBaseException as e:
+            if not parse_all and type(e) is ParseException:
+                return
+            # located in the whole text rather than the form
+            raise type(e)(text, offset + e.loc, e.msg) from None
+        yield from (e for e in parsed if isinstance(e, ET.Element))
+
+def compile_file(file: str, parse_all: bool=True, parser: Parser=Parser.pyparsing,
+                 cse: bool=False, fold: bool=False, export: list[str] | None = None,
+                 derivatives: list[str] | None = None,
+                 context: CompileContext | None = None, cache: bool=False) -> ET.Element:
+    """Compile a sexpr model to an <aerodynamics> element.
+
+    cache: reuse the forms unchanged since the last cached compile of file."""
+    if cache:
+        parsed = sexpr_cache.elements(parse_file_cached(file, parse_all=parse_all, parser=parser,
+                                                        context=context))
+    else:
+        parsed = parse_file(file, parse_all=parse_all, parser=parser, context=context)
     
     # Create the root element
     root = ET.Element("aerodynamics")
@@ -198,21 +179,152 @@ def compile(file: str, parse_all: bool=True):
     for element in parsed:
         if isinstance(element, ET.Element):
             root.append(element)
-    
-    # Pretty print the XML
+
+    if fold:
+        # export keeps properties (or glob patterns) read outside the model
+        fold_constants(root)
+        eliminate_dead_properties(root, export or [])
+    if derivatives:
+        # e.g. ["alpha", "fcs/elevator-pos-rad"], or ["all"]
+        from differentiate_xml import differentiate
+        differentiate(root, derivatives)
+    if cse:
+        eliminate_common_subexpressions(root)
+    return root
+
+def build_python(file: str, cse: bool=False, fold: bool=False, export: list[str] | None = None,
+                 derivatives: list[str] | None = None) -> ET.Element:
+    "Run a Python model builder (a module with build() -> Aircraft, like EvenFlow.py) and compile it."
+    import importlib.util
+    directory = os.path.dirname(os.path.abspath(file))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location("_watched_model", file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.build().compile(cse=cse, fold=fold, exported=export or (), derivatives=derivatives or ())
+
+def compile_source(file: str, parser: Parser=Parser.pyparsing, cse: bool=False, fold: bool=False,
+                   export: list[str] | None = None, derivatives: list[str] | None = None,
+                   context: CompileContext | None = None) -> str:
+    """The XML text of a .sexpr model, compiled through the form cache, or of a Python builder.
+
+    context: records the properties and table files of a .sexpr model."""
+    if file.endswith(".py"):
+        return to_string(build_python(file, cse=cse, fold=fold, export=export, derivatives=derivatives))
+    if not (cse or fold or derivatives):
+        return sexpr_cache.assemble(parse_file_cached(file, parser=parser, context=context))
+    return to_string(compile_file(file, parser=parser, cse=cse, fold=fold, export=export,
+                                  derivatives=derivatives, context=context, cache=True))
+
+def write_if_changed(path: str, text: str) -> bool:
+    "Write text to path atomically, unless it already holds it. True if written."
+    try:
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
+
+def changes(watched: dict, interval: float):
+    """Yield the files of watched that changed since the last poll, every `interval` seconds.
+
+    watched maps each file to its modification time when last seen, None for
+    a file not seen yet, which counts as changed. The caller may add files
+    between polls."""
+    while True:
+        changed = []
+        for file, seen in list(watched.items()):
+            try:
+                mtime = os.stat(file).st_mtime_ns
+            except FileNotFoundError:
+                # mid-save by an editor that replaces the file
+                continue
+            if seen != mtime:
+                watched[file] = mtime
+                changed.append(file)
+        if changed:
+            yield changed
+        time.sleep(interval)
+
+def local_modules(directory: str) -> dict[str, str]:
+    "Modules imported from files under directory, e.g. a builder's compile_python_to_jsbsim, by name."
+    modules = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        # this module keeps running the watch, so it is not reloaded
+        if path is None or name in ("__main__", __name__):
+            continue
+        path = os.path.abspath(path)
+        if path.startswith(directory + os.sep):
+            modules[name] = path
+    return modules
+
+def to_string(root: ET.Element) -> str:
     ET.indent(root, space="  ")
-    print(ET.tostring(root, encoding='unicode'))
+    return ET.tostring(root, encoding='unicode')
+
+class CompileError(Exception):
+    "A compile that failed in a compile_many worker."
+
+def _compile_worker(file: str, options: dict) -> str:
+    try:
+        return to_string(compile_file(file, **options))
+    except (*_pyparsing_errors("ParseBaseException"), sexpr_parser.SexprError) as e:
+        raise CompileError(f"{file}: {e}") from None
+
+def compile_many(files: list[str], workers: int | None = None, processes: bool = True,
+                 **options) -> dict[str, str]:
+    """Compile many models concurrently, returning the XML text of each.
+
+    Workers import this module (and build the grammar) once, then compile
+    any number of files. `options` are passed on to compile_file. pyparsing
+    itself is not thread-safe, so threads require the fast parser."""
+    if not processes and options.get("parser", Parser.pyparsing) == Parser.pyparsing:
+        raise ValueError("compiling in threads requires parser=Parser.fast")
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=workers) as executor:
+        results = executor.map(_compile_worker, files, [options] * len(files))
+        return dict(zip(files, results))
+
+def compile(file: str, parse_all: bool=True, cse: bool=False, fold: bool=False,
+            export: list[str] | None = None, derivative: list[str] | None = None,
+            parser: Parser=Parser.pyparsing, cache: bool=True, output: str | None = None,
+            compact: bool=False):
+    """Compile file to output (stdout by default), writing each definition as it is compiled.
+
+    compact: no indentation. The optimization passes and derivatives work on
+    the whole tree, so with them the output starts once they are done."""
+    from xml_writer import XMLWriter, output_file
+    with output_file(output) as out, XMLWriter(out, pretty=not compact) as writer:
+        if cse or fold or derivative:
+            writer.write_all(compile_file(file, parse_all=parse_all, parser=parser, cse=cse, fold=fold,
+                                          export=export, derivatives=derivative, cache=cache))
+        elif cache:
+            for fragment in iter_file_cached(file, parse_all=parse_all, parser=parser):
+                if compact:
+                    writer.write_all(sexpr_cache.elements([fragment]))
+                else:
+                    writer.write_fragment(fragment)
+        else:
+            writer.write_all(iter_file(file, parse_all=parse_all, parser=parser))
     
-@app.command()
-def properties(file: str, output: str | None = None):
+def properties(file: str, output: str | None = None, parser: Parser=Parser.pyparsing):
+    context = CompileContext()
     try:
-        _ = spec.parse_file(file, parse_all=False)
-    except ParseFatalException as e:
+        _ = parse_file(file, parse_all=False, parser=parser, context=context)
+    except (*_pyparsing_errors("ParseFatalException"), sexpr_parser.DefinitionError) as e:
         with open(output, 'w') as f:
             f.write(e.msg)
         return
-    p_defined = "\n".join(sorted(property_defined))
-    p_undefined = "\n".join(sorted(property_set - property_defined))
+    p_defined = "\n".join(sorted(context.property_defined))
+    p_undefined = "\n".join(sorted(context.undefined))
     p = "DEFINED:\n" + p_defined + "\nUNDEFINED:\n" + p_undefined
     if output:
         with open(output, 'w') as f:
@@ -222,5 +334,115 @@ def properties(file: str, output: str | None = None):
     
 
 
+def tables(file: str, parser: Parser=Parser.pyparsing, cache: bool=True):
+    """The size of each table in the compiled file, largest first.
+
+    JSBSim parses every table when it loads the model, so their text size is
+    most of the load time of a model with large tables."""
+    from table_files import table_sizes
+    root = compile_file(file, parser=parser, cache=cache)
+    sizes = table_sizes(root)
+    total = len(to_string(root).encode())
+    for size in sizes:
+        breakpoints = " x ".join(map(str, size["breakpoints"]))
+        print(f"{size['bytes'] / 1000:10.1f} kB  {breakpoints:>13}  {size['function']}  {size['table']}")
+    table_bytes = sum(size["bytes"] for size in sizes)
+    print(f"{len(sizes)} tables, {table_bytes / 1000:.1f} kB of {total / 1000:.1f} kB output "
+          f"({100 * table_bytes / max(total, 1):.0f}%)")
+
+def watch(source: str = "EvenFlow.py", output: str = "EvenFlow/EvenFlowAerodynamics.xml",
+          parser: Parser=Parser.pyparsing, cse: bool=False, fold: bool=False,
+          export: list[str] | None = None, derivative: list[str] | None = None,
+          interval: float = 0.2, fdm: bool = False, vc: float = 30, h: float = 1000,
+          show: list[str] | None = None):
+    """Recompile source into output whenever it changes, until interrupted.
+
+    source: a .sexpr model or a Python builder like EvenFlow.py. The compiler
+    stays loaded, .sexpr forms are reparsed only when they changed, and output
+    is replaced atomically, only when the XML changed. With --fdm the model
+    is reloaded into a new executive with the output as its aerodynamics,
+    trimmed at vc (kts) and h (ft), and the trim and --show properties printed."""
+    root = None
+    if fdm:
+        # loaded lazily, like the rest of the JSBSim tooling
+        from fdm_utils import stage_aircraft
+        root = stage_aircraft()
+    # the source and what it was compiled from: a .sexpr model's table files,
+    # a builder's local imports, reloaded when one of them changes
+    watched = {source: None}
+    directory = os.path.dirname(os.path.abspath(source))
+    print(f"watching {source}", file=sys.stderr)
+    try:
+        for changed in changes(watched, interval):
+            start = time.perf_counter()
+            modules = local_modules(directory) if source.endswith(".py") else {}
+            if set(changed) & set(modules.values()):
+                # every one, as the others hold references into the changed ones
+                for name in modules:
+                    del sys.modules[name]
+            context = CompileContext()
+            try:
+                xml = compile_source(source, parser=parser, cse=cse, fold=fold, export=export,
+                                     derivatives=derivative, context=context)
+            except Exception as e:
+                # keep watching: the last good output stays in place
+                print(f"{source}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            dependencies = {path: signature[0] for path, signature in context.table_files.items()}
+            if source.endswith(".py"):
+                for path in local_modules(directory).values():
+                    dependencies[path] = os.stat(path).st_mtime_ns
+            for file in list(watched):
+                if file != source and file not in dependencies:
+                    del watched[file]
+            # files already watched keep the time they were last seen at
+            for file, mtime in dependencies.items():
+                watched.setdefault(file, mtime)
+            # as the compile command prints it
+            if not write_if_changed(output, xml + "\n"):
+                print(f"{source}: no change in output", file=sys.stderr)
+                continue
+            print(f"wrote {output} in {time.perf_counter() - start:.3f} s", file=sys.stderr)
+            if root is not None:
+                _reload(root, xml, vc, h, show or [])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+
+TRIM_READOUT = {
+    "alpha": "aero/alpha-deg",
+    "pitch trim": "fcs/pitch-trim-cmd-norm",
+    "throttle": "fcs/throttle-cmd-norm",
+}
+
+def _reload(root: str, xml: str, vc: float, h: float, show: list[str]):
+    "Load xml into a new executive, trim it and print the readouts."
+    import jsbsim
+    from fdm_utils import write_aero, load_fdm, trim
+    start = time.perf_counter()
+    write_aero(root, xml)
+    fdm = load_fdm(root)
+    try:
+        trim(fdm, vc_kts=vc, h_ft=h)
+        status = "trimmed"
+    except jsbsim.TrimFailureError:
+        status = "trim failed"
+    readouts = {name: fdm[p] for name, p in TRIM_READOUT.items()}
+    readouts.update({p: fdm[p] for p in show})
+    values = "  ".join(f"{name} {value:.4g}" for name, value in readouts.items())
+    print(f"{status} in {time.perf_counter() - start:.3f} s: {values}", file=sys.stderr)
+
+def make_app():
+    "The command line: compile, properties, tables and watch."
+    import typer
+    app = typer.Typer()
+    app.command()(compile)
+    app.command()(properties)
+    app.command()(tables)
+    app.command()(watch)
+    return app
+
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    make_app()()
\ No newline at end of file
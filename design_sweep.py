@@ -0,0 +1,161 @@
+# Parametric design sweep over the EvenFlow model
+# Every combination of the swept parameters is built with EvenFlow.build,
+# compiled, loaded into JSBSim, trimmed, and its stability derivatives recorded.
+#
+# Parameters are EvenFlow.build arguments: cg_loc, tail_volume, strips, or
+# <element>.<argument> for a Wing_Panel/Wing/Fuselage argument, e.g. ht.S, vt.tau_f,
+# lw1.x, fus.propwash, rwo.twist (with strips). Values are given as start:stop:count or v1,v2,...
+#
+# Results are appended to a JSON lines file as each variant finishes; running
+# the same sweep again skips the variants already recorded.
+
+import itertools
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import jsbsim
+import typer
+
+import EvenFlow
+from compile_python_to_jsbsim import print_xml
+from fdm_utils import parse_values, stage_aircraft, write_aero, load_fdm, trim
+from StabilityDerivatives import TITLES, DERIVS, stability_derivatives
+from trim_cache import TrimCache
+
+# properties recorded for the trimmed state
+TRIM_PROPERTIES = [
+    "aero/alpha-deg",
+    "attitude/theta-deg",
+    "fcs/elevator-cmd-norm",
+    "fcs/pitch-trim-cmd-norm",
+    "fcs/aileron-cmd-norm",
+    "fcs/rudder-cmd-norm",
+    "fcs/throttle-cmd-norm",
+    "propulsion/engine/thrust-lbs",
+]
+
+def parse_params(specs: List[str]) -> Dict[str, List[float]]:
+    params = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if not values:
+            raise ValueError(f"expected name=values, got {spec!r}")
+        params[name.strip()] = parse_values(values)
+    return params
+
+def variants(params: Dict[str, List[float]]) -> List[dict]:
+    "Every combination of the parameter values."
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+def build_arguments(variant: dict) -> dict:
+    "EvenFlow.build keyword arguments for a variant."
+    kwargs = {}
+    for name, value in variant.items():
+        element, dot, argument = name.partition(".")
+        if dot:
+            kwargs.setdefault(element, {})[argument] = value
+        else:
+            kwargs[name] = value
+    return kwargs
+
+def variant_key(variant: dict) -> str:
+    return json.dumps(variant, sort_keys=True)
+
+# Worker state: the staged JSBSim root and the trim cache are reused for every
+# variant a worker runs. Each worker stages its root in a directory the sweep
+# owns and removes when the pool has exited: workers exit without running
+# atexit handlers. JSBSim cannot load a second model into an executive, so each variant
+# gets a fresh FGFDMExec, which takes milliseconds against the trim.
+_worker = {}
+
+def _init_worker(directory: str):
+    # a root per worker, as each writes its own variants' aerodynamics
+    _worker["root"] = stage_aircraft(tempfile.mkdtemp(dir=directory))
+    _worker["cache"] = TrimCache()
+
+def run_variant(variant: dict, vc_kts: float = 30, h_ft: float = 1000,
+                fold: bool = True, cache: bool = True) -> dict:
+    "Build, trim and linearize one variant. Failures are recorded, not raised."
+    if "root" not in _worker:
+        # called outside a sweep
+        with tempfile.TemporaryDirectory(prefix="evenflow-") as directory:
+            _init_worker(directory)
+            try:
+                return run_variant(variant, vc_kts, h_ft, fold, cache)
+            finally:
+                _worker.clear()
+    result = {"variant": variant, "vc_kts": vc_kts, "h_ft": h_ft}
+    try:
+        aircraft = EvenFlow.build(**build_arguments(variant))
+        write_aero(_worker["root"], print_xml(aircraft.compile(fold=fold)))
+        fdm = load_fdm(_worker["root"])
+        trim(fdm, vc_kts=vc_kts, h_ft=h_ft, cache=_worker["cache"] if cache else None)
+        result["trim"] = {p: fdm[p] for p in TRIM_PROPERTIES}
+        coefficients, derivatives = stability_derivatives(fdm, vc_kts)
+    except jsbsim.TrimFailureError:
+        result["error"] = "trim failed"
+        return result
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    result["coefficients"] = dict(zip(TITLES, coefficients.tolist()))
+    result["derivatives"] = {title: dict(zip(DERIVS, row))
+                             for title, row in zip(TITLES, derivatives.tolist())}
+    return result
+
+def load_results(output: str) -> Dict[str, dict]:
+    "Results recorded so far, by variant key. A partly written last line is ignored."
+    results = {}
+    if os.path.exists(output):
+        with open(output) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[variant_key(result["variant"])] = result
+    return results
+
+def sweep(params: Dict[str, List[float]], output: str, vc_kts: float = 30,
+          h_ft: float = 1000, workers: int | None = None, fold: bool = True,
+          cache: bool = True, progress=None) -> List[dict]:
+    """Run every variant not yet in `output`, appending results as they finish.
+
+    Returns the results of all variants of the sweep, in sweep order."""
+    todo = variants(params)
+    results = load_results(output)
+    pending = [v for v in todo if variant_key(v) not in results]
+    if pending:
+        with open(output, "a") as f, tempfile.TemporaryDirectory(prefix="evenflow-") as directory, \
+             ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(directory,)) as executor:
+            futures = [executor.submit(run_variant, v, vc_kts, h_ft, fold, cache) for v in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                results[variant_key(result["variant"])] = result
+                if progress is not None:
+                    progress(result)
+    return [results[variant_key(v)] for v in todo]
+
+def main(param: List[str] = typer.Option(..., "--param", "-p",
+                                         help="name=start:stop:count or name=v1,v2,..."),
+         output: str = "sweep.jsonl",
+         vc_kts: float = 30,
+         h_ft: float = 1000,
+         workers: int | None = None,
+         fold: bool = True,
+         trim_cache: bool = True):
+    def progress(result):
+        status = result.get("error") or f"alpha {result['trim']['aero/alpha-deg']:.2f} deg"
+        typer.echo(f"{variant_key(result['variant'])}: {status}")
+    results = sweep(parse_params(param), output, vc_kts, h_ft, workers, fold, trim_cache, progress)
+    failed = sum(1 for r in results if "error" in r)
+    typer.echo(f"{len(results)} variants, {failed} failed, results in {output}")
+
+if __name__ == "__main__":
+    typer.run(main)
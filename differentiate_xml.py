@@ -0,0 +1,348 @@
+# Symbolic differentiation of compiled <aerodynamics> documents
+# Every function is differentiated with respect to flight state variables by
+# the chain rule through the properties it reads, and the derivatives are
+# appended as extra functions named aero/derivatives/<variable>/<property>,
+# plus aero/derivatives/<variable>/<AXIS> for each axis total.
+#
+# Tables are piecewise linear, so their derivatives are step tables of the
+# segment slopes (exact except within a hair of each breakpoint, and zero
+# outside the table where the lookup is clamped). min, max and abs use the
+# slope of the active branch. Functions are differentiated as a steady-state
+# graph: a read of a function defined further down the document is treated as
+# reading its current value, where JSBSim reads the previous frame's.
+
+import copy
+from graphlib import TopologicalSorter
+from typing import Dict, Iterable, List
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
+from optimize_xml import fold_constants, property_element, value_element
+from sexpr_parser import Parser, table_data_element
+
+DERIVATIVE_PREFIX = "aero/derivatives/"
+
+# The model reads body axis velocities; alpha, beta and the airspeed u are
+# varied with the other two held, through u = V cos(alpha) cos(beta),
+# v = V sin(beta), w = V sin(alpha) cos(beta). An input of STATE_INPUTS left
+# out of a variable's entry does not change with it.
+KINEMATICS = {
+    "alpha": {
+        "aero/alpha-rad": "1",
+        "aero/alpha-deg": "57.29577951308232",
+        "velocities/u-aero-fps": "(* -1.0 velocities/w-aero-fps)",
+        "velocities/w-aero-fps": "velocities/u-aero-fps",
+    },
+    "beta": {
+        "aero/beta-rad": "1",
+        "aero/beta-deg": "57.29577951308232",
+        "velocities/u-aero-fps": "(* -1.0 (cos aero/alpha-rad) velocities/v-aero-fps)",
+        "velocities/v-aero-fps": "(* velocities/vt-fps (cos aero/beta-rad))",
+        "velocities/w-aero-fps": "(* -1.0 (sin aero/alpha-rad) velocities/v-aero-fps)",
+    },
+    "u": {
+        "velocities/vt-fps": "1",
+        "aero/qbar-psf": "(* atmosphere/rho-slugs_ft3 velocities/vt-fps)",
+        "velocities/u-aero-fps": "(/ velocities/u-aero-fps velocities/vt-fps)",
+        "velocities/v-aero-fps": "(/ velocities/v-aero-fps velocities/vt-fps)",
+        "velocities/w-aero-fps": "(/ velocities/w-aero-fps velocities/vt-fps)",
+    },
+    "p": {"velocities/p-aero-rad_sec": "1"},
+    "q": {"velocities/q-aero-rad_sec": "1"},
+    "r": {"velocities/r-aero-rad_sec": "1"},
+}
+STATE_INPUTS = {name for inputs in KINEMATICS.values() for name in inputs}
+
+# JSBSim outputs that depend on the flight state: reading one that is not in
+# STATE_INPUTS would silently differentiate it as a constant
+STATE_PREFIXES = ("aero/", "velocities/")
+
+# smallest magnitude divided by when taking the sign of an expression
+TINY = 1e-300
+
+def _e(tag: str, *children) -> ET.Element:
+    e = ET.Element(tag)
+    e.extend(children)
+    return e
+
+def _v(value: float) -> ET.Element:
+    return value_element(float(value))
+
+def _c(e: ET.Element) -> ET.Element:
+    return copy.deepcopy(e)
+
+def _children(e):
+    return [c for c in e if isinstance(c.tag, str) and c.tag != "description"]
+
+# None stands for a derivative that is identically zero
+
+def _sum(terms) -> ET.Element | None:
+    terms = [t for t in terms if t is not None]
+    if not terms:
+        return None
+    return terms[0] if len(terms) == 1 else _e("sum", *terms)
+
+def _product(*factors) -> ET.Element | None:
+    if any(f is None for f in factors):
+        return None
+    return _e("product", *factors)
+
+def _zero_if_none(e: ET.Element | None) -> ET.Element:
+    return _v(0) if e is None else e
+
+def _sign(e: ET.Element) -> ET.Element:
+    "e / |e|, and 0 where e is 0."
+    return _e("quotient", _c(e), _e("max", _e("abs", _c(e)), _v(TINY)))
+
+def _step_breakpoints(x: np.ndarray) -> np.ndarray:
+    # each breakpoint split in two, so the interpolated slopes are piecewise constant
+    eps = 1e-6 * np.min(np.diff(x))
+    return np.column_stack([x - eps, x + eps]).reshape(-1)
+
+def _step_values(slopes: np.ndarray) -> np.ndarray:
+    "Slopes of the segments, with zeros outside, laid out over _step_breakpoints along axis 0."
+    zero = np.zeros((1,) + slopes.shape[1:])
+    padded = np.concatenate([zero, slopes, zero])
+    return np.repeat(padded, 2, axis=0)[1:-1]
+
+def variable_name(variable: str) -> str:
+    "Path component naming a variable: the last component of a property."
+    return variable.rsplit("/", 1)[-1]
+
+def derivative_name(variable: str, name: str, prefix: str = DERIVATIVE_PREFIX) -> str:
+    return f"{prefix}{variable_name(variable)}/{name}"
+
+class _Differentiator:
+    "Derivatives of the expressions of one document with respect to one variable."
+    def __init__(self, variable: str, prefix: str, definitions: Iterable[str] = ()):
+        self.variable = variable
+        self.prefix = prefix
+        self.kinematics = KINEMATICS.get(variable, {variable: "1"})
+        # properties of the document, rather than inputs from JSBSim
+        self.definitions = set(definitions)
+        # properties whose derivative is not identically zero, by name
+        self.defined: Dict[str, str] = {}
+
+    def property(self, text: str) -> ET.Element | None:
+        name = text.strip()
+        negative = name.startswith("-")
+        name = name.lstrip("-")
+        if name in self.defined:
+            d = property_element(self.defined[name])
+        elif name in self.kinematics:
+            d = Parser(self.kinematics[name]).sexp()
+        elif (self.variable in KINEMATICS and name not in self.definitions and name not in STATE_INPUTS
+              and name.startswith(STATE_PREFIXES)):
+            raise NotImplementedError(f"no kinematics for the input {name} with respect to {self.variable}")
+        else:
+            return None
+        return _e("product", _v(-1), d) if negative else d
+
+    def table(self, e: ET.Element) -> ET.Element | None:
+        lookups = sorted(e.findall("independentVar"), key=lambda v: v.get("lookup", "row") != "row")
+        if len(lookups) > 2:
+            raise NotImplementedError("3-dimensional tables are not supported")
+        rows = [line.split() for line in e.find("tableData").text.strip().splitlines() if line.strip()]
+        terms = []
+        if len(lookups) == 1:
+            data = np.array(rows, dtype=float)
+            x, y = data[:, 0], data[:, 1]
+            slopes = _step_values(np.diff(y) / np.diff(x))
+            terms.append((lookups[0], [[a, b] for a, b in zip(_step_breakpoints(x), slopes)]))
+        else:
+            columns = np.array(rows[0], dtype=float)
+            body = np.array(rows[1:], dtype=float)
+            r, values = body[:, 0], body[:, 1:]
+            # slope along rows, linear across columns within a cell, and vice versa
+            along_rows = _step_values(np.diff(values, axis=0) / np.diff(r)[:, None])
+            along_columns = _step_values((np.diff(values, axis=1) / np.diff(columns)).T).T
+            terms.append((lookups[0], [['""'] + list(columns)]
+                          + [[x] + list(row) for x, row in zip(_step_breakpoints(r), along_rows)]))
+            terms.append((lookups[1], [['""'] + list(_step_breakpoints(columns))]
+                          + [[x] + list(row) for x, row in zip(r, along_columns)]))
+        result = []
+        for var, data in terms:
+            d = self.property(var.text)
+            if d is None:
+                continue
+            slope = ET.Element("table")
+            slope.extend(_c(v) for v in lookups)
+            slope.append(table_data_element([[float(v) if v != '""' else v for v in row] for row in data]))
+            result.append(_product(slope, d))
+        return _sum(result)
+
+    def expression(self, e: ET.Element) -> ET.Element | None:
+        tag = e.tag
+        if tag in ("value", "random", "integer"):
+            return None
+        if tag == "property":
+            return self.property(e.text)
+        if tag == "table":
+            return self.table(e)
+        a = _children(e)
+        d = [self.expression(c) for c in a]
+        if all(x is None for x in d):
+            return None
+        if tag == "sum":
+            return _sum(d)
+        if tag == "difference":
+            rest = [x for x in d[1:] if x is not None]
+            if not rest:
+                return d[0]
+            return _e("difference", _zero_if_none(d[0]), *rest)
+        if tag == "product":
+            return _sum(_product(d[i], *[_c(c) for j, c in enumerate(a) if j != i])
+                        for i in range(len(a)) if d[i] is not None)
+        if tag == "quotient":
+            num, den = a
+            if d[1] is None:
+                return _e("quotient", d[0], _c(den))
+            top = _e("difference", _zero_if_none(_product(d[0], _c(den))), _e("product", _c(num), d[1]))
+            return _e("quotient", top, _e("pow", _c(den), _v(2)))
+        if tag == "pow":
+            base, exponent = a
+            if d[1] is not None:
+                raise NotImplementedError("pow with a variable exponent")
+            return _e("product", _c(exponent), _e("pow", _c(base), _e("difference", _c(exponent), _v(1))), d[0])
+        if tag == "exp":
+            return _e("product", _e("exp", _c(a[0])), d[0])
+        if tag == "abs":
+            return _e("product", d[0], _sign(a[0]))
+        if tag == "sin":
+            return _e("product", _e("cos", _c(a[0])), d[0])
+        if tag == "cos":
+            return _e("product", _v(-1), _e("sin", _c(a[0])), d[0])
+        if tag == "tan":
+            return _e("quotient", d[0], _e("pow", _e("cos", _c(a[0])), _v(2)))
+        if tag in ("asin", "acos"):
+            root = _e("pow", _e("difference", _v(1), _e("pow", _c(a[0]), _v(2))), _v(-0.5))
+            return _e("product", _v(1 if tag == "asin" else -1), root, d[0])
+        if tag == "atan":
+            return _e("quotient", d[0], _e("sum", _v(1), _e("pow", _c(a[0]), _v(2))))
+        if tag == "atan2":
+            y, x = a
+            top = _e("difference", _zero_if_none(_product(_c(x), d[0])), _zero_if_none(_product(_c(y), d[1])))
+            return _e("quotient", top, _e("sum", _e("pow", _c(x), _v(2)), _e("pow", _c(y), _v(2))))
+        if tag in ("min", "max"):
+            # pairwise: max(a, b)' = (a' + b' + sign(a - b) (a' - b')) / 2, min with the sign flipped
+            acc, dacc = a[0], d[0]
+            for b, db in zip(a[1:], d[1:]):
+                s = _sign(_e("difference", _c(acc), _c(b)))
+                if tag == "min":
+                    s = _e("product", _v(-1), s)
+                da, dbb = _zero_if_none(dacc), _zero_if_none(db)
+                dacc = _e("product", _v(0.5), _e("sum", _c(da), _c(dbb),
+                                                  _e("product", s, _e("difference", da, dbb))))
+                acc = _e(tag, _c(acc), _c(b))
+            return dacc
+        if tag == "avg":
+            return _e("product", _v(1 / len(a)), _sum(d))
+        if tag == "fraction":
+            return d[0]
+        if tag == "mod":
+            if d[1] is None:
+                return d[0]
+            # a mod b = a - b * trunc(a / b)
+            return _e("difference", _zero_if_none(d[0]),
+                      _e("product", d[1], _e("integer", _e("quotient", _c(a[0]), _c(a[1])))))
+        raise NotImplementedError(f"cannot differentiate <{tag}>")
+
+def _reads(e: ET.Element):
+    for d in e.iter():
+        if d.tag in ("property", "independentVar"):
+            yield d.text.strip().lstrip("-")
+        elif d.tag == "table" and d.get("name") and d is not e:
+            yield d.get("name")
+
+def default_variables(root: ET.Element) -> List[str]:
+    "alpha, beta, u, p, q, r and every control surface (fcs/...) the model reads."
+    defined = {e.get("name") for e in root.iter() if e.tag in ("function", "table") and e.get("name")}
+    read = {e.text.strip().lstrip("-") for e in root.iter() if e.tag in ("property", "independentVar")}
+    return list(KINEMATICS) + sorted(p for p in read - defined if p.startswith("fcs/"))
+
+def expand_variables(root: ET.Element, variables: Iterable[str] | None) -> List[str]:
+    variables = ["all"] if variables is None else list(variables)
+    expanded = []
+    for v in variables:
+        for v in default_variables(root) if v == "all" else [v]:
+            if v not in expanded:
+                expanded.append(v)
+    return expanded
+
+def differentiate(root: ET.Element, variables: Iterable[str] | None = None,
+                  prefix: str = DERIVATIVE_PREFIX) -> ET.Element:
+    """Append the derivatives of every function and axis with respect to each variable.
+
+    Variables are alpha, beta, u (airspeed), p, q, r, or the name of any
+    property read by the model, e.g. fcs/elevator-pos-rad; "all" (or None)
+    stands for default_variables. Derivatives that are identically zero are
+    left out, except the axis totals."""
+    variables = expand_variables(root, variables)
+    definitions = {}
+    for fn in root.findall("function"):
+        for table in fn.iter("table"):
+            if table.get("name"):
+                definitions[table.get("name")] = table
+        definitions[fn.get("name")] = _children(fn)[0]
+    axes = root.findall("axis")
+    for axis in axes:
+        for fn in axis.findall("function"):
+            definitions[fn.get("name")] = _children(fn)[0]
+    # dependencies first: a function reading one defined further down the
+    # document is differentiated as the steady state, as aero_eval evaluates it
+    graph = {name: {p for p in _reads(body) if p in definitions and p != name}
+             for name, body in definitions.items()}
+    order = list(TopologicalSorter(graph).static_order())
+
+    derivatives = ET.Element("aerodynamics")
+    totals = []
+    for variable in variables:
+        differentiator = _Differentiator(variable, prefix, definitions)
+        for name in order:
+            d = differentiator.expression(definitions[name])
+            if d is None:
+                continue
+            dname = derivative_name(variable, name, prefix)
+            differentiator.defined[name] = dname
+            fn = ET.Element("function", name=dname)
+            fn.append(d)
+            derivatives.append(fn)
+        for axis in axes:
+            terms = [property_element(differentiator.defined[fn.get("name")])
+                     for fn in axis.findall("function") if fn.get("name") in differentiator.defined]
+            fn = ET.Element("function", name=derivative_name(variable, axis.get("name"), prefix))
+            fn.append(_sum(terms) if terms else _v(0))
+            totals.append(fn)
+
+    # simplify, dropping derivatives that fold to zero once their users have been folded
+    derivatives.extend(totals)
+    fold_constants(derivatives)
+    kept = {id(fn) for fn in totals}
+    for fn in list(derivatives):
+        body = _children(fn)
+        if id(fn) not in kept and body[0].tag == "value" and float(body[0].text) == 0.0:
+            derivatives.remove(fn)
+    root.extend(derivatives)
+    return root
+
+def jacobian(root: ET.Element, inputs: dict, variables: Iterable[str] | None = None,
+             outputs: Iterable[str] | None = None) -> Dict[str, Dict[str, np.ndarray]]:
+    """Evaluate derivatives with aero_eval, without JSBSim.
+
+    Returns {variable: {output: array}} for the axis totals, or for `outputs`
+    (properties or axis names). inputs as for AeroModel.evaluate, including
+    aero/alpha-rad, aero/beta-rad and velocities/vt-fps (see body_state)."""
+    from aero_eval import AeroModel
+    root = copy.deepcopy(root)
+    variables = expand_variables(root, variables)
+    outputs = [a.get("name") for a in root.findall("axis")] if outputs is None else list(outputs)
+    differentiate(root, variables)
+    model = AeroModel(root)
+    names = {(v, o): derivative_name(v, o) for v in variables for o in outputs}
+    available = {n for n in names.values() if n in model.definitions}
+    values = model.evaluate(inputs, outputs=sorted(available))
+    shape = np.broadcast_shapes(*[np.shape(v) for v in inputs.values()])
+    return {v: {o: values[names[v, o]] if names[v, o] in available else np.zeros(shape)
+                for o in outputs}
+            for v in variables}
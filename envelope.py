@@ -0,0 +1,215 @@
+# Batch trim and linearization over the flight envelope
+# Trims and linearizes EvenFlow over a grid of airspeed, altitude, CG position
+# and flight path angle in worker processes, stacks the A and B matrices, and
+# tracks each eigenvalue branch across the grid.
+#
+# Branches are followed from a reference point to its grid neighbours,
+# matching each eigenvalue to the nearest one of the neighbour already
+# tracked, and named (short period, phugoid, dutch roll, roll, spiral, ...)
+# from the eigenvectors at the reference point.
+
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence
+
+import jsbsim
+import numpy as np
+import typer
+
+import EvenFlow
+from compile_python_to_jsbsim import print_xml
+from fdm_utils import parse_values, stage_aircraft, write_aero, load_fdm, trim
+from trim_cache import TrimCache
+
+# state groups used to name modes, by FGLinearization state name
+LONGITUDINAL = {"Vt", "Alpha", "Theta", "Q"}
+LATERAL = {"Beta", "Phi", "P", "R"}
+PROPELLER = {"Rpm0"}
+
+# points trimmed per task; every task shares one CG, so one compiled model
+CHUNK = 8
+
+_worker = {}
+
+def _init_worker(directory: str, cache: bool):
+    # a root per worker, in a directory the caller removes after the pool
+    # has exited (workers skip atexit handlers): each writes its CG's model
+    _worker["root"] = stage_aircraft(tempfile.mkdtemp(dir=directory))
+    _worker["cache"] = TrimCache() if cache else None
+
+def _linearize(cg_loc: float, points: List[tuple]) -> List[tuple]:
+    "Trim and linearize at (index, vc_kts, h_ft, gamma_deg) points of one CG."
+    aero = print_xml(EvenFlow.build(cg_loc=cg_loc).compile(fold=True))
+    write_aero(_worker["root"], aero)
+    fdm = load_fdm(_worker["root"])
+    results = []
+    for index, vc_kts, h_ft, gamma_deg in points:
+        try:
+            trim(fdm, vc_kts=vc_kts, h_ft=h_ft, gamma_deg=gamma_deg, cache=_worker["cache"])
+        except jsbsim.TrimFailureError:
+            results.append((index, None))
+            continue
+        lin = jsbsim.FGLinearization(fdm)
+        results.append((index, {
+            "A": np.array(lin.system_matrix),
+            "B": np.array(lin.input_matrix),
+            "x0": np.array(lin.x0),
+            "x_names": list(lin.x_names),
+            "u_names": list(lin.u_names),
+        }))
+    return results
+
+def match(reference: np.ndarray, values: np.ndarray) -> np.ndarray:
+    "Reorder values so each is closest to the reference eigenvalue in the same position."
+    distance = np.abs(reference[:, None] - values[None, :])
+    distance[np.isnan(distance)] = np.inf
+    order = np.full(len(reference), -1)
+    used = set()
+    # greedy assignment, closest pairs first
+    for flat in np.argsort(distance, axis=None):
+        i, j = np.unravel_index(flat, distance.shape)
+        if order[i] < 0 and j not in used:
+            order[i] = j
+            used.add(j)
+    return values[order]
+
+def track(eigenvalues: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Order the eigenvalues of every grid point along continuous branches.
+
+    eigenvalues: (*grid, n); valid: (*grid) points that were trimmed. Each
+    point is matched to an already tracked grid neighbour, breadth first from
+    the first valid point."""
+    shape = valid.shape
+    tracked = np.full(eigenvalues.shape, np.nan + 0j)
+    seen = np.zeros(shape, dtype=bool)
+    reference = None
+    for start in zip(*np.nonzero(valid)):
+        if seen[start]:
+            continue
+        # a region cut off by failed trims is matched to the first reference point
+        values = eigenvalues[start]
+        tracked[start] = values if reference is None else match(reference, values)
+        if reference is None:
+            reference = tracked[start]
+        seen[start] = True
+        queue = deque([start])
+        while queue:
+            point = queue.popleft()
+            for axis in range(len(shape)):
+                for step in (-1, 1):
+                    neighbour = list(point)
+                    neighbour[axis] += step
+                    neighbour = tuple(neighbour)
+                    if not 0 <= neighbour[axis] < shape[axis] or seen[neighbour] or not valid[neighbour]:
+                        continue
+                    tracked[neighbour] = match(tracked[point], eigenvalues[neighbour])
+                    seen[neighbour] = True
+                    queue.append(neighbour)
+    return tracked
+
+def classify_modes(A: np.ndarray, x0: np.ndarray, x_names: Sequence[str]) -> List[str]:
+    "Name the mode of each eigenvalue of A, in np.linalg.eig order."
+    # scale airspeed and propeller speed like the angles, so eigenvectors compare
+    scale = np.array([1 / max(abs(x), 1.0) if name in ("Vt", "Rpm0") else 1.0
+                      for name, x in zip(x_names, x0)])
+    values, vectors = np.linalg.eig(A * scale[:, None] / scale[None, :])
+    groups = [LONGITUDINAL, LATERAL, PROPELLER]
+    labels = []
+    for value, vector in zip(values, vectors.T):
+        energy = [sum(abs(v) ** 2 for v, name in zip(vector, x_names) if name in group)
+                  for group in groups]
+        # position and heading states are left out: their units swamp the rest,
+        # and they only take part in the modes through integration
+        if abs(value) < 1e-4 or max(energy) < 1e-12:
+            labels.append("neutral")
+        else:
+            labels.append(["longitudinal", "lateral", "propeller"][int(np.argmax(energy))])
+    # refine by frequency within each group
+    def name(group, complex_pair, largest, smallest):
+        members = [i for i, l in enumerate(labels) if l == group and (abs(values[i].imag) > 1e-9) == complex_pair]
+        if not members:
+            return
+        magnitudes = [abs(values[i]) for i in members]
+        for i in members:
+            if abs(values[i]) == max(magnitudes):
+                labels[i] = largest
+            elif abs(values[i]) == min(magnitudes):
+                labels[i] = smallest
+    name("longitudinal", True, "short period", "phugoid")
+    name("lateral", True, "dutch roll", "dutch roll")
+    name("lateral", False, "roll", "spiral")
+    return labels
+
+def linearize_envelope(vc_kts: Sequence[float], h_ft: Sequence[float] = (1000.0,),
+                       cg_loc: Sequence[float] = (-0.36 * EvenFlow.MAC,),
+                       gamma_deg: Sequence[float] = (0.0,), workers: int | None = None,
+                       cache: bool = True, chunk: int = CHUNK) -> Dict[str, np.ndarray]:
+    """Trim and linearize over the grid vc x h x cg x gamma.
+
+    Returns the grid axes, stacked A (*grid, n, n) and B (*grid, n, m)
+    matrices (NaN where the trim failed), a `trimmed` mask, the tracked
+    eigenvalues (*grid, n) and the mode name of each branch."""
+    axes = {"vc_kts": vc_kts, "h_ft": h_ft, "cg_loc": cg_loc, "gamma_deg": gamma_deg}
+    axes = {name: np.asarray(values, dtype=float) for name, values in axes.items()}
+    shape = tuple(len(v) for v in axes.values())
+    tasks = []
+    for k, cg in enumerate(axes["cg_loc"]):
+        points = [(index, axes["vc_kts"][index[0]], axes["h_ft"][index[1]], axes["gamma_deg"][index[3]])
+                  for index in np.ndindex(shape) if index[2] == k]
+        tasks.extend((cg, points[i:i + chunk]) for i in range(0, len(points), chunk))
+    with tempfile.TemporaryDirectory(prefix="evenflow-") as directory, \
+         ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(directory, cache)) as executor:
+        results = [r for task in executor.map(_linearize, *zip(*tasks)) for r in task]
+    trimmed = [r for _, r in results if r is not None]
+    if not trimmed:
+        raise RuntimeError("no point of the envelope could be trimmed")
+    n, m = trimmed[0]["B"].shape
+    A = np.full(shape + (n, n), np.nan)
+    B = np.full(shape + (n, m), np.nan)
+    valid = np.zeros(shape, dtype=bool)
+    reference = None
+    for index, r in results:
+        if r is None:
+            continue
+        A[index], B[index], valid[index] = r["A"], r["B"], True
+        if reference is None or index < reference[0]:
+            reference = (index, r)
+    eigenvalues = np.full(shape + (n,), np.nan + 0j)
+    eigenvalues[valid] = np.linalg.eigvals(A[valid])
+    tracked = track(eigenvalues, valid)
+    # name the branches at the first trimmed point, which tracking starts from
+    index, r = reference
+    values = np.linalg.eigvals(r["A"])
+    labels = classify_modes(r["A"], r["x0"], r["x_names"])
+    order = [int(np.argmin(np.abs(values - v))) for v in tracked[index]]
+    result = dict(axes)
+    result.update({
+        "A": A, "B": B, "trimmed": valid, "eigenvalues": tracked,
+        "modes": np.array([labels[i] for i in order]),
+        "x_names": np.array(r["x_names"]), "u_names": np.array(r["u_names"]),
+    })
+    return result
+
+def main(vc_kts: str = "25:45:5",
+         h_ft: str = "1000",
+         cg_loc: str = str(-0.36 * EvenFlow.MAC),
+         gamma_deg: str = "0",
+         output: str = "envelope.npz",
+         workers: int | None = None,
+         trim_cache: bool = True):
+    "Linearize over the envelope grid, save it to OUTPUT and summarize the modes."
+    result = linearize_envelope(parse_values(vc_kts), parse_values(h_ft), parse_values(cg_loc),
+                                parse_values(gamma_deg), workers, trim_cache)
+    np.savez_compressed(output, **result)
+    valid = result["trimmed"]
+    typer.echo(f"{valid.sum()}/{valid.size} points trimmed, written to {output}")
+    for mode, branch in zip(result["modes"], np.moveaxis(result["eigenvalues"][valid], -1, 0)):
+        if mode == "neutral" or mode == "propeller":
+            continue
+        unstable = np.sum(branch.real > 0)
+        typer.echo(f"{mode:>13}: real {branch.real.min():9.4f} .. {branch.real.max():9.4f}, "
+                   f"imag {branch.imag.min():8.4f} .. {branch.imag.max():8.4f}, unstable at {unstable} points")
+
+if __name__ == "__main__":
+    typer.run(main)
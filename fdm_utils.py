@@ -0,0 +1,99 @@
+# Helpers for loading the EvenFlow model into JSBSim from scripts
+# JSBSim looks for <root>/aircraft/<name>/<name>.xml, while EvenFlow/ keeps the
+# FlightGear layout (EvenFlow-jsbsim.xml). stage_aircraft lays the model out as
+# a JSBSim root of symlinks, so the aerodynamics file can be swapped per run
+# without touching the repository. A root belongs to whoever staged it, who
+# removes it; staged_aircraft does both for a with block.
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import jsbsim
+import numpy as np
+
+AIRCRAFT_NAME = "EvenFlow"
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "EvenFlow")
+AERO_FILE = "EvenFlowAerodynamics.xml"
+
+def parse_values(spec: str) -> list:
+    "Values from the command line: start:stop:count (inclusive) or a comma separated list."
+    if ":" in spec:
+        start, stop, count = spec.split(":")
+        return [float(v) for v in np.linspace(float(start), float(stop), int(count))]
+    return [float(v) for v in spec.split(",")]
+
+def stage_aircraft(root: str | None = None, aero: str | None = None) -> str:
+    """Create a JSBSim root directory for EvenFlow and return its path.
+
+    aero: XML text of the aerodynamics file to use instead of the compiled one
+    in EvenFlow/. Otherwise the model's own file is linked."""
+    if root is None:
+        root = tempfile.mkdtemp(prefix="evenflow-")
+    aircraft = os.path.join(root, "aircraft", AIRCRAFT_NAME)
+    os.makedirs(aircraft, exist_ok=True)
+    links = {f: f for f in os.listdir(MODEL_DIR)}
+    links[f"{AIRCRAFT_NAME}.xml"] = f"{AIRCRAFT_NAME}-jsbsim.xml"
+    for name, target in links.items():
+        path = os.path.join(aircraft, name)
+        if not os.path.lexists(path):
+            os.symlink(os.path.join(MODEL_DIR, target), path)
+    if aero is not None:
+        write_aero(root, aero)
+    return root
+
+@contextmanager
+def staged_aircraft(aero: str | None = None):
+    "A root from stage_aircraft for the with block, removed after it."
+    root = stage_aircraft(aero=aero)
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def write_aero(root: str, aero: str):
+    "Replace the aerodynamics file of a staged root. Reload the model to use it."
+    path = os.path.join(root, "aircraft", AIRCRAFT_NAME, AERO_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(aero)
+    os.replace(tmp, path)
+
+def load_fdm(root: str | None = None, aero: str | None = None) -> jsbsim.FGFDMExec:
+    """Load EvenFlow into a new executive.
+
+    root: a staged root of the caller's, into which aero is written if given.
+    Without one, a root is staged for the load and removed after it: JSBSim
+    reads the model's files on load."""
+    if root is None:
+        with staged_aircraft(aero) as root:
+            return load_fdm(root)
+    if aero is not None:
+        stage_aircraft(root, aero)
+    # Avoid flooding the console with log messages
+    jsbsim.FGJSBBase().debug_lvl = 0
+    fdm = jsbsim.FGFDMExec(root)
+    fdm.load_model(AIRCRAFT_NAME)
+    return fdm
+
+def trim(fdm: jsbsim.FGFDMExec, vc_kts: float = 30, h_ft: float = 1000,
+         gamma_deg: float = 0, mode: int = 1, throttle: float = 0.3, cache=None):
+    """Steady level flight trim (full trim by default). Raises jsbsim.TrimFailureError.
+
+    throttle: initial guess. The trim cannot move the throttle while the
+    propeller is stopped, so the model is run for one frame at this setting first.
+    cache: a trim_cache.TrimCache to look the trimmed state up in."""
+    fdm["ic/h-sl-ft"] = h_ft
+    fdm["ic/vc-kts"] = vc_kts
+    fdm["ic/gamma-deg"] = gamma_deg
+    fdm["ic/beta-deg"] = 0
+    # Initialize the aircraft with initial conditions
+    fdm["propulsion/engine/set-running"] = 1
+    fdm["fcs/throttle-cmd-norm"] = throttle
+    fdm.run_ic()
+    fdm.run()
+    if cache is not None:
+        cache.do_trim(fdm, mode)
+    else:
+        fdm.do_trim(mode)
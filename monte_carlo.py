@@ -0,0 +1,363 @@
+# Monte Carlo dispersion runs of a test scenario
+# Every run flies a scenario (see compile_scenario.py) with dispersed mass, CG,
+# inertia, aerodynamic coefficients and wind. Worker processes keep a loaded
+# executive for the whole Monte Carlo and write each time history straight
+# into a shared memory block, so only run indices and errors are pickled.
+#
+# Every run has its own seed, spawned from one SeedSequence, so its draws do
+# not depend on the worker or the order that runs it. Statistics over the runs
+# (mean, std, min, max per channel and step) are accumulated in place as runs
+# finish.
+#
+# Dispersions are normal, with the standard deviations given by name:
+#   mass                  fraction of the total weight, added to the payload point mass
+#   cg_x, cg_z            CG shift in inches, by moving the payload point mass
+#   ixx, iyy, izz         fraction of the moment of inertia
+#   a, cd0, k             fraction of each wing panel's lift, zero-lift drag and
+#                         induced drag factor, drawn per panel
+#   wind_north, wind_east, wind_down   steady wind in ft/s
+# JSBSim cannot change the moments of inertia of a loaded model, so runs with
+# inertia dispersed reload it (milliseconds, against a few hundred for a run).
+
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+import jsbsim
+import numpy as np
+import typer
+
+import EvenFlow
+from compile_python_to_jsbsim import print_xml
+from compile_scenario import write_scenario
+from fdm_utils import AIRCRAFT_NAME, MODEL_DIR, parse_values, stage_aircraft
+from optimize_xml import fold_constants, eliminate_dead_properties
+from recorder import Recorder
+
+# recorded by default: the response to a rudder kick or a gust
+CHANNELS = {
+    "beta": "aero/beta-deg",
+    "alpha": "aero/alpha-deg",
+    "phi": "attitude/phi-deg",
+    "theta": "attitude/theta-deg",
+    "p": "velocities/p-rad_sec",
+    "q": "velocities/q-rad_sec",
+    "r": "velocities/r-rad_sec",
+    "vc": "velocities/vc-kts",
+    "h": "position/h-sl-ft",
+}
+
+WIND = {
+    "wind_north": "atmosphere/wind-north-fps",
+    "wind_east": "atmosphere/wind-east-fps",
+    "wind_down": "atmosphere/wind-down-fps",
+}
+INERTIA = ["ixx", "iyy", "izz"]
+# aerodynamic dispersions: the functions each scales, one per wing panel
+AERO = {
+    "a": re.compile(r"aero/coefficients/CL_(\w+)$"),
+    "cd0": re.compile(r"aero/coefficients/CD0_(\w+)$"),
+    "k": re.compile(r"aero/coefficients/k_(\w+)$"),
+}
+DISPERSIONS = ["mass", "cg_x", "cg_z", *INERTIA, *AERO, *WIND]
+
+# factors of the dispersed functions, set for each run
+FACTOR_PREFIX = "aero/dispersion/"
+
+PAYLOAD = 0
+
+# runs per task
+CHUNK = 16
+
+def disperse_aero(root: ET.Element, kinds) -> Dict[str, str]:
+    """Scale the functions of the `kinds` of AERO dispersions by factor properties.
+
+    Returns a column name (e.g. "a.rw1") to factor property for each function scaled."""
+    factors = {}
+    for function in root.iter("function"):
+        name = function.get("name")
+        for kind in kinds:
+            m = AERO[kind].match(name or "")
+            if m is None:
+                continue
+            prop = f"{FACTOR_PREFIX}{kind}_{m.group(1)}"
+            product = ET.Element("product")
+            product.extend(child for child in function if child.tag != "description")
+            for child in list(product):
+                function.remove(child)
+            factor = ET.SubElement(product, "property")
+            factor.text = f" {prop} "
+            function.append(product)
+            factors[f"{kind}.{m.group(1)}"] = prop
+    return factors
+
+def build_aero(kinds, cg_loc: float | None = None) -> tuple[str, Dict[str, str]]:
+    "The EvenFlow aerodynamics with dispersion factors, folded, and its factor properties."
+    aircraft = EvenFlow.build() if cg_loc is None else EvenFlow.build(cg_loc=cg_loc)
+    # unfolded first: folding would inline the constants that are dispersed
+    root = aircraft.compile()
+    factors = disperse_aero(root, kinds)
+    fold_constants(root)
+    eliminate_dead_properties(root)
+    # declared with their nominal value, as JSBSim requires of properties functions read
+    for i, prop in enumerate(factors.values()):
+        declaration = ET.Element("property", value="1")
+        declaration.text = f" {prop} "
+        root.insert(i, declaration)
+    return print_xml(root), factors
+
+def columns(sigmas: Dict[str, float], factors: Dict[str, str]) -> List[str]:
+    "Parameter columns drawn for each run: one per dispersion, one per panel for aero ones."
+    names = []
+    for name in sigmas:
+        if name in AERO:
+            names.extend(column for column in factors if column.split(".")[0] == name)
+        elif name in DISPERSIONS:
+            names.append(name)
+        else:
+            raise ValueError(f"unknown dispersion {name!r}, expected one of {DISPERSIONS}")
+    return names
+
+def draw(names: List[str], sigmas: Dict[str, float], runs: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    "Normal draws (runs, columns), and a 32 bit atmosphere seed per run."
+    sigma = np.array([sigmas[name.split(".")[0]] for name in names])
+    parameters = np.empty((runs, len(names)))
+    atmosphere_seeds = np.empty(runs, dtype=np.int64)
+    for i, sequence in enumerate(np.random.SeedSequence(seed).spawn(runs)):
+        rng = np.random.default_rng(sequence)
+        parameters[i] = rng.standard_normal(len(names)) * sigma
+        atmosphere_seeds[i] = rng.integers(2**31)
+    return parameters, atmosphere_seeds
+
+class Statistics:
+    "Mean, standard deviation, min and max over runs, updated in place one run at a time (Welford)."
+    def __init__(self, shape: tuple):
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self._delta = np.empty(shape)
+        self._valid = np.empty(shape, dtype=bool)
+
+    def update(self, history: np.ndarray):
+        "Add one run; NaN samples (steps after a run stopped) are skipped."
+        valid, delta = self._valid, self._delta
+        np.isfinite(history, out=valid)
+        self.count += valid
+        np.subtract(history, self.mean, out=delta)
+        delta[~valid] = 0
+        self.mean += delta / np.maximum(self.count, 1)
+        # delta * (x - new mean)
+        delta *= np.subtract(history, self.mean, where=valid, out=np.zeros_like(delta))
+        self.m2 += delta
+        np.fmin(self.min, history, out=self.min)
+        np.fmax(self.max, history, out=self.max)
+
+    @property
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / (self.count - 1))
+
+# Worker state: the staged root, the loaded executive with the scenario and the
+# views of the shared blocks. Each worker stages its own root, as it rewrites
+# the model to disperse inertia, in a directory that monte_carlo removes after
+# the pool has exited: workers skip atexit handlers.
+_worker = {}
+
+def _init_worker(directory: str, aero: str, scenario: str, channels: Dict[str, str], names: List[str],
+                 factors: Dict[str, str], steps: int, block: str, shape: tuple):
+    root = stage_aircraft(tempfile.mkdtemp(dir=directory), aero)
+    script, _ = write_scenario(scenario, os.path.join(root, "scripts"),
+                               os.path.join(root, "aircraft", AIRCRAFT_NAME))
+    # notifications of every run would flood the console
+    tree = ET.parse(script)
+    for event in tree.getroot().iter("event"):
+        for notify in event.findall("notify"):
+            event.remove(notify)
+    tree.write(script)
+    memory = shared_memory.SharedMemory(block)
+    _worker.update(root=root, script=script, channels=channels, names=names,
+                   factors=factors, steps=steps, memory=memory,
+                   histories=np.ndarray(shape, buffer=memory.buf))
+    _load()
+
+def _load(inertia: Dict[str, float] | None = None):
+    "Load the model (with inertia scaled by 1 + the given fractions) and the scenario."
+    root = _worker["root"]
+    model = os.path.join(root, "aircraft", AIRCRAFT_NAME, f"{AIRCRAFT_NAME}.xml")
+    if inertia is not None:
+        tree = ET.parse(os.path.join(MODEL_DIR, f"{AIRCRAFT_NAME}-jsbsim.xml"))
+        mass_balance = tree.getroot().find("mass_balance")
+        for name, fraction in inertia.items():
+            element = mass_balance.find(name)
+            element.text = f" {float(element.text) * (1 + fraction)} "
+        os.remove(model)
+        tree.write(model)
+    jsbsim.FGJSBBase().debug_lvl = 0
+    fdm = jsbsim.FGFDMExec(root)
+    fdm.load_script(_worker["script"])
+    fdm.run_ic()
+    # nominal mass properties, for the mass and CG dispersions
+    nominal = {p: fdm[p] for p in ["inertia/weight-lbs", f"inertia/pointmass-weight-lbs[{PAYLOAD}]",
+                                   f"inertia/pointmass-location-X-inches[{PAYLOAD}]",
+                                   f"inertia/pointmass-location-Z-inches[{PAYLOAD}]"]}
+    recorder = Recorder(fdm, _worker["channels"], _worker["steps"])
+    _worker.update(fdm=fdm, nominal=nominal, recorder=recorder)
+
+def _apply(fdm: jsbsim.FGFDMExec, parameters: Dict[str, float]):
+    nominal = _worker["nominal"]
+    weight = nominal["inertia/weight-lbs"]
+    payload = nominal[f"inertia/pointmass-weight-lbs[{PAYLOAD}]"] + parameters.get("mass", 0) * weight
+    fdm[f"inertia/pointmass-weight-lbs[{PAYLOAD}]"] = payload
+    # the CG moves by the payload's share of the weight times its displacement
+    share = (weight + payload - nominal[f"inertia/pointmass-weight-lbs[{PAYLOAD}]"]) / payload
+    for axis in "XZ":
+        location = f"inertia/pointmass-location-{axis}-inches[{PAYLOAD}]"
+        fdm[location] = nominal[location] + parameters.get(f"cg_{axis.lower()}", 0) * share
+    for name, prop in WIND.items():
+        fdm[prop] = parameters.get(name, 0)
+    for column, prop in _worker["factors"].items():
+        fdm[prop] = 1 + parameters.get(column, 0)
+
+def _run(indices: List[int], parameters: np.ndarray, atmosphere_seeds: np.ndarray) -> List[tuple]:
+    "Fly runs into their rows of the shared block. Returns (index, error or None) per run."
+    histories = _worker["histories"]
+    results = []
+    for index, values, atmosphere_seed in zip(indices, parameters, atmosphere_seeds):
+        values = dict(zip(_worker["names"], values.tolist()))
+        inertia = {name: values[name] for name in INERTIA if name in values}
+        if inertia:
+            _load(inertia)
+        else:
+            _worker["fdm"].reset_to_initial_conditions(0)
+        fdm, recorder = _worker["fdm"], _worker["recorder"]
+        history = histories[index]
+        recorder.buffer = history
+        recorder.clear()
+        error = None
+        try:
+            _apply(fdm, values)
+            fdm["atmosphere/randomseed"] = int(atmosphere_seed)
+            fdm.run_ic()
+            for _ in range(_worker["steps"]):
+                if not fdm.run():
+                    break
+                recorder.record()
+        except jsbsim.TrimFailureError:
+            error = "trim failed"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        # steps not flown, or every step of a failed run
+        history[:, 0 if error else len(recorder):] = np.nan
+        results.append((index, error))
+    return results
+
+def scenario_steps(scenario: str) -> int:
+    "Number of frames the compiled scenario runs for."
+    from compile_scenario import compile_scenario
+    with open(scenario) as f:
+        script, _ = compile_scenario(f.read())
+    run = script.find("run")
+    return int(round((float(run.get("end")) - float(run.get("start"))) / float(run.get("dt"))))
+
+class MonteCarlo:
+    """Results of a Monte Carlo, with the time histories in shared memory.
+
+    histories: (runs, channels, steps), NaN after a run stopped or failed.
+    parameters: (runs, len(names)) dispersion draws. errors: per run, None if it flew.
+    Release the block with close(), or use the object as a context manager."""
+    def __init__(self, runs: int, channels: List[str], steps: int, names: List[str],
+                 parameters: np.ndarray):
+        self.channels = channels
+        self.names = names
+        self.parameters = parameters
+        self.errors = [None] * runs
+        self.statistics = Statistics((len(channels), steps))
+        shape = (runs, len(channels), steps)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+        self.histories = np.ndarray(shape, buffer=self.memory.buf)
+
+    def close(self):
+        if self.memory is not None:
+            self.histories = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def save(self, path: str):
+        s = self.statistics
+        np.savez_compressed(path, histories=self.histories, parameters=self.parameters,
+                            names=np.array(self.names), channels=np.array(self.channels),
+                            errors=np.array([e or "" for e in self.errors]),
+                            mean=s.mean, std=s.std, min=s.min, max=s.max)
+
+def monte_carlo(scenario: str, sigmas: Dict[str, float], runs: int, seed: int = 0,
+                channels: Dict[str, str] = CHANNELS, workers: int | None = None,
+                chunk: int = CHUNK, progress=None) -> MonteCarlo:
+    """Fly `runs` dispersed runs of a scenario file in worker processes.
+
+    sigmas: dispersion name (see DISPERSIONS) to standard deviation.
+    channels: column name to property recorded at every step.
+    progress(index, error), if given, is called as each run finishes."""
+    aero, factors = build_aero([name for name in sigmas if name in AERO])
+    names = columns(sigmas, factors)
+    parameters, atmosphere_seeds = draw(names, sigmas, runs, seed)
+    steps = scenario_steps(scenario)
+    channels = dict(channels)
+    recorded = ["times", *channels]
+    result = MonteCarlo(runs, recorded, steps, names, parameters)
+    try:
+        with tempfile.TemporaryDirectory(prefix="evenflow-") as directory:
+            initargs = (directory, aero, os.path.abspath(scenario), channels, names,
+                        {c: p for c, p in factors.items() if c in names}, steps,
+                        result.memory.name, result.histories.shape)
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as executor:
+                futures = [executor.submit(_run, list(range(i, min(i + chunk, runs))),
+                                           parameters[i:i + chunk], atmosphere_seeds[i:i + chunk])
+                           for i in range(0, runs, chunk)]
+                for future in as_completed(futures):
+                    for index, error in future.result():
+                        result.errors[index] = error
+                        if error is None:
+                            result.statistics.update(result.histories[index])
+                        if progress is not None:
+                            progress(index, error)
+    except BaseException:
+        result.close()
+        raise
+    return result
+
+def main(scenario: str,
+         runs: int = 100,
+         dispersion: List[str] = typer.Option([], "--dispersion", "-d",
+                                              help=f"name=sigma, name one of {', '.join(DISPERSIONS)}"),
+         seed: int = 0,
+         output: str = "monte_carlo.npz",
+         workers: int | None = None):
+    "Fly RUNS dispersed runs of SCENARIO and save histories and statistics to OUTPUT."
+    sigmas = {}
+    for spec in dispersion:
+        name, _, sigma = spec.partition("=")
+        sigmas[name.strip()] = parse_values(sigma)[0]
+    with monte_carlo(scenario, sigmas, runs, seed, workers=workers) as result:
+        result.save(output)
+        failed = sum(1 for e in result.errors if e is not None)
+        typer.echo(f"{runs} runs, {failed} failed, written to {output}")
+        s = result.statistics
+        for k, channel in enumerate(result.channels[1:], start=1):
+            typer.echo(f"{channel:>6}: final {s.mean[k, -1]:10.4f} +- {s.std[k, -1]:8.4f}, "
+                       f"range {np.nanmin(s.min[k]):10.4f} .. {np.nanmax(s.max[k]):10.4f}")
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,322 @@
+# Optimization passes over compiled <aerodynamics> documents
+# Passes rewrite the ElementTree in place and return the root, so they can be
+# chained between parsing/compiling and print_xml.
+#
+# JSBSim caches every top-level <function> once per frame, so moving a repeated
+# subtree into its own function and reading the property instead saves the
+# repeated evaluations.
+
+import math
+from fnmatch import fnmatchcase
+from typing import Iterable
+from xml.etree import ElementTree as ET
+
+CSE_PREFIX = "aero/cse/"
+
+# operands of these can be reordered without changing the result
+COMMUTATIVE = {"sum", "product", "min", "max", "avg"}
+
+# rough relative cost of evaluating one node, a property read being 1
+OP_COST = {
+    "sin": 4, "cos": 4, "tan": 4, "asin": 4, "acos": 4, "atan": 4, "atan2": 6,
+    "pow": 6, "exp": 4, "table": 8,
+}
+
+def _is_element(e) -> bool:
+    return isinstance(e.tag, str)
+
+def _children(e):
+    return [c for c in e if _is_element(c) and c.tag != "description"]
+
+def property_element(name: str) -> ET.Element:
+    prop = ET.Element("property")
+    prop.text = f" {name} "
+    return prop
+
+class _Numbering:
+    "Value numbering: structurally identical subtrees get the same number."
+    def __init__(self):
+        self.numbers = {}
+        self.size = {}
+        self.cost = {}
+
+    def number(self, e, memo) -> int:
+        if e.tag in ("property", "value"):
+            text = e.text.strip()
+            key = (e.tag, repr(float(text)) if e.tag == "value" else text)
+            size = cost = 1
+        elif e.tag == "table":
+            key = ("table", e.get("name"),
+                   tuple((v.get("lookup", "row"), v.text.strip()) for v in e.iter("independentVar")),
+                   tuple(e.find("tableData").text.split()))
+            size, cost = 1, OP_COST["table"]
+        else:
+            children = [memo[id(c)] for c in _children(e)]
+            if e.tag in COMMUTATIVE:
+                children.sort()
+            key = (e.tag, tuple(children))
+            size = 1 + sum(self.size[c] for c in children)
+            cost = OP_COST.get(e.tag, 1) + sum(self.cost[c] for c in children)
+        number = self.numbers.setdefault(key, len(self.numbers))
+        self.size[number] = size
+        self.cost[number] = cost
+        memo[id(e)] = number
+        return number
+
+def eliminate_common_subexpressions(root: ET.Element, prefix: str = CSE_PREFIX) -> ET.Element:
+    """Hoist structurally identical subtrees into shared named functions.
+
+    A repeated subtree that is already the body of an earlier top-level
+    function is replaced by that function's property; otherwise a new
+    function named `prefix`t<n> is inserted before its first user."""
+    parent = {}
+    order = []  # post-order, children before parents
+    for top in root:
+        if not _is_element(top):
+            continue
+        stack = [(top, False)]
+        while stack:
+            e, done = stack.pop()
+            if done:
+                order.append(e)
+                continue
+            stack.append((e, True))
+            if e.tag == "table":
+                continue
+            for c in reversed(_children(e)):
+                parent[id(c)] = e
+                stack.append((c, False))
+
+    numbering, memo = _Numbering(), {}
+    occurrences = {}
+    uncacheable = set()
+    for e in order:
+        if e.tag in ("function", "axis"):
+            continue
+        n = numbering.number(e, memo)
+        if e.tag == "random" or any(id(c) in uncacheable for c in _children(e)):
+            uncacheable.add(id(e))
+            continue
+        if numbering.size[n] > 1 or (e.tag == "table" and not e.get("name")):
+            occurrences.setdefault(n, []).append(e)
+
+    # bodies of top-level functions are reusable as they are
+    named = {}
+    for fn in root.findall("function"):
+        body = _children(fn)
+        if len(body) == 1 and id(body[0]) in memo:
+            named.setdefault(memo[id(body[0])], (fn, body[0]))
+
+    top_level = [e for e in root]
+    existing = {fn.get("name") for fn in root.iter("function")}
+    counter = 0
+    dead = set()
+
+    def top_ancestor(e):
+        while id(e) in parent and parent[id(e)] is not root:
+            e = parent[id(e)]
+        return e
+
+    # largest subtrees first, so nested repeats are hoisted as a whole
+    candidates = sorted(occurrences, key=lambda n: -numbering.size[n])
+    for n in candidates:
+        live = [e for e in occurrences[n] if id(e) not in dead]
+        # one evaluation plus a property read per use must beat evaluating each copy
+        if len(live) < 2 or numbering.cost[n] * (len(live) - 1) <= len(live):
+            continue
+        users = [top_ancestor(e) for e in live]
+        first = min(top_level.index(u) for u in users)
+        reuse = named.get(n)
+        if reuse is not None and reuse[1] in live and top_level.index(reuse[0]) <= first:
+            fn, body = reuse
+            name = fn.get("name")
+            live.remove(body)
+        else:
+            while f"{prefix}t{counter}" in existing:
+                counter += 1
+            name = f"{prefix}t{counter}"
+            existing.add(name)
+            fn = ET.Element("function")
+            fn.set("name", name)
+            # move the first occurrence into the new function so subtrees
+            # shared with other expressions stay visible to later candidates
+            body = live.pop(0)
+            _replace(parent, body, property_element(name))
+            fn.append(body)
+            parent[id(body)] = fn
+            parent[id(fn)] = root
+            root.insert(list(root).index(top_level[first]), fn)
+            top_level.insert(first, fn)
+        for e in live:
+            _replace(parent, e, property_element(name))
+            dead.update(id(d) for d in e.iter())
+    return root
+
+def _replace(parent: dict, old: ET.Element, new: ET.Element):
+    p = parent[id(old)]
+    p[list(p).index(old)] = new
+    parent[id(new)] = p
+
+# Constant folding
+
+def _fraction(x):
+    return x - math.trunc(x)
+
+def _avg(*values):
+    return sum(values) / len(values)
+
+# JSBSim operations on constant operands; None means "do not fold"
+FOLD = {
+    "sum": lambda *v: math.fsum(v),
+    "difference": lambda a, *rest: a - math.fsum(rest),
+    "product": lambda *v: math.prod(v),
+    "quotient": lambda a, b: a / b if b != 0 else None,
+    "pow": lambda a, b: math.pow(a, b),
+    "exp": math.exp,
+    "abs": abs,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "atan2": math.atan2,
+    "min": min,
+    "max": max,
+    "avg": _avg,
+    "fraction": _fraction,
+    "mod": lambda a, b: math.fmod(a, b) if b != 0 else None,
+    "integer": lambda a: float(math.trunc(a)),
+}
+
+def value_element(value: float) -> ET.Element:
+    e = ET.Element("value")
+    e.text = f" {value} "
+    return e
+
+def _constant(e) -> float | None:
+    if e.tag == "value":
+        return float(e.text)
+    return None
+
+def _fold(e: ET.Element, constants: dict, aliases: dict) -> ET.Element:
+    "Fold the subtree rooted at e, returning its replacement."
+    if e.tag == "property":
+        name = e.text.strip()
+        if name in aliases:
+            return _fold(property_element(aliases[name]), constants, aliases)
+        if name in constants:
+            return value_element(constants[name])
+        if name.startswith("-") and name[1:] in constants:
+            return value_element(-constants[name[1:]])
+        return e
+    if e.tag not in FOLD:
+        return e
+    for i, child in enumerate(list(e)):
+        if _is_element(child):
+            e[i] = _fold(child, constants, aliases)
+    children = _children(e)
+    values = [_constant(c) for c in children]
+    if children and None not in values:
+        try:
+            result = FOLD[e.tag](*values)
+        except (ValueError, OverflowError, TypeError):
+            result = None
+        if result is not None:
+            return value_element(float(result))
+        return e
+    # algebraic identities with some constant operands
+    if e.tag in ("sum", "product"):
+        identity = 0.0 if e.tag == "sum" else 1.0
+        known = [v for v in values if v is not None]
+        if e.tag == "product" and 0.0 in known:
+            return value_element(0.0)
+        combined = FOLD[e.tag](*known) if known else identity
+        operands = [c for c, v in zip(children, values) if v is None]
+        if combined != identity:
+            operands.append(value_element(combined))
+        if len(operands) == 1:
+            return operands[0]
+        if len(operands) != len(children):
+            for c in children:
+                e.remove(c)
+            e.extend(operands)
+        return e
+    if e.tag == "difference" and len(children) > 1:
+        kept = [children[0]] + [c for c, v in zip(children[1:], values[1:]) if v != 0.0]
+        if len(kept) == 1:
+            return kept[0]
+        for c in set(children) - set(kept):
+            e.remove(c)
+        return e
+    if e.tag in ("quotient", "pow") and len(children) == 2 and values[1] == 1.0:
+        return children[0]
+    return e
+
+def fold_constants(root: ET.Element) -> ET.Element:
+    """Fold constant subtrees and propagate constant functions into their users.
+
+    Top-level functions whose body folds to a literal become constants that
+    replace every read of their property, and reads of functions that merely
+    copy another property are redirected to the original. Reads of functions defined later in
+    the document are included: JSBSim only differs from this on the first
+    frame, when the later function has not been evaluated yet."""
+    constants, aliases = {}, {}
+    top_level = {id(fn) for fn in root.findall("function")}
+    changed = True
+    while changed:
+        changed = False
+        for fn in root.iter("function"):
+            for i, child in enumerate(list(fn)):
+                if _is_element(child) and child.tag != "description":
+                    fn[i] = _fold(child, constants, aliases)
+            name = fn.get("name")
+            body = _children(fn)
+            if id(fn) not in top_level or len(body) != 1 or name in constants or name in aliases:
+                continue
+            if body[0].tag == "value":
+                constants[name] = float(body[0].text)
+                changed = True
+            elif body[0].tag == "property":
+                target = body[0].text.strip()
+                while target in aliases:
+                    target = aliases[target]
+                if target != name:
+                    aliases[name] = target
+                    changed = True
+    return root
+
+# Dead property elimination
+
+def _reads(e: ET.Element):
+    for d in e.iter():
+        if d.tag in ("property", "independentVar"):
+            yield d.text.strip().lstrip("-")
+
+def eliminate_dead_properties(root: ET.Element, exported: Iterable[str] = ()) -> ET.Element:
+    """Remove top-level functions no axis (or exported property) depends on.
+
+    `exported` holds property names or glob patterns of properties read from
+    outside the aerodynamics document, e.g. by systems or instruments."""
+    exported = list(exported)
+    defs = {}
+    for fn in root.findall("function"):
+        defs[fn.get("name")] = fn
+        for table in fn.iter("table"):
+            if table.get("name"):
+                defs[table.get("name")] = fn
+    live = set()
+    stack = [name for name in defs if any(fnmatchcase(name, p) for p in exported)]
+    for axis in root.findall("axis"):
+        stack.extend(_reads(axis))
+    while stack:
+        name = stack.pop()
+        if name in live:
+            continue
+        live.add(name)
+        if name in defs:
+            stack.extend(_reads(defs[name]))
+    for fn in root.findall("function"):
+        if fn.get("name") not in live:
+            root.remove(fn)
+    return root
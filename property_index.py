@@ -0,0 +1,320 @@
+# Cross-reference index of the properties of sexpr models
+# Records where each property is defined and read (file, line), the
+# dependency graph between them (a function reads the properties in its body,
+# a named table its index properties, an axis its functions) and its cycles.
+#
+# The index is kept on disk next to the form cache. Each top-level form is
+# scanned once and stored under a hash of its text, with lines relative to the
+# form, so an edit rescans only the forms that changed and files whose size and
+# modification time are unchanged are not read at all.
+#
+# Axes appear in the graph as axis:<NAME>, e.g. axis:PITCH.
+#
+#   python3 property_index.py feeds aero/forces/L_rw-lb [files...]
+#   python3 property_index.py impact aero/coefficients/CL_rw [files...]
+
+import hashlib
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, List
+
+import typer
+
+import sexpr_cache
+from sexpr_parser import SCI_REAL, INTEGER
+
+INDEX_VERSION = 3
+
+DEFAULT_FILES = ["EvenFlow/EvenFlow.sexpr"]
+
+# comments, strings, punctuation and words of a form
+TOKEN = re.compile(r'(;[^\n]*)|("(?:[^"\\\n]|\\.)*")|([()\[\],])|([^\s()\[\],;"]+)')
+
+def _number(word: str) -> bool:
+    return SCI_REAL.fullmatch(word) is not None or INTEGER.fullmatch(word) is not None
+
+def scan_form(form: str) -> dict:
+    """Definitions and reads of one top-level form, with lines counted from its first line.
+
+    Returns {"defs": [[name, line]], "reads": {reader: [[name, line]]}}. Only
+    the structure is scanned; compile the model to check its syntax."""
+    defs, reads = [], {}
+    # per open parenthesis: [head, reader inside it, whether its name comes next]
+    stack = []
+    line, last = 1, 0
+    head_next = False
+    for m in TOKEN.finditer(form):
+        comment, string, punct, word = m.groups()
+        line += form.count("\n", last, m.start())
+        last = m.start()
+        if comment is not None or string is not None:
+            continue
+        if punct is not None:
+            if stack and punct in "([":
+                # an unnamed table: its indices or data come first
+                stack[-1][2] = False
+            if punct == "(":
+                reader = stack[-1][1] if stack else None
+                stack.append([None, reader, False])
+                head_next = True
+            elif punct == ")" and stack:
+                stack.pop()
+            continue
+        frame = stack[-1] if stack else None
+        if head_next:
+            head_next = False
+            frame[0] = word
+            frame[2] = word in ("def", "axis", "table")
+            continue
+        if frame is not None and frame[2]:
+            frame[2] = False
+            if _number(word):
+                # never a name: a table's data
+                continue
+            head = frame[0]
+            if head == "axis":
+                frame[1] = "axis:" + word
+                continue
+            defs.append([word, line])
+            if frame[1] is not None:
+                # an axis sums its functions; a function reads its named tables
+                reads.setdefault(frame[1], []).append([word, line])
+            frame[1] = word
+            continue
+        if _number(word) or frame is None or frame[1] is None:
+            continue
+        reads.setdefault(frame[1], []).append([word, line])
+    return {"defs": defs, "reads": reads}
+
+def _form_key(form: str) -> str:
+    return hashlib.sha256(f"{INDEX_VERSION}\0{form}".encode()).hexdigest()
+
+class PropertyIndex:
+    "The index of a set of sexpr files, which share one property namespace."
+    def __init__(self, files: List[str], directory: str = sexpr_cache.CACHE_DIR):
+        self.files = [os.path.abspath(f) for f in files]
+        self.directory = directory
+        name = hashlib.sha256("\0".join(self.files).encode()).hexdigest()
+        self.path = os.path.join(directory, name + ".index.json")
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            if stored.get("version") != INDEX_VERSION:
+                stored = {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            stored = {}
+        # per file: stat signature, and the forms as (key, first line) in order
+        self.sources = stored.get("sources", {})
+        self.entries = stored.get("entries", {})
+        self.changed = not stored
+        self.update()
+
+    def update(self):
+        "Rescan the forms of files changed since the index was stored, and rebuild the graph."
+        for file in self.files:
+            st = os.stat(file)
+            signature = [st.st_mtime_ns, st.st_size]
+            source = self.sources.get(file)
+            if source is not None and source["signature"] == signature:
+                continue
+            with open(file) as f:
+                text = f.read()
+            forms = []
+            line, last = 1, 0
+            for offset, form in sexpr_cache.split_forms(text):
+                line += text.count("\n", last, offset)
+                last = offset
+                key = _form_key(form)
+                if key not in self.entries:
+                    self.entries[key] = scan_form(form)
+                forms.append([key, line])
+            self.sources[file] = {"signature": signature, "forms": forms}
+            self.changed = True
+        for file in list(self.sources):
+            if file not in self.files:
+                del self.sources[file]
+        if self.changed:
+            used = {key for source in self.sources.values() for key, _ in source["forms"]}
+            self.entries = {key: e for key, e in self.entries.items() if key in used}
+        self._build()
+
+    def _build(self):
+        self.definitions: Dict[str, list] = {}
+        self.reads: Dict[str, set] = {}
+        self.readers: Dict[str, set] = {}
+        for file in self.files:
+            relative = os.path.relpath(file)
+            for key, first in self.sources[file]["forms"]:
+                entry = self.entries[key]
+                for name, line in entry["defs"]:
+                    self.definitions.setdefault(name, []).append((relative, first + line - 1))
+                for reader, names in entry["reads"].items():
+                    read = {name for name, _ in names}
+                    self.reads.setdefault(reader, set()).update(read)
+                    for name in read:
+                        self.readers.setdefault(name, set()).add(reader)
+
+    def uses(self, name: str) -> List[tuple]:
+        "Where name is read, as (file, line, reader)."
+        sites = []
+        for file in self.files:
+            relative = os.path.relpath(file)
+            for key, first in self.sources[file]["forms"]:
+                for reader, names in self.entries[key]["reads"].items():
+                    sites.extend((relative, first + line - 1, reader) for other, line in names if other == name)
+        return sites
+
+    def save(self):
+        if not self.changed:
+            return
+        import tempfile
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps({"version": INDEX_VERSION, "sources": self.sources, "entries": self.entries}))
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    # Queries
+
+    def location(self, name: str) -> str:
+        sites = self.definitions.get(name)
+        if name.startswith("axis:"):
+            return "axis"
+        if not sites:
+            return "(input)"
+        return ", ".join(f"{file}:{line}" for file, line in sites)
+
+    def _closure(self, name: str, graph: Dict[str, set], depth: int | None) -> Dict[str, int]:
+        "Properties reachable from name in graph, with their distance, in breadth first order."
+        distance = {name: 0}
+        queue = deque([name])
+        while queue:
+            node = queue.popleft()
+            if depth is not None and distance[node] >= depth:
+                continue
+            for other in sorted(graph.get(node, ())):
+                if other not in distance:
+                    distance[other] = distance[node] + 1
+                    queue.append(other)
+        del distance[name]
+        return distance
+
+    def feeds(self, name: str, depth: int | None = None) -> Dict[str, int]:
+        "What name depends on, directly (1) or through other properties."
+        return self._closure(name, self.reads, depth)
+
+    def impact(self, name: str, depth: int | None = None) -> Dict[str, int]:
+        "What depends on name: what breaks if its definition is deleted."
+        return self._closure(name, self.readers, depth)
+
+    def undefined(self) -> List[str]:
+        "Properties read but not defined: inputs from JSBSim, or mistakes."
+        return sorted(name for name in self.readers if name not in self.definitions)
+
+    def unused(self) -> List[str]:
+        "Properties defined but read by nothing, not even an axis."
+        return sorted(name for name in self.definitions if name not in self.readers)
+
+    def duplicates(self) -> List[str]:
+        return sorted(name for name, sites in self.definitions.items() if len(sites) > 1)
+
+    def cycles(self) -> List[List[str]]:
+        "Strongly connected components of the read graph with more than one property, or a self read."
+        # Tarjan's algorithm, iterative so deep chains do not hit the recursion limit
+        index, low, on_stack, stack, result = {}, {}, set(), [], []
+        counter = 0
+        for root in sorted(self.reads):
+            if root in index:
+                continue
+            work = [(root, iter(sorted(self.reads.get(root, ()))))]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, successors = work[-1]
+                for other in successors:
+                    if other not in index:
+                        index[other] = low[other] = counter
+                        counter += 1
+                        stack.append(other)
+                        on_stack.add(other)
+                        work.append((other, iter(sorted(self.reads.get(other, ())))))
+                        break
+                    if other in on_stack:
+                        low[node] = min(low[node], index[other])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            other = stack.pop()
+                            on_stack.discard(other)
+                            component.append(other)
+                            if other == node:
+                                break
+                        if len(component) > 1 or node in self.reads.get(node, ()):
+                            result.append(sorted(component))
+        return result
+
+def open_index(files: List[str] | None) -> PropertyIndex:
+    "The index of files, brought up to date and stored."
+    index = PropertyIndex(files or DEFAULT_FILES)
+    index.save()
+    return index
+
+def _print_closure(index: PropertyIndex, name: str, distances: Dict[str, int]):
+    print(f"{name}  {index.location(name)}")
+    for other, distance in distances.items():
+        print(f"{distance:3d}  {other}  {index.location(other)}")
+
+app = typer.Typer()
+
+@app.command()
+def where(name: str, files: List[str] = typer.Argument(None)):
+    "Where name is defined and read."
+    index = open_index(files)
+    print(f"defined: {index.location(name)}")
+    for file, line, reader in index.uses(name):
+        print(f"read by {reader}  {file}:{line}")
+
+@app.command()
+def feeds(name: str, files: List[str] = typer.Argument(None), depth: int | None = None):
+    "Everything name depends on, by distance."
+    index = open_index(files)
+    _print_closure(index, name, index.feeds(name, depth))
+
+@app.command()
+def impact(name: str, files: List[str] = typer.Argument(None), depth: int | None = None):
+    "Everything that depends on name, by distance: what breaks if it is deleted."
+    index = open_index(files)
+    _print_closure(index, name, index.impact(name, depth))
+
+@app.command()
+def cycles(files: List[str] = typer.Argument(None)):
+    index = open_index(files)
+    for component in index.cycles():
+        print(", ".join(component))
+
+@app.command()
+def summary(files: List[str] = typer.Argument(None)):
+    "Counts, duplicate definitions, cycles, unused definitions and inputs."
+    index = open_index(files)
+    print(f"{len(index.definitions)} defined, {len(index.undefined())} inputs, "
+          f"{sum(len(r) for r in index.reads.values())} dependencies")
+    for title, names in [("DUPLICATES", index.duplicates()),
+                         ("CYCLES", [", ".join(c) for c in index.cycles()]),
+                         ("UNUSED", index.unused()),
+                         ("INPUTS", index.undefined())]:
+        print(f"{title}:")
+        for name in names:
+            print(f"  {name}")
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,73 @@
+# Time-history recorder for JSBSim runs
+# Property nodes are looked up once, when the recorder is made, and every
+# record() writes one row of a preallocated buffer: no per-step string lookups
+# and no list growth. The buffer is laid out as pandas stores a float block,
+# one row per channel, so frame() hands it over without copying.
+#
+# With ring=True the buffer keeps the last `capacity` steps instead of
+# stopping when full; frame() then copies once to put the rows in time order.
+
+from typing import Dict, Sequence
+
+import jsbsim
+import numpy as np
+import pandas as pd
+
+TIME = "simulation/sim-time-sec"
+
+class Recorder:
+    "Records properties of fdm at each record() call into a preallocated buffer."
+    def __init__(self, fdm: jsbsim.FGFDMExec, channels: Dict[str, str] | Sequence[str],
+                 capacity: int, ring: bool = False, time: str | None = "times"):
+        """channels: column name to property, or a list of properties used as names.
+        time: name of a sim time column recorded before the channels, or None."""
+        if not isinstance(channels, dict):
+            channels = {p: p for p in channels}
+        if time is not None:
+            channels = {time: TIME, **channels}
+        pm = fdm.get_property_manager()
+        self.fdm = fdm
+        self.columns = list(channels)
+        self.nodes = []
+        for name, prop in channels.items():
+            node = pm.get_node(prop, False)
+            if node is None:
+                raise KeyError(f"no property {prop!r} for channel {name!r}")
+            self.nodes.append(node)
+        self.capacity = capacity
+        self.ring = ring
+        self.buffer = np.empty((len(self.nodes), capacity))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def record(self):
+        if self.count >= self.capacity and not self.ring:
+            raise IndexError(f"recorder is full ({self.capacity} steps)")
+        self.buffer[:, self.count % self.capacity] = [node.get_double_value() for node in self.nodes]
+        self.count += 1
+
+    def run(self, steps: int, step=None):
+        """Run fdm for `steps` frames, recording after each.
+
+        step(fdm, i), if given, is called after recording frame i, to set the next inputs."""
+        fdm, record = self.fdm, self.record
+        for i in range(steps):
+            fdm.run()
+            record()
+            if step is not None:
+                step(fdm, i)
+
+    def array(self) -> np.ndarray:
+        "The recorded rows in time order, (channels, steps); a view unless a ring has wrapped."
+        if self.count <= self.capacity:
+            return self.buffer[:, :self.count]
+        return np.roll(self.buffer, -(self.count % self.capacity), axis=1)
+
+    def frame(self) -> pd.DataFrame:
+        "The recording as a DataFrame sharing the buffer's memory."
+        return pd.DataFrame(self.array().T, columns=self.columns, copy=False)
+
+    def clear(self):
+        self.count = 0
@@ -0,0 +1,138 @@
+# On-disk cache of compiled top-level sexpr forms
+# A model is split into its top-level forms (definitions, axes and comments).
+# Each form is keyed by a hash of its text, the parser backend and the compiler
+# sources, and cached as its serialized XML fragment with the properties it
+# defines and reads. Recompiling after an edit only parses the forms whose
+# text changed; the rest of the output is assembled from the cached fragments.
+#
+# There is one cache file per source file, holding the forms of its last
+# compile, so entries of edited-away forms do not pile up.
+
+import hashlib
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sexpr_cache")
+
+# modules whose source changes what a form compiles to
+COMPILER_SOURCES = ["compile_sexpr.py", "sexpr_parser.py", "sexpr_grammar.py", "table_files.py"]
+
+# characters the form scanner stops at, and the rest of a string after its opening quote
+SIGNIFICANT = re.compile(r'[;"()]')
+STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+WHITESPACE = re.compile(r"[ \t\r\n]*")
+TOKEN = re.compile(r"[^ \t\r\n]*")
+
+def split_forms(text: str) -> list[tuple[int, str]]:
+    """Top-level forms of a source text, as (offset, text) pairs.
+
+    Only parentheses, comments and strings are scanned; a form that does not
+    close runs to the end of the text, for the parser to report."""
+    forms = []
+    n = len(text)
+    i = WHITESPACE.match(text).end()
+    while i < n:
+        start = i
+        if text[i] == ";":
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+        elif text[i] == "(":
+            depth = 0
+            while True:
+                m = SIGNIFICANT.search(text, i)
+                if m is None:
+                    i = n
+                    break
+                c, i = m.group(), m.end()
+                if c == ";":
+                    end = text.find("\n", i)
+                    i = n if end < 0 else end
+                elif c == '"':
+                    m = STRING_REST.match(text, i)
+                    i = n if m is None else m.end()
+                elif c == "(":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        break
+        else:
+            i = TOKEN.match(text, i).end()
+        forms.append((start, text[start:i]))
+        i = WHITESPACE.match(text, i).end()
+    return forms
+
+def padding(text: str, offset: int) -> str:
+    "Whitespace putting a form at its line and column, so parse errors locate it in the file."
+    line_start = text.rfind("\n", 0, offset) + 1
+    return "\n" * text.count("\n", 0, offset) + " " * (offset - line_start)
+
+def compiler_hash(parser: str) -> str:
+    h = hashlib.sha256(parser.encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in COMPILER_SOURCES:
+        with open(os.path.join(directory, name), "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def form_key(salt: str, form: str) -> str:
+    return hashlib.sha256((salt + "\0" + form).encode()).hexdigest()
+
+def serialize(element: ET.Element) -> str:
+    "An element as it appears among the children of the indented <aerodynamics> root."
+    element.tail = None
+    ET.indent(element, space="  ", level=1)
+    return ET.tostring(element, encoding="unicode")
+
+def assemble(fragments: list[str]) -> str:
+    "The text compile_sexpr.to_string gives for a root with these children."
+    if not fragments:
+        return "<aerodynamics />"
+    return "<aerodynamics>\n  " + "\n  ".join(fragments) + "\n</aerodynamics>"
+
+def elements(fragments: list[str]) -> list[ET.Element]:
+    "The fragments parsed back, for the passes that need the element tree."
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    parser.feed(assemble(fragments))
+    return list(parser.close())
+
+class FormCache:
+    "The cached forms of one source file."
+    def __init__(self, file: str, directory: str = CACHE_DIR):
+        self.directory = directory
+        name = hashlib.sha256(os.path.abspath(file).encode()).hexdigest()
+        self.path = os.path.join(directory, name + ".json")
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> dict | None:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.used[key] = entry
+        else:
+            self.misses += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        self.used[key] = entry
+
+    def save(self):
+        "Keep the forms used by this compile only; written only if they changed."
+        if self.used.keys() == self.entries.keys():
+            return
+        import tempfile
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(self.used))
+        os.replace(tmp, self.path)
+        self.entries = self.used
@@ -0,0 +1,168 @@
+# pyparsing grammar for the sexpr language
+# Parse actions build the XML elements and record the properties read and
+# defined in the context of the running compile (sexpr_parser.current_context).
+# The grammar takes a while to build, so compile_sexpr only imports this module
+# for the pyparsing backend.
+
+from pyparsing import *
+import xml.etree.ElementTree as ET
+from sexpr_parser import OPS, AXIS_TITLES, current_context, table_data_element
+
+LPAR = Literal("(").suppress()
+RPAR = Literal(")").suppress()
+LBRA = Literal("[").suppress()
+RBRA = Literal("]").suppress()
+
+
+comment = Combine(Literal(";") + rest_of_line)
+def comment_xml(toks: ParseResults) -> ET.Element:
+    return ET.Comment(toks[0][1:].strip())  # Remove leading semicolon
+comment.set_parse_action(comment_xml)
+
+property = Word(alphanums + "/[]-_")
+property_notag = Word(alphanums + "/[]-_")
+def property_xml(toks: ParseResults) -> ET.Element:
+    current_context().property_set.add(toks[0])
+    property_element = ET.Element("property")
+    property_element.text = f" {toks[0]} "
+    return property_element
+property.set_parse_action(property_xml)
+
+value = common.sci_real | common.integer
+value_notag = common.sci_real | common.integer
+def value_xml(toks: ParseResults) -> ET.Element:
+    value_element = ET.Element("value")
+    value_element.text = f" {toks[0]} "
+    return value_element
+value.set_parse_action(value_xml)
+
+table_entry = value_notag | '""'
+table_row = Group(OneOrMore(table_entry) + Optional(Literal(",").suppress()))
+first_row = Group(OneOrMore(table_entry) + Literal(",").suppress())
+
+table_data = (LBRA
+                + first_row
+                + ZeroOrMore(table_row)
+                + RBRA)
+
+def table_data_xml(str, loc, toks):
+    array = toks.as_list()
+    for row in array[1:]:
+        if len(row) != len(array[0]):
+            raise ParseFatalException(str, loc, f"table row has {len(row)} entries, expected {len(array[0])}")
+    return table_data_element(array)
+table_data.set_parse_action(table_data_xml)
+
+table_index_id = one_of("row column")
+table_index = (LPAR
+                + table_index_id("index")
+                + property_notag("property")
+                + RPAR)
+def table_index_xml(toks):
+    index_element = ET.Element("independentVar")
+    index_element.set("lookup", toks.index)
+    current_context().property_set.add(toks.property)
+    index_element.text = f" {toks.property} "
+    return index_element
+table_index.set_parse_action(table_index_xml)
+
+table = (LPAR
+            + "table"
+            + Optional(property_notag("name"))
+            + table_index[1,2]("index")
+            + (table_data("data") | QuotedString('"')("file"))
+            + RPAR)
+def table_xml(str, loc, toks):
+    table_element = ET.Element("table")
+    if toks.file:
+        import table_files
+        try:
+            data = table_files.table_data_element(toks.file, len(toks.index), current_context())
+        except (OSError, ValueError) as e:
+            raise ParseFatalException(str, loc, f"{e}")
+    else:
+        data = toks.data
+    if getattr(toks, "name"):
+        context = current_context()
+        if toks.name in context.property_defined:
+            raise ParseFatalException(str, loc, toks.name + " already defined")
+        context.property_defined.add(toks.name)
+        context.property_set.add(toks.name)
+        table_element.set("name", toks.name)
+    for index_element in toks.index:
+        table_element.append(index_element)
+    table_element.append(data)
+    return table_element
+table.set_parse_action(table_xml)
+
+
+string = comment | table | value | property
+
+def handle_operation(toks: ParseResults) -> ET.Element:
+    op_name = toks[0]
+    e = ET.Element(op_name)
+    # Add all children to the operation element
+    for child in toks[1:]:
+        if isinstance(child, ET.Element):
+            e.append(child)
+    return e
+
+op = one_of(OPS.keys()).set_parse_action(lambda toks: OPS[toks[0]])
+
+sexp = Forward()
+def sexpList_xml(toks: ParseResults) -> ET.Element:
+    op_element = handle_operation(toks)
+    return op_element
+sexpList = (LPAR + op + sexp[...] + RPAR).set_parse_action(sexpList_xml)
+sexp <<= string | sexpList
+
+docstring = dbl_quoted_string.set_parse_action(removeQuotes)
+
+def function_xml(str, loc, toks: ParseResults) -> ET.Element:
+    fn_element = ET.Element("function")
+    context = current_context()
+    if toks.name in context.property_defined:
+        raise ParseFatalException(str, loc, toks.name + " already defined")
+    context.property_defined.add(toks.name)
+    context.property_set.add(toks.name)
+    fn_element.set('name', toks.name)
+    
+    if getattr(toks, "docstring"):
+        # Add docstring as comment
+        description_element = ET.Element("description")
+        description_element.text = toks.docstring
+        fn_element.append(description_element)
+        
+    for child in toks.body:
+        if isinstance(child, ET.Element):
+            fn_element.append(child)
+    
+    return fn_element
+
+function = (LPAR 
+           + "def" 
+           + Optional(docstring("docstring")) 
+           + property_notag("name") 
+           + sexp[1,...]("body") 
+           + RPAR).set_parse_action(function_xml)
+
+axis_title = one_of(AXIS_TITLES)
+
+def axis_xml(toks: ParseResults) -> ET.Element:
+    axis_element = ET.Element("axis")
+    axis_element.set('name', toks.name)
+    axis_element.set('frame', "BODY")
+    
+    for child in toks.body:
+        if isinstance(child, ET.Element):
+            axis_element.append(child)
+            
+    return axis_element
+
+axis = (LPAR 
+        + "axis" 
+        + axis_title("name") 
+        + (function | comment)[...]("body") 
+        + RPAR).set_parse_action(axis_xml)
+
+spec = (function | axis | comment)[...]
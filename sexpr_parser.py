@@ -0,0 +1,397 @@
+# Hand-written tokenizer and recursive-descent parser for the sexpr language
+# Produces the same XML elements as the pyparsing grammar in sexpr_grammar.py,
+# without building a grammar or allocating parse results per token.
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+OPS = {
+    '+': 'sum',
+    '-': 'difference',
+    '*': 'product',
+    '/': 'quotient',
+    'pow': 'pow',
+    'exp': 'exp',
+    'abs': 'abs',
+    'sin': 'sin',
+    'cos': 'cos',
+    'tan': 'tan',
+    'asin': 'asin',
+    'acos': 'acos',
+    'atan': 'atan',
+    'atan2': 'atan2',
+    'min': 'min',
+    'max': 'max',
+    'avg': 'avg',
+    'fraction': 'fraction',
+    'mod': 'mod',
+    'random': 'random',
+    'integer': 'integer'
+}
+
+AXIS_TITLES = ["X", "Y", "Z", "AXIAL", "NORMAL", "SIDE", "LIFT", "DRAG", "ROLL", "PITCH", "YAW"]
+
+WHITESPACE = re.compile(r"[ \t\r\n]*")
+SCI_REAL = re.compile(r"[+-]?(?:\d+(?:[eE][+-]?\d+)|(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?)")
+INTEGER = re.compile(r"\d+")
+PROPERTY = re.compile(r"[A-Za-z0-9/\[\]\-_]+")
+DOCSTRING = re.compile(r'"(?:[^"\n\r\\]|(?:"")|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*"')
+REST_OF_LINE = re.compile(r".*")
+TABLE_FILE = re.compile(r'"[^"\n\r]*"')
+
+def one_of(words) -> re.Pattern:
+    "Longest alternatives first, as pyparsing's one_of does."
+    return re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+OP = one_of(OPS)
+AXIS_TITLE = one_of(AXIS_TITLES)
+INDEX = re.compile("row|column")
+
+class SexprError(Exception):
+    def __init__(self, msg: str, text: str = "", loc: int = 0):
+        self.msg = msg
+        self.loc = loc
+        self.line = text.count("\n", 0, loc) + 1
+        self.col = loc - (text.rfind("\n", 0, loc) + 1) + 1
+        super().__init__(f"{msg} (line {self.line}, col {self.col})")
+
+    def __reduce__(self):
+        # picklable without the source text, for worker processes
+        return self.__class__, (self.msg,), self.__dict__
+
+class DefinitionError(SexprError):
+    "An invalid definition, e.g. a property defined twice. Fatal even when parse_all is off."
+
+class CompileContext:
+    "Properties read and defined while compiling one model."
+    def __init__(self, directory: str = ""):
+        self.property_set = set()
+        self.property_defined = set()
+        # external table files are found relative to the source file; their
+        # stat signatures, by absolute path, tell caches when they change
+        self.directory = directory
+        self.table_files = {}
+
+    @property
+    def undefined(self) -> set:
+        return self.property_set - self.property_defined
+
+# The pyparsing parse actions record properties in the context of the compile
+# running in the current thread, so compiles are independent of each other.
+_context: ContextVar[CompileContext | None] = ContextVar("compile_context", default=None)
+
+def current_context() -> CompileContext:
+    context = _context.get()
+    if context is None:
+        # the grammar used directly, outside compiling()
+        context = CompileContext()
+        _context.set(context)
+    return context
+
+@contextmanager
+def compiling(context: CompileContext | None = None):
+    "Run the parse actions inside with a fresh (or the given) context."
+    context = context if context is not None else CompileContext()
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+
+class Parser:
+    """Recursive-descent parser over one source text.
+
+    Properties read and defined are recorded in `context`, as the pyparsing
+    parse actions do."""
+    def __init__(self, text: str, context: CompileContext | None = None):
+        self.text = text
+        self.pos = 0
+        self.tokens = 0
+        self.context = context if context is not None else CompileContext()
+        self.property_set = self.context.property_set
+        self.property_defined = self.context.property_defined
+
+    # Scanning
+
+    def skip(self):
+        self.pos = WHITESPACE.match(self.text, self.pos).end()
+
+    def peek(self) -> str:
+        self.skip()
+        return self.text[self.pos:self.pos + 1]
+
+    def match(self, regex) -> str | None:
+        self.skip()
+        m = regex.match(self.text, self.pos)
+        if m is None:
+            return None
+        self.pos = m.end()
+        self.tokens += 1
+        return m.group()
+
+    def expect(self, regex, what: str) -> str:
+        token = self.match(regex)
+        if token is None:
+            raise self.error(f"Expected {what}")
+        return token
+
+    def literal(self, s: str) -> bool:
+        self.skip()
+        if self.text.startswith(s, self.pos):
+            self.pos += len(s)
+            self.tokens += 1
+            return True
+        return False
+
+    def keyword_after_lpar(self, word: str) -> bool:
+        "True (consuming both) if the next tokens are '(' and `word`."
+        start = self.pos
+        if self.literal("(") and self.literal(word):
+            return True
+        self.pos = start
+        return False
+
+    def error(self, msg: str, loc: int | None = None) -> SexprError:
+        return SexprError(msg, self.text, self.pos if loc is None else loc)
+
+    # Grammar
+
+    def parse(self, parse_all: bool = True) -> list:
+        return list(self.iter_forms(parse_all))
+
+    def iter_forms(self, parse_all: bool = True):
+        "Yield top-level elements as they are parsed."
+        while True:
+            start = self.pos
+            if self.peek() == "":
+                return
+            try:
+                yield self.form()
+            except DefinitionError:
+                raise
+            except SexprError:
+                if parse_all:
+                    raise
+                self.pos = start
+                return
+
+    def form(self) -> ET.Element:
+        if self.peek() == ";":
+            return self.comment()
+        start = self.pos
+        if self.keyword_after_lpar("axis"):
+            return self.axis(start)
+        if self.keyword_after_lpar("def"):
+            return self.function(start)
+        raise self.error("Expected function, axis or comment")
+
+    def comment(self) -> ET.Element:
+        self.pos += 1
+        line = REST_OF_LINE.match(self.text, self.pos)
+        self.pos = line.end()
+        self.tokens += 1
+        return ET.Comment(line.group().strip())
+
+    def define(self, name: str, loc: int):
+        if name in self.property_defined:
+            raise DefinitionError(name + " already defined", self.text, loc)
+        self.property_defined.add(name)
+        self.property_set.add(name)
+
+    def function(self, start: int) -> ET.Element:
+        docstring = self.match(DOCSTRING)
+        name = self.expect(PROPERTY, "property name")
+        body = [self.sexp()]
+        while self.peek() != ")":
+            body.append(self.sexp())
+        self.expect_rpar()
+        self.define(name, start)
+        fn_element = ET.Element("function")
+        fn_element.set('name', name)
+        if docstring is not None:
+            description_element = ET.Element("description")
+            description_element.text = docstring[1:-1]
+            fn_element.append(description_element)
+        fn_element.extend(body)
+        return fn_element
+
+    def axis(self, start: int) -> ET.Element:
+        name = self.expect(AXIS_TITLE, "axis name")
+        axis_element = ET.Element("axis")
+        axis_element.set('name', name)
+        axis_element.set('frame', "BODY")
+        while True:
+            if self.peek() == ";":
+                axis_element.append(self.comment())
+                continue
+            fn_start = self.pos
+            if not self.keyword_after_lpar("def"):
+                break
+            axis_element.append(self.function(fn_start))
+        self.expect_rpar()
+        return axis_element
+
+    def expect_rpar(self):
+        if not self.literal(")"):
+            raise self.error("Expected ')'")
+
+    def sexp(self) -> ET.Element:
+        c = self.peek()
+        if c == ";":
+            return self.comment()
+        if c == "(":
+            start = self.pos
+            if self.keyword_after_lpar("table"):
+                return self.table(start)
+            self.literal("(")
+            op = self.expect(OP, "operation")
+            e = ET.Element(OPS[op])
+            while self.peek() not in (")", ""):
+                e.append(self.sexp())
+            self.expect_rpar()
+            return e
+        token = self.match(SCI_REAL)
+        if token is not None:
+            return self.value(float(token))
+        token = self.match(INTEGER)
+        if token is not None:
+            return self.value(int(token))
+        name = self.expect(PROPERTY, "value, property or expression")
+        self.property_set.add(name)
+        property_element = ET.Element("property")
+        property_element.text = f" {name} "
+        return property_element
+
+    def value(self, number) -> ET.Element:
+        value_element = ET.Element("value")
+        value_element.text = f" {number} "
+        return value_element
+
+    def table(self, start: int) -> ET.Element:
+        name = None
+        if self.peek() != "(":
+            name = self.expect(PROPERTY, "table name or index")
+        indices = [self.table_index()]
+        self.skip()
+        if self.peek() == "(":
+            indices.append(self.table_index())
+        data = self.table_data(len(indices))
+        self.expect_rpar()
+        table_element = ET.Element("table")
+        if name:
+            self.define(name, start)
+            table_element.set("name", name)
+        table_element.extend(indices)
+        table_element.append(data)
+        return table_element
+
+    def table_index(self) -> ET.Element:
+        if not self.literal("("):
+            raise self.error("Expected table index")
+        index = self.expect(INDEX, "row or column")
+        prop = self.expect(PROPERTY, "property")
+        self.expect_rpar()
+        self.property_set.add(prop)
+        index_element = ET.Element("independentVar")
+        index_element.set("lookup", index)
+        index_element.text = f" {prop} "
+        return index_element
+
+    def table_entry(self):
+        token = self.match(SCI_REAL)
+        if token is not None:
+            return float(token)
+        token = self.match(INTEGER)
+        if token is not None:
+            return int(token)
+        if self.literal('""'):
+            return '""'
+        return None
+
+    def table_data(self, indices: int) -> ET.Element:
+        if self.peek() == '"':
+            start = self.pos
+            path = self.expect(TABLE_FILE, "table file")[1:-1]
+            try:
+                import table_files
+                return table_files.table_data_element(path, indices, self.context)
+            except (OSError, ValueError) as e:
+                raise DefinitionError(str(e), self.text, start) from None
+        if not self.literal("["):
+            raise self.error("Expected table data or file")
+        first = []
+        entry = self.table_entry()
+        while entry is not None:
+            first.append(entry)
+            entry = self.table_entry()
+        if not first or not self.literal(","):
+            raise self.error("Expected first table row")
+        rows = [first]
+        while True:
+            start = self.pos
+            row = []
+            entry = self.table_entry()
+            while entry is not None:
+                row.append(entry)
+                entry = self.table_entry()
+            if not row:
+                break
+            if len(row) != len(first):
+                raise DefinitionError(f"table row has {len(row)} entries, expected {len(first)}",
+                                      self.text, start)
+            self.literal(",")
+            rows.append(row)
+        if not self.literal("]"):
+            raise self.error("Expected ']'")
+        return table_data_element(rows)
+
+# cells of a table padded at a time, so that its padded copy is never held whole
+TABLE_BLOCK_CELLS = 1 << 16
+
+def block_rows(columns: int) -> int:
+    "Rows of a table of `columns` columns laid out at a time."
+    return max(1, TABLE_BLOCK_CELLS // columns)
+
+def format_block(columns: list[list[str]], widths: list[int]) -> str:
+    """Rows of cells, given by column, left-aligned to widths (one per column
+    but the last, which is not padded) and two spaces apart."""
+    padded = [[cell.ljust(width) for cell in column] for column, width in zip(columns, widths)]
+    return "\n".join(map("  ".join, zip(*padded, columns[-1])))
+
+def format_columns(columns: list[list[str]]) -> str:
+    """Table cells, given by column, as rows of left-aligned columns two spaces apart.
+
+    The layout of tabulate's "plain" format, built with joins over blocks of
+    rows, so that tables of millions of cells take a second or so."""
+    widths = [max(map(len, column)) for column in columns[:-1]]
+    step = block_rows(len(columns))
+    return "\n".join(format_block([column[i:i + step] for column in columns], widths)
+                     for i in range(0, len(columns[0]), step))
+
+def table_data_element(rows: list) -> ET.Element:
+    "A <tableData> of rows of numbers, the first row starting with '\"\"' (or None) for 2D tables."
+    table_data_element = ET.Element("tableData")
+    columns = [["" if cell is None or cell == '""' else str(cell) for cell in column]
+               for column in zip(*rows)]
+    table_data_element.text = f" \n{format_columns(columns)}\n "
+    return table_data_element
+
+def parse_string(text: str, context: CompileContext | None = None, parse_all: bool = True) -> list:
+    return Parser(text, context).parse(parse_all)
+
+def parse_expression(text: str, context: CompileContext | None = None) -> ET.Element:
+    "A single expression, e.g. a function body."
+    parser = Parser(text, context)
+    element = parser.sexp()
+    if parser.peek() != "":
+        raise parser.error("Expected end of text")
+    return element
+
+def parse_file(file: str, context: CompileContext | None = None, parse_all: bool = True) -> list:
+    context = context if context is not None else CompileContext()
+    context.directory = os.path.dirname(file)
+    with open(file) as f:
+        return parse_string(f.read(), context, parse_all)
@@ -0,0 +1,150 @@
+# Snapshots of a JSBSim executive, to branch many runs from one trimmed state
+# A snapshot holds the vehicle state (through the matching ic/* properties, as
+# trim_cache does), every writable property that is an input rather than a
+# computed output (controls, FCS, atmosphere, mass, engine settings), the
+# propeller speed and the simulation time.
+#
+# Restoring writes the properties through nodes looked up once per executive,
+# then runs the initial condition, which also restarts the integrators from
+# the restored derivatives: tens of microseconds. JSBSim has no setter for the
+# propeller speed, so when it has drifted from the snapshot the engines are
+# brought back to steady state as well, which takes a few hundred.
+#
+# Snapshots are plain data: they pickle, so they can be restored into other
+# executives with the same model, in this process or in workers (fork).
+
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+import jsbsim
+
+from fdm_utils import load_fdm, staged_aircraft
+from trim_cache import STATE
+
+# writable properties that are outputs of the models, commands that trigger
+# actions, or set through the initial condition
+EXCLUDED = [
+    "ic/*",
+    "position/*",
+    "orbital/*",
+    "gear/*",
+    "contact/*",
+    "simulation/*",
+    "atmosphere/dew-point-R",
+    "atmosphere/vapor-pressure-psf",
+    "atmosphere/RH",
+    "atmosphere/vapor-fraction-ppm",
+    "atmosphere/wind-mag-fps",
+    "atmosphere/psiw-rad",
+    "atmosphere/turb-north-fps",
+    "atmosphere/turb-east-fps",
+    "atmosphere/turb-down-fps",
+    "atmosphere/randomseed",
+    "propulsion/set-running",
+    "propulsion/refuel",
+    "propulsion/fuel_dump",
+    "propulsion/engine*/set-running",
+    "propulsion/engine*/advance-ratio",
+    "propulsion/engine*/prop-induced-velocity_fps",
+    "propulsion/engine*/propeller-power-ftlbps",
+    "propulsion/engine*/power-hp",
+]
+
+RPM = "propulsion/engine/propeller-rpm"
+# relative drift of the propeller speed above which restore re-solves the engines
+RPM_TOLERANCE = 1e-9
+
+def input_properties(fdm: jsbsim.FGFDMExec) -> List[str]:
+    "Writable properties of fdm restored by snapshots."
+    names = []
+    for entry in fdm.get_property_catalog():
+        name, _, access = entry.partition(" ")
+        if access == "(RW)" and not any(fnmatch.fnmatchcase(name, p) for p in EXCLUDED):
+            names.append(name)
+    return names
+
+class Snapshot:
+    "The state of an executive, restorable into it or any executive with the same model."
+    def __init__(self, state: Dict[str, float], properties: Dict[str, float],
+                 rpm: float | None, sim_time: float):
+        self.state = state
+        self.properties = properties
+        self.rpm = rpm
+        self.sim_time = sim_time
+
+    @classmethod
+    def capture(cls, fdm: jsbsim.FGFDMExec) -> "Snapshot":
+        pm = fdm.get_property_manager()
+        state = {ic: fdm[p] for ic, p in STATE.items()}
+        properties = {name: fdm[name] for name in input_properties(fdm)}
+        rpm = fdm[RPM] if pm.hasNode(RPM) else None
+        return cls(state, properties, rpm, fdm.get_sim_time())
+
+    def restorer(self, fdm: jsbsim.FGFDMExec) -> Callable[[], None]:
+        """A function restoring this snapshot into fdm, with the property nodes bound.
+
+        Use it to restore the same snapshot many times. restore(initialize=False)
+        only writes the properties, for a caller that changes some of them
+        and runs the initial condition itself."""
+        pm = fdm.get_property_manager()
+        nodes = []
+        for name, value in {**self.properties, **self.state}.items():
+            node = pm.get_node(name, False)
+            if node is None:
+                raise KeyError(f"no property {name!r}: not the model the snapshot was taken of")
+            nodes.append((node, value))
+        rpm = pm.get_node(RPM, False) if self.rpm is not None else None
+        running = pm.get_node("propulsion/set-running", False)
+
+        def restore(initialize: bool = True):
+            for node, value in nodes:
+                node.set_double_value(value)
+            if not initialize:
+                return
+            fdm.set_sim_time(self.sim_time)
+            fdm.run_ic()
+            if rpm is not None and abs(rpm.get_double_value() - self.rpm) > RPM_TOLERANCE * abs(self.rpm):
+                # as trim_cache.restore: the steady state about the initial condition
+                running.set_double_value(-1)
+                fdm.run()
+                fdm.run_ic()
+                fdm.get_propulsion().get_steady_state()
+                fdm.set_sim_time(self.sim_time)
+                fdm.run_ic()
+        return restore
+
+    def restore(self, fdm: jsbsim.FGFDMExec):
+        self.restorer(fdm)()
+
+    def clone(self, root: str | None = None, aero: str | None = None) -> jsbsim.FGFDMExec:
+        """A new executive in this state; root and aero as for fdm_utils.load_fdm.
+
+        Without a root, the model is loaded from one staged for the load only."""
+        fdm = load_fdm(root, aero)
+        self.restore(fdm)
+        return fdm
+
+# Worker state: a loaded executive and the bound restore of the snapshot
+_worker = {}
+
+def _init_worker(snapshot: Snapshot, root: str):
+    fdm = load_fdm(root)
+    _worker["fdm"] = fdm
+    _worker["restore"] = snapshot.restorer(fdm)
+
+def _branch(function: Callable, item):
+    _worker["restore"]()
+    return function(_worker["fdm"], item)
+
+def fork(snapshot: Snapshot, function: Callable, items: List, aero: str | None = None,
+         workers: int | None = None) -> List:
+    """function(fdm, item) for every item, each from the snapshot, in worker processes.
+
+    Every worker loads the model once (with the aerodynamics XML text `aero`
+    if given) and restores the snapshot before each item. function must be
+    picklable, i.e. defined at module level."""
+    # one root for all workers, removed by this process: workers skip atexit handlers
+    with staged_aircraft(aero) as root, \
+         ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(snapshot, root)) as executor:
+        return list(executor.map(_branch, [function] * len(items), items))
@@ -0,0 +1,152 @@
+# External data files for (table ...) forms
+# A table may give a file in place of its inline data:
+#
+#   (table aero/table/CL_alpha_mach (row aero/alpha-rad) (column velocities/mach) "tables/CL.npy")
+#
+# The file holds the table as it is written inline. With one index it has
+# rows of breakpoint and value. With two, the first row holds the column
+# breakpoints after an unused corner cell, and each further row a row
+# breakpoint and its values. Breakpoints must increase.
+#
+# .npy files are memory-mapped and formatted a block of rows at a time, so
+# only the table's text (part of the compiled element) is held whole; their
+# corner cell may hold anything (NaN, say). CSV files (comma separated, lines
+# starting with # skipped) are read line by line into cells, with an empty
+# corner cell. Paths are relative to the source file.
+
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from sexpr_parser import SCI_REAL, CompileContext, block_rows, format_block, format_columns
+
+SIGNED_INTEGER = re.compile(r"[+-]?\d+")
+
+def _check_breakpoints(path: str, what: str, breakpoints: list):
+    for previous, value in zip(breakpoints, breakpoints[1:]):
+        if not previous < value:
+            raise ValueError(f"{path}: {what} breakpoints do not increase ({previous}, {value})")
+
+def _check_shape(path: str, indices: int, rows: int, columns: int):
+    if indices == 1 and columns != 2:
+        raise ValueError(f"{path}: a table with one index needs 2 columns, not {columns}")
+    if rows < 2 or columns < 2:
+        raise ValueError(f"{path}: {rows} x {columns} is too small for a table")
+
+def _npy_block(array, start: int, stop: int, indices: int) -> list[list[str]]:
+    "The cells of rows start to stop of a .npy table, by column, formatted as inline table numbers."
+    block = array[start:stop]
+    if array.dtype.itemsize < 8 and array.dtype.kind == "f":
+        # the shortest text of the single precision value, not of its double
+        columns = [column.astype(str).tolist() for column in block.T]
+    else:
+        columns = [list(map(str, column)) for column in block.T.tolist()]
+    if indices == 2 and start == 0:
+        columns[0][0] = ""
+    return columns
+
+def npy_text(path: str, indices: int) -> str:
+    """The data of a .npy table laid out as format_columns does.
+
+    The memory-mapped array is formatted a block of rows at a time, the cells
+    kept a string per column until the column widths are known."""
+    import numpy as np
+    array = np.load(path, mmap_mode="r", allow_pickle=False)
+    if array.ndim != 2 or array.dtype.kind not in "iuf":
+        raise ValueError(f"{path}: expected a 2D array of numbers, not {array.ndim}D {array.dtype}")
+    _check_shape(path, indices, *array.shape)
+    if indices == 1:
+        values, breakpoints = array, [array[:, 0]]
+    else:
+        values, breakpoints = array[1:], [array[1:, 0], array[0, 1:]]
+    if array.dtype.kind == "f" and not (np.isfinite(values).all() and np.isfinite(array[0, 1:]).all()):
+        raise ValueError(f"{path}: table holds NaN or infinite values")
+    for what, b in zip(["row", "column"], breakpoints):
+        if not (np.diff(b) > 0).all():
+            raise ValueError(f"{path}: {what} breakpoints do not increase")
+    rows, columns = array.shape
+    step = block_rows(columns)
+    widths = [0] * (columns - 1)
+    # the cells of each block, a string per column, until the widths are known
+    blocks = []
+    for start in range(0, rows, step):
+        block = _npy_block(array, start, start + step, indices)
+        widths = [max(width, max(map(len, column))) for width, column in zip(widths, block)]
+        blocks.append(["\n".join(column) for column in block])
+    text = []
+    while blocks:
+        text.append(format_block([column.split("\n") for column in blocks.pop(0)], widths))
+    return "\n".join(text)
+
+def _csv_cell(path: str, line: int, cell: str) -> str:
+    if SCI_REAL.fullmatch(cell):
+        return str(float(cell))
+    if SIGNED_INTEGER.fullmatch(cell):
+        return str(int(cell))
+    raise ValueError(f"{path}:{line}: expected a number, not {cell!r}")
+
+def csv_columns(path: str, indices: int) -> list[list[str]]:
+    "The cells of a CSV table, by column, formatted as inline table numbers."
+    rows = []
+    with open(path) as f:
+        for line, text in enumerate(f, 1):
+            text = text.strip()
+            if not text or text.startswith("#"):
+                continue
+            cells = [cell.strip() for cell in text.split(",")]
+            if rows and len(cells) != len(rows[0]):
+                raise ValueError(f"{path}:{line}: table row has {len(cells)} entries, expected {len(rows[0])}")
+            if not rows and indices == 2 and cells[0] == "":
+                rows.append([""] + [_csv_cell(path, line, cell) for cell in cells[1:]])
+            else:
+                rows.append([_csv_cell(path, line, cell) for cell in cells])
+    _check_shape(path, indices, len(rows), len(rows[0]) if rows else 0)
+    columns = [list(column) for column in zip(*rows)]
+    if indices == 1:
+        _check_breakpoints(path, "row", [float(cell) for cell in columns[0]])
+    else:
+        columns[0][0] = ""
+        _check_breakpoints(path, "row", [float(cell) for cell in columns[0][1:]])
+        _check_breakpoints(path, "column", [float(column[0]) for column in columns[1:]])
+    return columns
+
+def table_data_element(path: str, indices: int, context: CompileContext) -> ET.Element:
+    """The <tableData> of a table file, for a table with `indices` independent variables.
+
+    Raises ValueError for a file that is not a valid table, OSError when it
+    cannot be read."""
+    file = os.path.join(context.directory, path)
+    st = os.stat(file)
+    context.table_files[os.path.abspath(file)] = [st.st_mtime_ns, st.st_size]
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        text = npy_text(file, indices)
+    elif extension == ".csv":
+        text = format_columns(csv_columns(file, indices))
+    else:
+        raise ValueError(f"{path}: table files are .npy or .csv")
+    element = ET.Element("tableData")
+    element.text = f" \n{text}\n "
+    return element
+
+def table_sizes(root: ET.Element) -> list[dict]:
+    "The tables of a compiled <aerodynamics> element with their breakpoints and text size, largest first."
+    # each table belongs to the innermost function it is in, wherever in its body
+    functions = {}
+    for function in root.iter("function"):
+        for table in function.iter("table"):
+            functions[table] = function
+    sizes = []
+    for table, function in functions.items():
+        data = table.find("tableData")
+        lines = data.text.strip("\n ").split("\n")
+        indices = len(table.findall("independentVar"))
+        shape = (len(lines),) if indices == 1 else (len(lines) - 1, len(lines[0].split()))
+        sizes.append({
+            "function": function.get("name"),
+            "table": table.get("name", ""),
+            "breakpoints": shape,
+            "bytes": len(data.text.encode()),
+        })
+    sizes.sort(key=lambda size: size["bytes"], reverse=True)
+    return sizes
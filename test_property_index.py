@@ -0,0 +1,29 @@
+# Tests of the property index scanner: python3 -m pytest test_property_index.py
+
+from property_index import PropertyIndex, scan_form
+
+def test_unnamed_table():
+    form = "(def aero/y (* 2 (table (row aero/alpha-rad) [0 1, 1 2])))"
+    assert scan_form(form) == {"defs": [["aero/y", 1]], "reads": {"aero/y": [["aero/alpha-rad", 1]]}}
+
+def test_unnamed_table_with_data_first():
+    form = "(def aero/y (table [0 1, 1 2]))"
+    assert scan_form(form) == {"defs": [["aero/y", 1]], "reads": {}}
+
+def test_named_table():
+    form = "(def aero/y\n  (* 2 (table aero/t (row aero/alpha-rad) [0 1, 1 2])))"
+    assert scan_form(form) == {
+        "defs": [["aero/y", 1], ["aero/t", 2]],
+        "reads": {"aero/y": [["aero/t", 2]], "aero/t": [["aero/alpha-rad", 2]]},
+    }
+
+def test_index_of_unnamed_table(tmp_path):
+    model = tmp_path / "model.sexpr"
+    model.write_text("(def aero/x (table (row aero/alpha-rad) [0 1, 1 2]))\n"
+                     "(def aero/y (* 2 aero/x))\n")
+    index = PropertyIndex([str(model)], directory=str(tmp_path / "cache"))
+    assert sorted(index.definitions) == ["aero/x", "aero/y"]
+    assert index.feeds("aero/y") == {"aero/x": 1, "aero/alpha-rad": 2}
+    assert index.impact("aero/alpha-rad") == {"aero/x": 1, "aero/y": 2}
+    assert index.undefined() == ["aero/alpha-rad"]
+    assert index.duplicates() == []
@@ -0,0 +1,171 @@
+# Persistent cache of trimmed states
+# A trim is keyed by a hash of every file of the loaded aircraft and of the
+# trim request: the ic/* properties, the control commands and the trim mode.
+# On a hit the trimmed state is restored through ic/* and the control commands
+# instead of running the trim; if the restored state is not in equilibrium
+# (e.g. a different JSBSim build), the trim is run warm-started from it.
+#
+# Entries are JSON files in one directory, evicted least recently used first.
+
+import hashlib
+import json
+import os
+import tempfile
+
+import jsbsim
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".trim_cache")
+MAX_ENTRIES = 1000
+
+# trimmed state, restored through the matching initial condition
+STATE = {
+    "ic/h-sl-ft": "position/h-sl-ft",
+    "ic/lat-geod-rad": "position/lat-geod-rad",
+    "ic/long-gc-rad": "position/long-gc-rad",
+    "ic/u-fps": "velocities/u-fps",
+    "ic/v-fps": "velocities/v-fps",
+    "ic/w-fps": "velocities/w-fps",
+    "ic/p-rad_sec": "velocities/p-rad_sec",
+    "ic/q-rad_sec": "velocities/q-rad_sec",
+    "ic/r-rad_sec": "velocities/r-rad_sec",
+    "ic/phi-rad": "attitude/phi-rad",
+    "ic/theta-rad": "attitude/theta-rad",
+    "ic/psi-true-rad": "attitude/psi-rad",
+}
+
+ACCELERATIONS = [
+    "accelerations/udot-ft_sec2",
+    "accelerations/vdot-ft_sec2",
+    "accelerations/wdot-ft_sec2",
+    "accelerations/pdot-rad_sec2",
+    "accelerations/qdot-rad_sec2",
+    "accelerations/rdot-rad_sec2",
+]
+
+def _properties(fdm: jsbsim.FGFDMExec) -> list:
+    return [p.split(" ")[0] for p in fdm.get_property_catalog()]
+
+def control_properties(fdm: jsbsim.FGFDMExec) -> list:
+    "Pilot commands: the trim's controls and anything else it holds fixed."
+    return [p for p in _properties(fdm) if p.startswith("fcs/") and "-cmd-norm" in p]
+
+def model_hash(fdm: jsbsim.FGFDMExec) -> str:
+    "Hash of the JSBSim version and every file in the aircraft, engine and systems directories."
+    h = hashlib.sha256(fdm.get_version().encode())
+    directories = {fdm.get_full_aircraft_path(), fdm.get_engine_path(), fdm.get_systems_path()}
+    for directory in sorted(str(d) for d in directories):
+        for dirpath, dirnames, filenames in os.walk(directory, followlinks=True):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                h.update(os.path.relpath(path, directory).encode())
+                with open(path, "rb") as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def trim_key(fdm: jsbsim.FGFDMExec, mode: int) -> str:
+    request = {p: fdm[p] for p in _properties(fdm) if p.startswith("ic/")}
+    request.update({p: fdm[p] for p in control_properties(fdm)})
+    request["mode"] = mode
+    h = hashlib.sha256(model_hash(fdm).encode())
+    h.update(json.dumps(request, sort_keys=True).encode())
+    return h.hexdigest()
+
+def residual(fdm: jsbsim.FGFDMExec) -> float:
+    return max(abs(fdm[a]) for a in ACCELERATIONS)
+
+def capture(fdm: jsbsim.FGFDMExec) -> dict:
+    "The trimmed state of fdm."
+    return {
+        "state": {ic: fdm[p] for ic, p in STATE.items()},
+        "controls": {p: fdm[p] for p in control_properties(fdm)},
+        "residual": residual(fdm),
+    }
+
+def restore(fdm: jsbsim.FGFDMExec, entry: dict):
+    "Put fdm in a captured trimmed state."
+    for name, value in {**entry["state"], **entry["controls"]}.items():
+        fdm[name] = value
+    fdm["propulsion/set-running"] = -1
+    fdm.run_ic()
+    # one frame carries the throttle through the FCS to the engines, whose
+    # steady state is then found about the initial condition, as the trim does
+    fdm.run()
+    fdm.run_ic()
+    fdm.get_propulsion().get_steady_state()
+    fdm.run_ic()
+
+class TrimCache:
+    "On-disk cache of trimmed states, least recently used entries evicted first."
+    def __init__(self, directory: str = CACHE_DIR, max_entries: int = MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> dict | None:
+        try:
+            with open(self.path(key)) as f:
+                entry = json.load(f)
+            # mark as recently used
+            os.utime(self.path(key))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: dict):
+        # written under a temporary name, so concurrent workers never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.directory, name)), name))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        for _, name in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+    def do_trim(self, fdm: jsbsim.FGFDMExec, mode: int = 1):
+        """Drop-in for fdm.do_trim(mode), set up the same way.
+
+        Failed trims are cached too, and raise jsbsim.TrimFailureError again."""
+        key = trim_key(fdm, mode)
+        entry = self.get(key)
+        if entry is not None:
+            if entry.get("failed"):
+                self.hits += 1
+                raise jsbsim.TrimFailureError("Trim Failed (cached)")
+            restore(fdm, entry)
+            if residual(fdm) <= max(2 * entry["residual"], 1e-6):
+                self.hits += 1
+                return
+        self.misses += 1
+        # warm-started from the restored state if the entry did not hold
+        try:
+            fdm.do_trim(mode)
+        except jsbsim.TrimFailureError:
+            self.put(key, {"failed": True})
+            raise
+        self.put(key, capture(fdm))
@@ -0,0 +1,107 @@
+# Streaming writer for <aerodynamics> documents
+# Writes each top-level function, axis or comment as soon as it is compiled,
+# instead of indenting and serializing one tree holding the whole model, so
+# output starts with the first definition and memory does not grow with the
+# size of the model.
+#
+# Pretty output is byte for byte what compile_sexpr.to_string and
+# compile_python_to_jsbsim.print_xml give for the same elements, followed by a
+# newline as the compile commands print it. Compact output has no whitespace
+# between tags; JSBSim reads both alike.
+
+import os
+import sys
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from typing import Iterable, TextIO
+
+# elements serialized together: ElementTree's per call overhead is larger
+# than a small function's serialization
+BATCH = 64
+
+def _strip(element: ET.Element):
+    "Drop whitespace only text between tags, i.e. indentation."
+    for e in element.iter():
+        if len(e) and e.text is not None and not e.text.strip():
+            e.text = None
+        if e.tail is not None and not e.tail.strip():
+            e.tail = None
+
+class XMLWriter:
+    """Writes the children of an <aerodynamics> root to out, as they come.
+
+    Elements are serialized in batches of BATCH, as the children of a root
+    of their own. Used as a context manager, the document is closed when the
+    block exits normally; after an error it is left unfinished."""
+    def __init__(self, out: TextIO, pretty: bool = True):
+        self.out = out
+        self.pretty = pretty
+        self.count = 0
+        self.pending = []
+
+    def write(self, element: ET.Element):
+        self.pending.append(element)
+        if len(self.pending) >= BATCH:
+            self.flush()
+
+    def write_all(self, elements: Iterable[ET.Element]):
+        for element in elements:
+            self.write(element)
+
+    def write_fragment(self, text: str):
+        "An element already serialized for this mode, e.g. a form from the compile cache (pretty)."
+        self.flush()
+        self._write_body("\n  " + text if self.pretty else text)
+
+    def flush(self):
+        if not self.pending:
+            return
+        root = ET.Element("aerodynamics")
+        root.extend(self.pending)
+        if self.pretty:
+            ET.indent(root, space="  ")
+            # "<aerodynamics>\n  child\n  child\n</aerodynamics>"
+            body = ET.tostring(root, encoding="unicode")[len("<aerodynamics>"):-len("\n</aerodynamics>")]
+        else:
+            for element in self.pending:
+                _strip(element)
+            body = ET.tostring(root, encoding="unicode")[len("<aerodynamics>"):-len("</aerodynamics>")]
+        self.pending = []
+        self._write_body(body)
+
+    def _write_body(self, body: str):
+        if self.count == 0:
+            self.out.write("<aerodynamics>")
+        self.out.write(body)
+        self.count += 1
+
+    def close(self):
+        self.flush()
+        if self.count == 0:
+            self.out.write("<aerodynamics />\n")
+        else:
+            self.out.write("\n</aerodynamics>\n" if self.pretty else "</aerodynamics>\n")
+
+    def __enter__(self) -> "XMLWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+@contextmanager
+def output_file(path: str | None):
+    """A text stream to path, replacing it atomically when the block succeeds, or stdout for None.
+
+    The previous file stays in place if the compile fails."""
+    if path is None:
+        yield sys.stdout
+        return
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            yield f
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)